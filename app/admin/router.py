@@ -0,0 +1,119 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from starlette import status
+
+from app.dao.cache import cache_stats
+from app.dao.monitoring import command_monitor
+from app.deals.dao import DealsDAO
+from app.payroll.dao import PayrollSnapshotsDAO
+from app.responses import FastJSONResponse
+from app.tasks.tasks import calculate_payroll, rebuild_deal_stats_daily, recompute_deal_financials
+from app.users.dependencies import get_current_admin_user
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Администрирование"],
+    dependencies=[Depends(get_current_admin_user)]
+)
+
+
+def _require_monitor():
+    if command_monitor is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Мониторинг команд Mongo отключён (MONGO_COMMAND_MONITORING)"
+        )
+    return command_monitor
+
+
+@router.get("/mongo/slow-queries", summary="Самые медленные формы запросов к Mongo")
+async def get_slow_queries(
+        limit: int = Query(20, ge=1, le=500),
+        orderBy: Literal["totalMs", "avgMs", "maxMs", "count", "documents", "bytes"] = Query("totalMs")
+):
+    """
+    Статистика по формам запросов (коллекция, команда, фильтр без значений)
+    с момента старта текущего воркера: число вызовов, латентность,
+    гистограмма, число документов и байт в ответах.
+    """
+    return _require_monitor().top(limit=limit, order_by=orderBy)
+
+
+@router.delete("/mongo/slow-queries", status_code=status.HTTP_204_NO_CONTENT, summary="Сбросить статистику запросов")
+async def reset_slow_queries():
+    _require_monitor().reset()
+
+
+@router.get("/cache/stats", summary="Попадания и промахи кэша чтений")
+async def get_cache_stats():
+    """Счётчики кэша MongoDAO по коллекциям с момента старта текущего воркера."""
+    result = {}
+    for collection, stats in cache_stats.items():
+        hits = stats["l1Hits"] + stats["hits"]
+        reads = hits + stats["misses"]
+        result[collection] = {**stats, "hitRatio": round(hits / reads, 4) if reads else None}
+    return result
+
+
+@router.post("/deals/snapshots", summary="Проверить снимки связей в сделках")
+async def check_deal_snapshots(repair: bool = Query(False, description="Исправить найденные расхождения")):
+    """
+    Сверяет снимки {_id, name} в сделках с текущими названиями услуг, этапов,
+    материалов, компаний и менеджеров. Возвращает по каждой связи число
+    объектов с расхождениями и число исправленных сделок.
+    """
+    return await DealsDAO.check_snapshots(repair=repair)
+
+
+@router.post(
+    "/deals/financials",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Пересчитать финансовые показатели сделок"
+)
+async def start_deal_financials():
+    """
+    Ставит в очередь Celery пересчёт сумм, маржи, доли менеджера и НДС во всех
+    сделках по текущим данным и процентам менеджеров. Итог пишется в лог воркера.
+    """
+    task = recompute_deal_financials.delay()
+    return {"taskId": task.id}
+
+
+@router.post(
+    "/deals/stats-daily",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Пересобрать дневную сводку сделок"
+)
+async def start_deal_stats_daily():
+    """
+    Ставит в очередь Celery пересборку deal_stats_daily из всех сделок (после сбоев
+    или массовых правок в обход DealsDAO). Число строк пишется в лог воркера.
+    """
+    task = rebuild_deal_stats_daily.delay()
+    return {"taskId": task.id}
+
+
+PERIOD_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+
+@router.post("/payroll", status_code=status.HTTP_202_ACCEPTED, summary="Запустить расчёт зарплаты менеджеров")
+async def start_payroll(period: str = Query(..., regex=PERIOD_PATTERN, description="Месяц: YYYY-MM")):
+    """
+    Ставит в очередь Celery расчёт комиссий менеджеров по закрытым сделкам месяца.
+    Результат — снимок, доступный через GET /admin/payroll/{period}.
+    """
+    task = calculate_payroll.delay(period)
+    return {"taskId": task.id, "period": period}
+
+
+@router.get("/payroll/{period}", summary="Последний расчёт зарплаты за месяц")
+async def get_payroll(period: str = Path(..., regex=PERIOD_PATTERN, description="Месяц: YYYY-MM")):
+    """Снимок последнего расчёта: начисления по менеджерам и итоги."""
+    snapshots = await PayrollSnapshotsDAO.find_all({"period": period}, sort=[("createdAt", -1)], limit=1)
+    if not snapshots:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Расчёт за этот месяц не найден"
+        )
+    return FastJSONResponse(content=snapshots[0])
@@ -1,6 +1,12 @@
+from pymongo import IndexModel
+
 from app.dao.base import MongoDAO
 from app.database import database_mongo
 
 
 class AdressesDAO(MongoDAO):
     collection = database_mongo["adresses"]
+    indexes = [
+        IndexModel([("companyId", 1)], name="companyId"),
+        IndexModel([("coordinates", "2dsphere")], name="coordinates_2dsphere"),
+    ]
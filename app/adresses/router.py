@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, List
 
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
@@ -7,6 +7,7 @@ from starlette import status
 from app.adresses.dao import AdressesDAO
 from app.adresses.shemas import SAdresses, SAdressesAdd
 from app.logger import logger
+from app.projection import fields_param, fields_projection, sparse_response
 from app.users.dependencies import get_current_admin_user
 
 router = APIRouter(
@@ -22,9 +23,17 @@ async def get_material(id: str) -> SAdresses:
 
 
 @router.get("", response_model=list[SAdresses], summary="Получить список материалов")
-async def get_materials(data: SAdresses = Depends()) -> list[
-    SAdresses]:
-    result = await AdressesDAO.find_all(**data.model_dump(exclude_none=True))
+async def get_materials(
+        data: SAdresses = Depends(),
+        fields: Optional[List[str]] = Depends(fields_param(SAdresses))
+) -> list[SAdresses]:
+    result = await AdressesDAO.find_all(
+        **data.model_dump(exclude_none=True),
+        projection=fields_projection(fields)
+    )
+    if fields:
+        # Только запрошенные поля — без null-заглушек для остальных
+        return sparse_response(result, SAdresses, fields)
     return result
 
 
@@ -42,22 +51,8 @@ async def get_materials(data: SAdresses = Depends()) -> list[
 async def add_adress(data: SAdressesAdd):
     """
     Добавление нового материала.
-
-    Проверяет уникальность имени материала перед добавлением.
     """
     try:
-        # Проверка уникальности name без учёта регистра и с обрезкой пробелов
-        if not await AdressesDAO.is_unique(
-                field_name="name",
-                value=data.name,
-                case_sensitive=False,
-                trim_spaces=True
-        ):
-            raise HTTPException(
-                status_code=409,
-                detail="Материал с таким именем уже существует"
-            )
-
         # Создание материала
         material_data = data.model_dump(exclude_none=True)
         result = await AdressesDAO.add(document=material_data)
@@ -106,31 +101,8 @@ async def update_material(
     - Не учитывает регистр при проверке уникальности
     """
     try:
-        # Проверяем существование материала
-        existing_material = await AdressesDAO.find_one_or_none(_id=ObjectId(id))
-
-        if not existing_material:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Материал не найден"
-            )
-
         update_data = data.model_dump(exclude_none=True)
 
-        if "name" in update_data:
-            # Проверка на уникальность
-            if not await AdressesDAO.is_unique(
-                    field_name="name",
-                    value=data.name,
-                    exclude_id=id,
-                    case_sensitive=False,
-                    trim_spaces=True
-            ):
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Материал с таким именем уже существует"
-                )
-
         # Фоновое логирование изменения
         background_tasks.add_task(
             logger.info,
@@ -150,10 +122,11 @@ async def update_material(
             update_data=update_data
         )
 
+        # None — документа с таким ID нет
         if not result:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Не удалось обновить материал"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Материал не найден"
             )
 
         return result
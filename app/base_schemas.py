@@ -1,7 +1,7 @@
-from typing import Optional
+from typing import Optional, Literal
 
 from bson import ObjectId
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, field_validator
 from pydantic_core import core_schema
 
 
@@ -32,3 +32,23 @@ class BaseMongoModel(BaseModel):
         arbitrary_types_allowed=True,
         json_encoders={ObjectId: str}
     )
+
+
+class StrippedNameModel(BaseModel):
+    """
+    Схема записи справочника: имя сохраняется без пробелов по краям —
+    в таком виде его сравнивает уникальный индекс name_ci.
+    """
+
+    @field_validator("name", mode="before", check_fields=False)
+    @classmethod
+    def strip_name(cls, v):
+        return v.strip() if isinstance(v, str) else v
+
+
+class SBulkOperation(BaseModel):
+    """Строка NDJSON-тела bulk-эндпоинтов."""
+    op: Literal["insert", "update", "upsert", "delete"]
+    id: Optional[str] = None
+    filter: Optional[dict] = None  # для upsert: поля-равенства, по которым ищется документ
+    data: Optional[dict] = None
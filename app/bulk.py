@@ -0,0 +1,77 @@
+import json
+from typing import AsyncIterator, Callable, Optional, Tuple, Type
+
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+
+from app.base_schemas import SBulkOperation
+from app.dao.base import MongoDAO
+
+# Сколько строк NDJSON копится перед одним bulk_write
+BULK_BATCH_SIZE = 500
+
+
+async def read_ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Читает тело запроса потоково и отдаёт непустые строки с их порядковым номером.
+    Строки не декодируются: невалидный UTF-8 — ошибка одной строки, а не всего запроса.
+    """
+    buffer = b""
+    index = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, line
+                index += 1
+    if buffer.strip():
+        yield index, buffer
+
+
+async def stream_bulk_results(
+        request: Request,
+        dao: Type[MongoDAO],
+        schema: Type[BaseModel],
+        prepare: Optional[Callable[[dict], dict]] = None,
+        batch_size: int = BULK_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Выполняет NDJSON-операции из тела запроса через dao.bulk_write и отдаёт
+    результаты построчно в NDJSON по мере обработки пачек.
+
+    data каждой операции валидируется схемой добавления (schema); prepare может
+    дополнить операцию (например, проставить автора) перед записью.
+    """
+    batch, numbers = [], []
+
+    async def flush():
+        results = await dao.bulk_write(batch, batch_size=batch_size)
+        for number, result in zip(numbers, results):
+            result["index"] = number
+            yield (json.dumps(result, ensure_ascii=False) + "\n").encode()
+        batch.clear()
+        numbers.clear()
+
+    async for number, line in read_ndjson_lines(request):
+        try:
+            # UnicodeDecodeError — наследник ValueError, попадает в ошибку строки
+            operation = SBulkOperation.model_validate_json(line.decode()).model_dump(exclude_none=True)
+            if "data" in operation:
+                operation["data"] = schema.model_validate(operation["data"]).model_dump(exclude_none=True)
+            if prepare:
+                operation = prepare(operation)
+        except (ValidationError, ValueError) as e:
+            error = {"index": number, "op": None, "id": None, "ok": False, "error": str(e), "code": 422}
+            yield (json.dumps(error, ensure_ascii=False) + "\n").encode()
+            continue
+
+        batch.append(operation)
+        numbers.append(number)
+        if len(batch) >= batch_size:
+            async for line_out in flush():
+                yield line_out
+
+    if batch:
+        async for line_out in flush():
+            yield line_out
@@ -1,6 +1,12 @@
-from app.dao.base import MongoDAO
+from pymongo import IndexModel
+
+from app.dao.base import MongoDAO, CASE_INSENSITIVE_COLLATION
 from app.database import database_mongo
 
 
 class CompaniesDAO(MongoDAO):
     collection = database_mongo["companies"]
+    indexes = [
+        IndexModel([("inn", 1)], name="inn"),
+        IndexModel([("name", 1)], name="name_ci", collation=CASE_INSENSITIVE_COLLATION),
+    ]
@@ -1,16 +1,19 @@
-import re
-from typing import Optional
+from typing import Optional, List
 
 import requests
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from starlette import status
 
+from app.bulk import stream_bulk_results
 from app.companies.dao import CompaniesDAO
 from app.companies.get_company_info import parse_company_data
 from app.companies.shemas import SCompanies, SCompaniesAdd
+from app.deals.dao import DealsDAO
 from app.config import settings
 from app.logger import logger
+from app.projection import fields_param, fields_projection, sparse_response
 
 router = APIRouter(
     prefix="/companies",
@@ -25,9 +28,17 @@ async def get_company_by_id(id: str) -> SCompanies:
 
 
 @router.get("", response_model=list[SCompanies], summary="Получить список компаний")
-async def get_companies(data: SCompanies = Depends()) -> list[
-    SCompanies]:
-    result = await CompaniesDAO.find_all(**data.model_dump(exclude_none=True))
+async def get_companies(
+        data: SCompanies = Depends(),
+        fields: Optional[List[str]] = Depends(fields_param(SCompanies))
+) -> list[SCompanies]:
+    result = await CompaniesDAO.find_all(
+        **data.model_dump(exclude_none=True),
+        projection=fields_projection(fields)
+    )
+    if fields:
+        # Только запрошенные поля — без null-заглушек для остальных
+        return sparse_response(result, SCompanies, fields)
     return result
 
 
@@ -69,16 +80,9 @@ async def add_company(data: SCompaniesAdd):
     try:
         # Проверка уникальности ИНН: если уже есть — возвращаем существующую компанию
         if data.inn is not None:
-            if not await CompaniesDAO.is_unique(
-                    field_name="inn",
-                    value=data.inn,
-                    case_sensitive=False,
-                    trim_spaces=True
-            ):
-                # ИНН уже есть — находим компанию и возвращаем как при добавлении
-                existing = await _find_company_by_inn(data.inn)
-                if existing:
-                    return existing
+            existing = await _find_company_by_inn(data.inn)
+            if existing:
+                return existing
 
         # Создание новой компании
         company_data = data.model_dump(exclude_none=True)
@@ -107,23 +111,40 @@ async def _find_company_by_inn(inn: int | str) -> SCompanies | None:
     value = str(inn).strip() if inn is not None else None
     if value is None:
         return None
-    # Поиск по строке (регистронезависимо, как в is_unique)
-    found = await CompaniesDAO.find_one_or_none(
-        filter_by={
-            "inn": {
-                "$regex": f"^{re.escape(value)}$",
-                "$options": "i"
-            }
-        }
-    )
-    if found:
-        return found
-    # На случай если в БД хранится число
+    # ИНН состоит из цифр, регистр не важен: один точечный запрос по индексу inn
+    # сразу по строковому и числовому представлению
+    candidates = [value]
     try:
-        num = int(value)
-        return await CompaniesDAO.find_one_or_none(inn=num)
+        candidates.append(int(value))
     except (ValueError, TypeError):
-        return None
+        pass
+    return await CompaniesDAO.find_one_or_none(filter_by={"inn": {"$in": candidates}})
+
+
+@router.post(
+    "/bulk",
+    summary="Массовая загрузка компаний (NDJSON)",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Результат по каждой строке запроса (NDJSON)",
+            "content": {"application/x-ndjson": {}}
+        }
+    }
+)
+async def bulk_companies(request: Request):
+    """
+    Массовая вставка, обновление, upsert и софт-удаление компаний.
+
+    Тело — NDJSON, по операции на строку:
+    {"op": "insert" | "update" | "upsert" | "delete", "id": ..., "filter": {...}, "data": {...}}
+
+    Для загрузки без дублей по ИНН используйте upsert с "filter": {"inn": ...}.
+    """
+    return StreamingResponse(
+        stream_bulk_results(request, CompaniesDAO, SCompaniesAdd),
+        media_type="application/x-ndjson"
+    )
 
 
 @router.patch(
@@ -152,26 +173,12 @@ async def update_material(
     - Не учитывает регистр при проверке уникальности
     """
     try:
-        # Проверяем существование
-        existing_material = await CompaniesDAO.find_one_or_none(_id=ObjectId(id))
-
-        if not existing_material:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Материал не найден"
-            )
-
         update_data = data.model_dump(exclude_none=True)
 
         if "inn" in update_data:
             # Проверка на уникальность
-            if not await CompaniesDAO.is_unique(
-                    field_name="inn",
-                    value=data.inn,
-                    exclude_id=id,
-                    case_sensitive=False,
-                    trim_spaces=True
-            ):
+            existing_company = await _find_company_by_inn(data.inn)
+            if existing_company and str(existing_company["_id"]) != id:
                 raise HTTPException(
                     status_code=status.HTTP_409_CONFLICT,
                     detail="Материал с таким именем уже существует"
@@ -196,12 +203,17 @@ async def update_material(
             update_data=update_data
         )
 
+        # None — документа с таким ID нет
         if not result:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Не удалось обновить материал"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Материал не найден"
             )
 
+        # Новое название — в снимки этого объекта, сохранённые в сделках
+        if "name" in update_data:
+            background_tasks.add_task(DealsDAO.refresh_snapshots, "customer", result["_id"], result.get("name"))
+
         return result
 
     except HTTPException:
@@ -318,7 +330,6 @@ async def check_material_dependencies(adress_id: str) -> bool:
     - False если зависимостей нет
     """
     # Пример проверки в других коллекциях
-    from app.deals.dao import DealsDAO
 
     # Проверяем, используется ли материал в продуктах
     deals_using_company = await DealsDAO.count(
@@ -19,6 +19,20 @@ class Settings(BaseSettings):
     REDIS_HOST: str
     REDIS_PORT: int
 
+    # кэш чтений MongoDAO в Redis (Celery занимает базу 0)
+    CACHE_ENABLED: bool = True
+    REDIS_CACHE_DB: int = 1
+    REDIS_CACHE_TIMEOUT_S: float = 0.5
+    CACHE_L1_MAX_ENTRIES: int = 2048  # in-process LRU перед Redis, на каждый воркер
+    CACHE_L1_TTL_S: int = 60  # страховка на случай потерянного сообщения об инвалидации
+
+    # реплики справочников в памяти воркера (нужен replica set для change streams)
+    REPLICAS_ENABLED: bool = True
+    REPLICA_WRITE_HOLD_S: float = 2.0  # после своей записи читать из Mongo, пока событие не дойдёт
+    # расчёт зарплаты менеджеров (app.payroll)
+    PAYROLL_CLOSED_STAGE_IDS: str = ""  # этапы закрытых сделок через запятую; пусто — этапы с наибольшим order
+    PAYROLL_BATCH_SIZE: int = 50_000
+
     S3_ENDPOINT: str
     S3_BUCKET: str
     S3_ACCESS_KEY: str
@@ -29,6 +43,19 @@ class Settings(BaseSettings):
     MONGO_INITDB_ROOT_PASSWORD: str
     MONGO_INITDB_DATABASE: str
 
+    # пул соединений Mongo (на каждый воркер gunicorn)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 10
+    MONGO_MAX_IDLE_TIME_MS: int = 300_000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 5_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5_000
+    MONGO_COMPRESSORS: str = "zstd,zlib"  # snappy — если установлен python-snappy
+
+    # мониторинг команд Mongo (CommandListener)
+    MONGO_COMMAND_MONITORING: bool = True
+    MONGO_SLOW_QUERY_MS: int = 200
+    MONGO_MONITOR_REPLY_BYTES: bool = False  # размер ответа — повторный bson.encode каждого ответа, только для диагностики
+
     API_FNS_URL: str
     API_FNS_KEY: str
 
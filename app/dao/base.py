@@ -1,17 +1,35 @@
 import re
 from datetime import datetime, timezone
-from typing import Optional, Dict, List, Any, Union
+from typing import Optional, Dict, List, Any, Union, Tuple, AsyncIterator
 
-from bson import ObjectId
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import IndexModel, ReturnDocument, InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from pymongo.results import InsertManyResult, DeleteResult, UpdateResult
 
-from app.deals.shemas import PaginatedResponse
+from app.config import settings
+from app.dao import cache, replica
+from app.dao.count_mode import parse_count_mode
+from app.dao.cursor import apply_keyset, cursor_from_document
 from app.logger import logger
 
+# Сравнение строк без учёта регистра (strength 2 — регистр не важен, диакритика важна)
+CASE_INSENSITIVE_COLLATION = {"locale": "ru", "strength": 2}
+# Уникальность имени справочника без учёта регистра; sparse — документы без name не конфликтуют
+UNIQUE_NAME_INDEX = IndexModel([("name", 1)], name="name_ci", collation=CASE_INSENSITIVE_COLLATION,
+                               unique=True, sparse=True)
+
 
 class MongoDAO:
     collection: AsyncIOMotorCollection = None
+    # Индексы коллекции, создаются при старте приложения (app.dao.indexes.ensure_indexes)
+    indexes: List[IndexModel] = []
+    # TTL кэша чтений в Redis, секунды; None — кэш выключен (find_one_or_none, find_all)
+    cache_ttl: Optional[int] = None
+    # Держать полную копию коллекции в памяти воркера (app.dao.replica), только для маленьких справочников
+    replicated: bool = False
 
     @classmethod
     async def find_one_or_none(
@@ -24,6 +42,16 @@ class MongoDAO:
         try:
             query = filter_by or {}
             query.update(kwargs)
+            if cls.replicated:
+                result = cls._replica_call("find_one", query, projection)
+                if result is not replica.UNSUPPORTED:
+                    return result
+            if cls._cache_enabled():
+                return await cache.cached(
+                    cls.collection.name, cls.cache_ttl,
+                    cache.cache_digest("find_one", query, projection),
+                    lambda: cls.collection.find_one(query, projection),
+                )
             return await cls.collection.find_one(query, projection)
         except Exception as e:
             logger.error(f"Error finding document: {str(e)}", exc_info=True)
@@ -44,18 +72,54 @@ class MongoDAO:
             query = filter_by or {}
             query.update(kwargs)
 
-            cursor = cls.collection.find(query, projection)
+            async def load():
+                cursor = cls.collection.find(query, projection)
 
-            if sort:
-                cursor = cursor.sort(sort)
+                if sort:
+                    cursor = cursor.sort(sort)
 
-            cursor = cursor.skip(skip).limit(limit)
+                cursor = cursor.skip(skip).limit(limit)
 
-            return [doc async for doc in cursor]
+                return [doc async for doc in cursor]
+
+            if cls.replicated:
+                result = cls._replica_call("find_all", query, projection, skip, limit, sort)
+                if result is not replica.UNSUPPORTED:
+                    return result
+            if cls._cache_enabled():
+                return await cache.cached(
+                    cls.collection.name, cls.cache_ttl,
+                    cache.cache_digest("find_all", query, projection, sort, skip, limit),
+                    load,
+                )
+            return await load()
         except Exception as e:
             logger.error(f"Error finding documents: {str(e)}", exc_info=True)
             return []
 
+    @classmethod
+    async def iterate(
+            cls,
+            filter_by: Optional[Dict] = None,
+            projection: Optional[Dict] = None,
+            sort: Optional[List[tuple]] = None,
+            batch_size: int = 1000,
+            **kwargs,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоково отдаёт документы прямо из курсора, не собирая их в список.
+        Память ограничена одной пачкой batch_size, независимо от размера выборки.
+        """
+        query = filter_by or {}
+        query.update(kwargs)
+
+        cursor = cls.collection.find(query, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        async for doc in cursor:
+            yield doc
+
     @classmethod
     async def find_paginated(
             cls,
@@ -64,62 +128,123 @@ class MongoDAO:
             skip: int = 0,
             limit: int = 100,
             sort: Optional[List[tuple]] = None,
+            cursor: Optional[str] = None,
+            count_mode: str = "exact",
             **kwargs,
-    ) -> PaginatedResponse:
-        """Find documents with pagination metadata."""
+    ) -> Dict[str, Any]:
+        """
+        Find documents with pagination metadata.
+
+        Если передан cursor (nextCursor предыдущей страницы), skip игнорируется
+        и страница выбирается диапазонным условием по ключу сортировки.
+        count_mode задаёт способ подсчёта total (см. app.dao.count_mode).
+        Страница — dict для FastJSONResponse (см. _build_paginated_response).
+        """
         try:
             query = filter_by or {}
             query.update(kwargs)
 
             # Получаем общее количество документов
-            total = await cls.collection.count_documents(query)
-
-            # Получаем данные с пагинацией
-            cursor = cls.collection.find(query, projection)
-
-            if sort:
-                cursor = cursor.sort(sort)
-
-            cursor = cursor.skip(skip).limit(limit)
-            items = [doc async for doc in cursor]
+            total, total_exact = await cls._count_total(query, count_mode)
 
-            # Конвертируем ObjectId в строки для сериализации
-            for item in items:
-                if '_id' in item and isinstance(item['_id'], ObjectId):
-                    item['_id'] = str(item['_id'])
-                # Также конвертируем другие ObjectId поля если нужно
-                for key, value in item.items():
-                    if isinstance(value, ObjectId):
-                        item[key] = str(value)
+            page_query, page_sort = apply_keyset(query, sort, cursor)
 
-            # Вычисляем метаданные пагинации
-            page = (skip // limit) + 1 if limit > 0 else 1
-            total_pages = (total + limit - 1) // limit if limit > 0 else 1
-            has_next = page < total_pages
-            has_prev = page > 1
+            # Получаем данные с пагинацией (limit + 1 — чтобы узнать, есть ли следующая страница)
+            db_cursor = cls.collection.find(page_query, projection).sort(page_sort)
+            if not cursor:
+                db_cursor = db_cursor.skip(skip)
+            db_cursor = db_cursor.limit(limit + 1 if limit > 0 else 0)
+            items = [doc async for doc in db_cursor]
 
-            return PaginatedResponse(
+            return cls._build_paginated_response(
                 items=items,
                 total=total,
-                page=page,
-                page_size=limit,
-                total_pages=total_pages,
-                has_next=has_next,
-                has_prev=has_prev
+                total_exact=total_exact,
+                skip=skip,
+                limit=limit,
+                sort=page_sort,
+                cursor=cursor,
             )
 
         except Exception as e:
             logger.error(f"Error finding paginated documents: {str(e)}", exc_info=True)
-            return PaginatedResponse(
-                items=[],
-                total=0,
-                page=1,
-                page_size=limit,
-                total_pages=0,
-                has_next=False,
-                has_prev=False
+            return cls._build_paginated_response(
+                items=[], total=0, skip=0, limit=limit, sort=[], cursor=None
             )
 
+    @classmethod
+    async def _count_total(
+            cls,
+            query: Dict,
+            count_mode: Optional[str] = "exact",
+    ) -> Tuple[Optional[int], bool]:
+        """
+        Считает total согласно count_mode.
+
+        Returns:
+            (total, точное ли значение); total=None для режима none
+        """
+        mode, cap = parse_count_mode(count_mode)
+
+        if mode == "none":
+            return None, False
+
+        if mode == "estimated" and not query:
+            # Берётся из метаданных коллекции, без сканирования
+            return await cls.collection.estimated_document_count(), False
+
+        if mode == "capped":
+            total = await cls.collection.count_documents(query, limit=cap)
+            return total, total < cap
+
+        return await cls.collection.count_documents(query), True
+
+    @classmethod
+    def _build_paginated_response(
+            cls,
+            items: List[Dict[str, Any]],
+            total: Optional[int],
+            skip: int,
+            limit: int,
+            sort: List[tuple],
+            cursor: Optional[str],
+            total_exact: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Собирает страницу из выборки размером до limit + 1.
+        Лишний документ отбрасывается и служит признаком следующей страницы.
+        Неточный total поднимается до нижней границы, известной по странице.
+
+        Возвращается dict с camelCase-ключами схемы PaginatedResponse; документы
+        не копируются, ObjectId сериализует FastJSONResponse.
+        """
+        has_next = limit > 0 and len(items) > limit
+        if has_next:
+            items = items[:limit]
+
+        if not total_exact:
+            seen = (0 if cursor else skip) + len(items) + (1 if has_next else 0)
+            total = max(total or 0, seen)
+
+        next_cursor = cursor_from_document(sort, items[-1]) if has_next else None
+
+        # Вычисляем метаданные пагинации
+        page = (skip // limit) + 1 if limit > 0 and not cursor else 1
+        total_pages = (total + limit - 1) // limit if limit > 0 else 1
+        has_prev = bool(cursor) or page > 1
+
+        return {
+            "items": items,
+            "total": total,
+            "page": page,
+            "pageSize": limit,
+            "totalPages": total_pages,
+            "hasNext": has_next,
+            "hasPrev": has_prev,
+            "nextCursor": next_cursor,
+            "totalExact": total_exact,
+        }
+
     @classmethod
     async def aggregate(cls, pipeline: List[Dict]) -> List[Dict[str, Any]]:
         """Execute aggregation pipeline"""
@@ -134,14 +259,22 @@ class MongoDAO:
     async def add(cls, document: Dict) -> Optional[Dict[str, Any]]:
         """
         Insert a document and return the created document.
-        Motor-specific implementation without return_document parameter.
+
+        Документ не перечитывается из базы: insert_one дописывает _id
+        в переданный словарь, он и возвращается.
+
+        Raises:
+            DuplicateKeyError: если документ нарушает уникальный индекс
         """
         try:
-
             result = await cls.collection.insert_one(document)
+            await cls.invalidate_cache()
             if result.inserted_id:
-                return await cls.collection.find_one({"_id": result.inserted_id})
+                return document
             return None
+        except DuplicateKeyError:
+            # Нарушение уникального индекса — обрабатывается в роутере (409)
+            raise
         except Exception as e:
             logger.error(f"Error inserting document: {str(e)}", exc_info=True)
             return None
@@ -154,21 +287,35 @@ class MongoDAO:
             upsert: bool = False,
             return_document: bool = True,
     ) -> Optional[Dict[str, Any]]:
-        """Update a document by its ID."""
+        """
+        Update a document by its ID.
+
+        Один запрос find_one_and_update: возвращает документ после обновления
+        (или до него при return_document=False) и None, если документа с таким
+        _id нет — отдельная проверка существования в роутерах не нужна.
+
+        Raises:
+            DuplicateKeyError: если обновление нарушает уникальный индекс
+        """
         try:
             if isinstance(object_id, str):
                 object_id = ObjectId(object_id)
 
-            result: UpdateResult = await cls.collection.update_one(
+            if not update_data:
+                # Пустой $set Mongo отвергает — просто отдаём текущий документ
+                return await cls.collection.find_one({"_id": object_id})
+
+            result = await cls.collection.find_one_and_update(
                 {"_id": object_id},
                 {"$set": update_data},
                 upsert=upsert,
+                return_document=ReturnDocument.AFTER if return_document else ReturnDocument.BEFORE,
             )
-
-            if result.modified_count == 0 and not upsert:
-                return None
-
-            return await cls.collection.find_one({"_id": object_id})
+            if result is not None or upsert:
+                await cls.invalidate_cache()
+            return result
+        except DuplicateKeyError:
+            raise
         except Exception as e:
             logger.error(f"Error updating document: {str(e)}", exc_info=True)
             return None
@@ -187,6 +334,8 @@ class MongoDAO:
                 {"$set": update_data},
                 upsert=upsert,
             )
+            if result.modified_count or result.upserted_id is not None:
+                await cls.invalidate_cache()
             return result.modified_count
         except Exception as e:
             logger.error(f"Error updating documents: {str(e)}", exc_info=True)
@@ -200,6 +349,8 @@ class MongoDAO:
             query.update(kwargs)
 
             result: DeleteResult = await cls.collection.delete_one(query)
+            if result.deleted_count:
+                await cls.invalidate_cache()
             return result.deleted_count > 0
         except Exception as e:
             logger.error(f"Error deleting document: {str(e)}", exc_info=True)
@@ -213,6 +364,8 @@ class MongoDAO:
             query.update(kwargs)
 
             result: DeleteResult = await cls.collection.delete_many(query)
+            if result.deleted_count:
+                await cls.invalidate_cache()
             return result.deleted_count
         except Exception as e:
             logger.error(f"Error deleting documents: {str(e)}", exc_info=True)
@@ -230,11 +383,192 @@ class MongoDAO:
                 documents,
                 ordered=ordered,
             )
+            await cls.invalidate_cache()
             return result.inserted_ids
         except Exception as e:
             logger.error(f"Error bulk inserting documents: {str(e)}", exc_info=True)
             return None
 
+    @classmethod
+    async def bulk_write(
+            cls,
+            operations: List[Dict],
+            batch_size: int = 500,
+            deleted_at_field: str = "deletedAt",
+    ) -> List[Dict[str, Any]]:
+        """
+        Смешанная пакетная запись: вставка, обновление, upsert и софт-удаление.
+
+        Операции — словари вида {"op": "insert" | "update" | "upsert" | "delete",
+        "id": ..., "filter": {...}, "data": {...}, "set_on_insert": {...}}.
+        set_on_insert у upsert пишется только при создании документа ($setOnInsert),
+        найденный документ эти поля сохраняет. Операции режутся на пачки по
+        batch_size и выполняются unordered: ошибка одной операции не мешает
+        остальным. Возвращает по результату на каждую операцию в исходном порядке:
+        {"index", "op", "id", "ok"} и "error"/"code" при неудаче; id upsert — id
+        созданного или найденного документа.
+        """
+        results = []
+        for start in range(0, len(operations), batch_size):
+            batch = operations[start:start + batch_size]
+            results.extend(await cls._bulk_write_batch(batch, start, deleted_at_field))
+        if any(result["ok"] for result in results):
+            await cls.invalidate_cache()
+        return results
+
+    @classmethod
+    async def _bulk_write_batch(
+            cls,
+            operations: List[Dict],
+            offset: int,
+            deleted_at_field: str,
+    ) -> List[Dict[str, Any]]:
+        """Выполняет одну пачку bulk_write одним запросом к Mongo."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+        requests, positions, ids = [], [], []
+
+        def fail(position, operation, error, code=None):
+            results[position] = {
+                "index": offset + position,
+                "op": operation.get("op"),
+                "id": str(operation["id"]) if operation.get("id") is not None else None,
+                "ok": False,
+                "error": error,
+                "code": code,
+            }
+
+        for position, operation in enumerate(operations):
+            kind = operation.get("op")
+            try:
+                object_id = operation.get("id")
+                if isinstance(object_id, str):
+                    object_id = operation["id"] = ObjectId(object_id)
+                data = operation.get("data") or {}
+
+                if kind == "insert":
+                    document = dict(data)
+                    if object_id is not None:
+                        document["_id"] = object_id
+                    requests.append(InsertOne(document))
+                    # pymongo проставит _id в документ при выполнении
+                    operation["document"] = document
+                elif kind == "upsert":
+                    filter_by = operation.get("filter") or ({"_id": object_id} if object_id else None)
+                    # Поле не может быть и в $set, и в $setOnInsert — присланное значение важнее
+                    on_insert = {
+                        key: value for key, value in (operation.get("set_on_insert") or {}).items()
+                        if key not in data
+                    }
+                    if not filter_by or not (data or on_insert):
+                        raise ValueError("upsert requires filter (or id) and data")
+                    if any(key.startswith("$") or isinstance(value, dict) for key, value in filter_by.items()):
+                        # Фильтр приходит от клиента — допускаем только равенства
+                        raise ValueError("upsert filter must contain plain equality conditions")
+                    update = {"$set": data} if data else {}
+                    if on_insert:
+                        update["$setOnInsert"] = on_insert
+                    requests.append(UpdateOne(filter_by, update, upsert=True))
+                    operation["filter"] = filter_by
+                elif kind in ("update", "delete"):
+                    if object_id is None:
+                        raise ValueError(f"{kind} requires id")
+                    if kind == "delete":
+                        data = {deleted_at_field: datetime.now(timezone.utc)}
+                    if not data:
+                        raise ValueError("update requires data")
+                    requests.append(UpdateOne({"_id": object_id}, {"$set": data}))
+                    ids.append(object_id)
+                else:
+                    raise ValueError(f"Unknown op: {kind}")
+                positions.append(position)
+            except (ValueError, TypeError, InvalidId) as e:
+                fail(position, operation, str(e), 422)
+
+        try:
+            # Обновление и удаление по id: несуществующие id отсекаем одним $in-запросом
+            if ids:
+                found = {doc["_id"] async for doc in cls.collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+                kept_requests, kept_positions = [], []
+                for request, position in zip(requests, positions):
+                    operation = operations[position]
+                    if operation["op"] in ("update", "delete") and operation["id"] not in found:
+                        fail(position, operation, "not found", 404)
+                        continue
+                    kept_requests.append(request)
+                    kept_positions.append(position)
+                requests, positions = kept_requests, kept_positions
+
+            write_errors, upserted = {}, {}
+            if requests:
+                try:
+                    result = await cls.collection.bulk_write(requests, ordered=False)
+                    upserted = result.upserted_ids or {}
+                except BulkWriteError as e:
+                    write_errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+                    upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+        except Exception as e:
+            logger.error(f"Error executing bulk write: {str(e)}", exc_info=True)
+            for position in positions:
+                fail(position, operations[position], "bulk write failed")
+            return results
+
+        matched = await cls._find_upsert_matches([
+            operations[position]["filter"]
+            for index, position in enumerate(positions)
+            if operations[position]["op"] == "upsert" and index not in write_errors and index not in upserted
+        ])
+
+        for index, position in enumerate(positions):
+            operation = operations[position]
+            if index in write_errors:
+                error = write_errors[index]
+                fail(position, operation, error.get("errmsg"), error.get("code"))
+                continue
+
+            object_id = operation.get("id")
+            if operation["op"] == "insert":
+                object_id = operation["document"].get("_id")
+            elif index in upserted:
+                object_id = upserted[index]
+            elif operation["op"] == "upsert":
+                object_id = matched.get(cls._filter_key(operation["filter"]))
+            results[position] = {
+                "index": offset + position,
+                "op": operation["op"],
+                "id": str(object_id) if object_id is not None else None,
+                "ok": True,
+            }
+
+        return results
+
+    @staticmethod
+    def _filter_key(filter_by: Dict) -> str:
+        return json_util.dumps(filter_by, sort_keys=True)
+
+    @classmethod
+    async def _find_upsert_matches(cls, filters: List[Dict]) -> Dict[str, Any]:
+        """
+        _id документов, которые upsert нашёл и обновил (Mongo возвращает id только
+        созданных): один запрос $or по фильтрам-равенствам после записи.
+        """
+        if not filters:
+            return {}
+        unique = {cls._filter_key(filter_by): filter_by for filter_by in filters}
+        projection = {field: 1 for filter_by in unique.values() for field in filter_by}
+        matched = {}
+        try:
+            async for doc in cls.collection.find({"$or": list(unique.values())}, projection):
+                for key, filter_by in unique.items():
+                    if key not in matched and all(
+                        doc.get(field) == value
+                        or (isinstance(doc.get(field), list) and value in doc.get(field))
+                        for field, value in filter_by.items()
+                    ):
+                        matched[key] = doc["_id"]
+        except Exception as e:
+            logger.error(f"Error resolving upserted documents: {str(e)}", exc_info=True)
+        return matched
+
     @classmethod
     async def count(
             cls,
@@ -250,6 +584,16 @@ class MongoDAO:
             logger.error(f"Error counting documents: {str(e)}", exc_info=True)
             return 0
 
+    @classmethod
+    def case_insensitive_fields(cls) -> List[str]:
+        """Поля, у которых есть одиночный индекс с CASE_INSENSITIVE_COLLATION."""
+        fields = []
+        for model in cls.indexes:
+            document = model.document
+            if len(document["key"]) == 1 and document.get("collation") == CASE_INSENSITIVE_COLLATION:
+                fields.extend(document["key"].keys())
+        return fields
+
     @classmethod
     async def is_unique(
             cls,
@@ -288,7 +632,14 @@ class MongoDAO:
                     query_value = value
 
             # Формируем запрос с учетом типа значения
-            if isinstance(query_value, str) and not case_sensitive:
+            collation = None
+            if isinstance(query_value, str) and not case_sensitive \
+                    and field_name in cls.case_insensitive_fields():
+                # Точечный поиск по индексу с регистронезависимой collation
+                query = {field_name: query_value}
+                collation = CASE_INSENSITIVE_COLLATION
+            elif isinstance(query_value, str) and not case_sensitive:
+                # Для полей без такого индекса — полный просмотр по regex
                 query = {
                     field_name: {
                         "$regex": f"^{re.escape(query_value)}$",
@@ -304,7 +655,7 @@ class MongoDAO:
                     exclude_id = ObjectId(exclude_id)
                 query["_id"] = {"$ne": exclude_id}
 
-            existing = await cls.collection.find_one(query)
+            existing = await cls.collection.find_one(query, {"_id": 1}, collation=collation)
             return existing is None
 
         except Exception as e:
@@ -335,3 +686,36 @@ class MongoDAO:
         except Exception as e:
             logger.error(f"Error soft-deleting document: {str(e)}", exc_info=True)
             return None
+
+    @classmethod
+    def _cache_enabled(cls) -> bool:
+        return bool(cls.cache_ttl) and settings.CACHE_ENABLED
+
+    @classmethod
+    def _replica_call(cls, method: str, *args) -> Any:
+        """Чтение из реплики в памяти; UNSUPPORTED, если реплика не запущена или не готова."""
+        collection_replica = replica.get_replica(cls.collection.name)
+        if collection_replica is None:
+            return replica.UNSUPPORTED
+        return getattr(collection_replica, method)(*args)
+
+    @classmethod
+    async def invalidate_cache(cls) -> None:
+        """Сбрасывает кэш чтений коллекции; вызывается после каждой записи через DAO."""
+        if cls.replicated:
+            collection_replica = replica.get_replica(cls.collection.name)
+            if collection_replica is not None:
+                # Своя запись дойдёт до реплики через change stream — до этого читаем из Mongo
+                collection_replica.hold(settings.REPLICA_WRITE_HOLD_S)
+        if cls._cache_enabled():
+            await cache.invalidate(cls.collection.name)
+
+
+class ReferenceDAO(MongoDAO):
+    """
+    Справочник (услуги, этапы, материалы): маленький, читается почти на каждом
+    экране сделки и меняется редко. Чтения идут из полной копии в памяти воркера
+    (change stream), Redis-кэш — на время её пересинхронизации.
+    """
+    cache_ttl = 300
+    replicated = True
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import bson
+from bson import json_util
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.logger import logger
+
+# Версия коллекции: увеличивается при каждой записи, старые ключи перестают читаться
+# и доживают до своего TTL
+_VERSION_KEY = "cache:{collection}:version"
+_VALUE_KEY = "cache:{collection}:{version}:{digest}"
+
+# Канал, в который публикуются имена изменённых коллекций
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Версия и значение за один round trip
+_GET_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+return {version, redis.call('GET', ARGV[1] .. version .. ':' .. ARGV[2])}
+"""
+
+_redis: Optional[aioredis.Redis] = None
+
+# Счётчики текущего процесса по коллекциям: l1Hits — из памяти, hits — из Redis
+cache_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"l1Hits": 0, "hits": 0, "misses": 0, "errors": 0})
+
+
+class LocalLRU:
+    """
+    In-process LRU (L1) перед Redis. Хранит BSON ответа, поэтому каждое чтение
+    получает свою копию документов.
+
+    Инвалидация по коллекции — увеличение её поколения: записи прошлых поколений
+    больше не отдаются. Работает только пока процесс подписан на INVALIDATION_CHANNEL
+    (active) — без подписки L1 мог бы пропустить чужую запись и отдавать устаревшие данные.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.active = False
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, int, bytes]]" = OrderedDict()
+        self._generations: Dict[str, int] = defaultdict(int)
+
+    def generation(self, collection: str) -> int:
+        return self._generations[collection]
+
+    def get(self, collection: str, digest: str) -> Optional[bytes]:
+        if not self.active:
+            return None
+        key = (collection, digest)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, generation, raw = entry
+        if generation != self._generations[collection] or expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return raw
+
+    def put(self, collection: str, digest: str, raw: bytes, ttl: int, generation: int) -> None:
+        # Значение, прочитанное до инвалидации, в L1 не попадает
+        if not self.active or generation != self._generations[collection]:
+            return
+        key = (collection, digest)
+        self._entries[key] = (time.monotonic() + min(ttl, self.ttl), generation, raw)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self, collection: str) -> None:
+        self._generations[collection] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+local_cache = LocalLRU(max_entries=settings.CACHE_L1_MAX_ENTRIES, ttl=settings.CACHE_L1_TTL_S)
+
+
+def get_redis() -> aioredis.Redis:
+    """Клиент Redis для кэша (отдельная база, Celery использует базу 0)."""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_CACHE_DB,
+            socket_timeout=settings.REDIS_CACHE_TIMEOUT_S,
+            socket_connect_timeout=settings.REDIS_CACHE_TIMEOUT_S,
+        )
+    return _redis
+
+
+async def close_cache() -> None:
+    global _redis
+    local_cache.active = False
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def cache_digest(method: str, *params: Any) -> str:
+    """
+    Ключ запроса: метод и нормализованные параметры (filter, projection, sort, skip, limit).
+    Ключи словарей сортируются, порядок списков (sort) сохраняется.
+    """
+    payload = json_util.dumps([method, *params], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+async def cached(
+        collection: str,
+        ttl: int,
+        digest: str,
+        loader: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Read-through: L1 в памяти процесса, затем Redis, затем loader (Mongo).
+    Результат loader кладётся в оба уровня. Ошибки Redis не ломают чтение.
+    """
+    stats = cache_stats[collection]
+    generation = local_cache.generation(collection)
+    raw = local_cache.get(collection, digest)
+    if raw is not None:
+        stats["l1Hits"] += 1
+        return bson.decode(raw)["v"]
+
+    prefix = f"cache:{collection}:"
+    version = None
+    try:
+        version, raw = await get_redis().eval(
+            _GET_SCRIPT, 1, _VERSION_KEY.format(collection=collection), prefix, digest
+        )
+        if raw is not None:
+            stats["hits"] += 1
+            local_cache.put(collection, digest, raw, ttl, generation)
+            return bson.decode(raw)["v"]
+    except RedisError as e:
+        stats["errors"] += 1
+        logger.warning(f"Cache read failed for {collection}: {str(e)}")
+
+    stats["misses"] += 1
+    value = await loader()
+    if version is not None:
+        raw = bson.encode({"v": value})
+        try:
+            key = _VALUE_KEY.format(collection=collection, version=version.decode(), digest=digest)
+            await get_redis().set(key, raw, ex=ttl)
+        except RedisError as e:
+            stats["errors"] += 1
+            logger.warning(f"Cache write failed for {collection}: {str(e)}")
+        else:
+            local_cache.put(collection, digest, raw, ttl, generation)
+    return value
+
+
+async def invalidate(collection: str) -> None:
+    """
+    Сбрасывает кэш коллекции: увеличивает её версию в Redis и оповещает
+    остальные процессы через INVALIDATION_CHANNEL (один round trip).
+    """
+    local_cache.evict(collection)
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.incr(_VERSION_KEY.format(collection=collection))
+            pipe.publish(INVALIDATION_CHANNEL, collection)
+            await pipe.execute()
+    except RedisError as e:
+        cache_stats[collection]["errors"] += 1
+        logger.error(f"Cache invalidation failed for {collection}: {str(e)}")
+
+
+async def listen_invalidations(reconnect_delay: float = 1.0) -> None:
+    """
+    Фоновая задача воркера (запускается в lifespan): слушает INVALIDATION_CHANNEL
+    и сбрасывает L1 изменённых коллекций. L1 включён, только пока подписка жива;
+    после переподключения он очищается — сообщения за время разрыва потеряны.
+    """
+    # Отдельное соединение без socket_timeout: подписка может молчать сколь угодно долго
+    client = aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        socket_connect_timeout=settings.REDIS_CACHE_TIMEOUT_S,
+        health_check_interval=30,
+    )
+    try:
+        while True:
+            try:
+                async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    local_cache.clear()
+                    local_cache.active = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            local_cache.evict(message["data"].decode())
+            except RedisError as e:
+                logger.warning(f"Cache invalidation listener disconnected: {str(e)}")
+            finally:
+                local_cache.active = False
+            await asyncio.sleep(reconnect_delay)
+    finally:
+        await client.aclose()
@@ -0,0 +1,24 @@
+from typing import Optional, Tuple
+
+# exact — точный count_documents
+# capped:N — считаем не дальше N документов, total — нижняя граница
+# estimated — метаданные коллекции (только без фильтра, иначе exact)
+# none — total не считается, известна только нижняя граница по странице
+COUNT_MODE_PATTERN = r"^(exact|estimated|none|capped:[1-9][0-9]*)$"
+
+
+def parse_count_mode(count_mode: Optional[str]) -> Tuple[str, Optional[int]]:
+    """
+    Разбирает countMode в пару (режим, порог).
+
+    Raises:
+        ValueError: если режим не поддерживается
+    """
+    if not count_mode:
+        return "exact", None
+    if count_mode in ("exact", "estimated", "none"):
+        return count_mode, None
+    mode, _, cap = count_mode.partition(":")
+    if mode == "capped" and cap.isdigit() and int(cap) > 0:
+        return mode, int(cap)
+    raise ValueError(f"Unsupported count mode: {count_mode}")
@@ -0,0 +1,116 @@
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+
+
+def encode_cursor(sort_field: str, order: int, value: Any, object_id: ObjectId) -> str:
+    """
+    Упаковывает поле и направление сортировки, ключ и _id последнего документа
+    страницы в непрозрачный токен для keyset-пагинации.
+    """
+    payload = json_util.dumps({"s": sort_field, "o": order, "v": value, "id": object_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """
+    Распаковывает токен, выданный encode_cursor.
+
+    Raises:
+        ValueError: если токен повреждён или сформирован не нами
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(payload, dict) or not {"s", "o", "v", "id"} <= payload.keys():
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def keyset_sort(sort: Optional[List[tuple]]) -> List[tuple]:
+    """
+    Возвращает сортировку, пригодную для keyset-пагинации:
+    первый ключ сортировки + _id в том же направлении как тай-брейкер.
+    """
+    if not sort or sort[0][0] == "_id":
+        order = sort[0][1] if sort else 1
+        return [("_id", order)]
+    field, order = sort[0]
+    return [(field, order), ("_id", order)]
+
+
+def _check_sort(sort: List[tuple], cursor: Dict[str, Any]) -> None:
+    field, order = sort[0]
+    if cursor["s"] != field or cursor["o"] != order:
+        raise ValueError("Cursor does not match sort order")
+
+
+def keyset_predicate(sort: List[tuple], cursor: Dict[str, Any]) -> Dict:
+    """
+    Строит условие "строго после курсора" для сортировки из keyset_sort.
+    Вместо skip() Mongo сразу встаёт на нужное место индекса.
+    """
+    field, order = sort[0]
+    op = "$gt" if order == 1 else "$lt"
+    last_id = cursor["id"]
+    _check_sort(sort, cursor)
+
+    if field == "_id":
+        return {"_id": {op: last_id}}
+
+    value = cursor["v"]
+    if value is None:
+        # null сортируется раньше любых значений
+        if order == 1:
+            return {"$or": [
+                {field: None, "_id": {op: last_id}},
+                {field: {"$ne": None}},
+            ]}
+        return {field: None, "_id": {op: last_id}}
+
+    branches = [
+        {field: {op: value}},
+        {field: value, "_id": {op: last_id}},
+    ]
+    if order == -1:
+        # При убывающей сортировке null и отсутствующее поле идут после всех значений
+        branches.append({field: None})
+    return {"$or": branches}
+
+
+def check_cursor(sort: Optional[List[tuple]], cursor: Optional[str]) -> None:
+    """
+    Проверяет токен до запроса: он должен читаться и относиться к тому же полю
+    и направлению сортировки.
+
+    Raises:
+        ValueError: если токен повреждён или выдан для другой сортировки
+    """
+    if cursor:
+        _check_sort(keyset_sort(sort), decode_cursor(cursor))
+
+
+def cursor_from_document(sort: List[tuple], document: Dict) -> Optional[str]:
+    """Формирует токен следующей страницы по последнему документу."""
+    if not document or "_id" not in document:
+        return None
+    field, order = sort[0]
+    return encode_cursor(field, order, document.get(field), document["_id"])
+
+
+def apply_keyset(
+        query: Dict,
+        sort: Optional[List[tuple]],
+        cursor: Optional[str],
+) -> Tuple[Dict, List[tuple]]:
+    """Дополняет фильтр и сортировку для запроса страницы после cursor."""
+    sort = keyset_sort(sort)
+    if not cursor:
+        return query, sort
+    predicate = keyset_predicate(sort, decode_cursor(cursor))
+    if not query:
+        return predicate, sort
+    return {"$and": [query, predicate]}, sort
@@ -0,0 +1,203 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Type
+
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from app.dao.base import MongoDAO, CASE_INSENSITIVE_COLLATION
+from app.logger import logger
+
+# Параметры, которые server возвращает в index_information, но не задаются в IndexModel
+_SERVER_ONLY_OPTIONS = {"v", "ns", "background"}
+
+# Служебная коллекция с прогрессом фоновых миграций данных
+MIGRATIONS_COLLECTION = "migrations"
+
+
+def registered_daos() -> List[Type[MongoDAO]]:
+    """Все импортированные наследники MongoDAO с коллекцией (по одному на коллекцию)."""
+    result, seen, stack = [], set(), list(MongoDAO.__subclasses__())
+    while stack:
+        dao = stack.pop(0)
+        stack.extend(dao.__subclasses__())
+        if dao.collection is None or dao.collection.name in seen:
+            continue
+        seen.add(dao.collection.name)
+        result.append(dao)
+    return result
+
+
+def _index_drift(declared: Dict, existing: Dict) -> List[str]:
+    """Сравнивает объявленный индекс с существующим, возвращает список расхождений."""
+    drift = []
+    if list(declared["key"].items()) != [tuple(k) for k in existing["key"]]:
+        drift.append(f"key {existing['key']} != {list(declared['key'].items())}")
+
+    for option, value in declared.items():
+        if option in ("key", "name") or option in _SERVER_ONLY_OPTIONS:
+            continue
+        current = existing.get(option)
+        if option == "collation":
+            # Сервер дополняет collation значениями по умолчанию
+            current = {k: v for k, v in (current or {}).items() if k in value}
+        if current != value:
+            drift.append(f"{option} {current!r} != {value!r}")
+
+    for option in existing:
+        if option not in declared and option not in _SERVER_ONLY_OPTIONS and option != "key":
+            drift.append(f"undeclared option {option}={existing[option]!r}")
+    return drift
+
+
+def _is_unique_case_insensitive(model: IndexModel) -> bool:
+    document = model.document
+    return bool(document.get("unique")) and document.get("collation") == CASE_INSENSITIVE_COLLATION
+
+
+async def normalize_unique_values(dao: Type[MongoDAO], batch_size: int = 500) -> Dict[str, Any]:
+    """
+    Обрезает пробелы по краям в полях с регистронезависимым уникальным индексом,
+    чтобы существующие данные совпадали с тем, что пишут роутеры.
+
+    Проход идёт пачками по _id, прогресс сохраняется в MIGRATIONS_COLLECTION,
+    поэтому прерванный проход продолжается с места остановки. Дубликаты без учёта
+    регистра не исправляются автоматически — они попадают в отчёт, и проход
+    не считается завершённым, пока их не разберут вручную.
+    """
+    fields = [field for model in dao.indexes if _is_unique_case_insensitive(model)
+              for field in model.document["key"]]
+    if not fields:
+        return {}
+
+    migrations = dao.collection.database[MIGRATIONS_COLLECTION]
+    state_id = f"normalize_unique:{dao.collection.name}"
+    state = await migrations.find_one({"_id": state_id}) or {}
+    if state.get("done"):
+        return state
+
+    last_id = state.get("lastId")
+    updated = state.get("updated", 0)
+    string_filter = {"$or": [{field: {"$type": "string"}} for field in fields]}
+
+    while True:
+        query = string_filter if last_id is None else {"$and": [string_filter, {"_id": {"$gt": last_id}}]}
+        cursor = dao.collection.find(query, {field: 1 for field in fields}).sort("_id", 1).limit(batch_size)
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+
+        operations = []
+        for doc in batch:
+            changes = {
+                field: doc[field].strip() for field in fields
+                if isinstance(doc.get(field), str) and doc[field] != doc[field].strip()
+            }
+            if changes:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if operations:
+            await dao.collection.bulk_write(operations, ordered=False)
+            await dao.invalidate_cache()
+            updated += len(operations)
+
+        last_id = batch[-1]["_id"]
+        await migrations.update_one(
+            {"_id": state_id},
+            {"$set": {"lastId": last_id, "updated": updated}},
+            upsert=True,
+        )
+
+    duplicates = {}
+    for field in fields:
+        groups = await dao.collection.aggregate([
+            {"$match": {field: {"$type": "string"}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 100},
+        ], collation=CASE_INSENSITIVE_COLLATION).to_list(None)
+        if groups:
+            duplicates[field] = [group["_id"] for group in groups]
+
+    state = {
+        "lastId": last_id,
+        "updated": updated,
+        "duplicates": duplicates,
+        "done": not duplicates,
+        "finishedAt": datetime.now(timezone.utc),
+    }
+    await migrations.update_one({"_id": state_id}, {"$set": state}, upsert=True)
+    return state
+
+
+async def ensure_dao_indexes(dao: Type[MongoDAO]) -> Dict[str, List[str]]:
+    """
+    Приводит индексы коллекции DAO к объявленным в dao.indexes.
+
+    Создаёт недостающие, ничего не удаляет. Расхождения опций и лишние
+    индексы только попадают в отчёт — их исправление остаётся ручным.
+    """
+    report = {"created": [], "drift": [], "extra": [], "errors": [], "duplicates": {}}
+    existing = await dao.collection.index_information()
+    by_key = {tuple(tuple(k) for k in info["key"]): name for name, info in existing.items()}
+
+    to_create: List[IndexModel] = []
+    declared_names = set()
+    for model in dao.indexes:
+        document = model.document
+        name = document["name"]
+        declared_names.add(name)
+
+        current_name = name if name in existing else by_key.get(tuple(document["key"].items()))
+        if current_name is None:
+            to_create.append(model)
+            continue
+
+        drift = _index_drift(document, existing[current_name])
+        if current_name != name:
+            drift.insert(0, f"exists as {current_name}")
+        if drift:
+            report["drift"].append(f"{name}: {'; '.join(drift)}")
+
+    report["extra"] = sorted(set(existing) - declared_names - {"_id_"}
+                             - {by_key.get(tuple(m.document["key"].items())) for m in dao.indexes})
+
+    if any(_is_unique_case_insensitive(model) for model in to_create):
+        # Перед построением уникального индекса приводим существующие значения к виду,
+        # в котором их пишут роутеры
+        report["duplicates"] = (await normalize_unique_values(dao)).get("duplicates", {})
+
+    for model in to_create:
+        # По одному, чтобы ошибка одного индекса не мешала остальным
+        try:
+            report["created"].extend(await dao.collection.create_indexes([model]))
+        except OperationFailure as e:
+            report["errors"].append(f"{model.document['name']}: {e}")
+
+    return report
+
+
+async def ensure_indexes(daos: Optional[List[Type[MongoDAO]]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Идемпотентно создаёт объявленные индексы всех DAO и логирует расхождения.
+    Вызывается из lifespan при старте приложения.
+    """
+    reports = {}
+    for dao in daos or registered_daos():
+        name = dao.collection.name
+        try:
+            report = await ensure_dao_indexes(dao)
+        except Exception as e:
+            logger.error(f"Error ensuring indexes for {name}: {str(e)}", exc_info=True)
+            continue
+
+        reports[name] = report
+        if report["created"]:
+            logger.info(f"Indexes created for {name}: {report['created']}")
+        for line in report["drift"]:
+            logger.warning(f"Index drift in {name}: {line}")
+        if report["extra"]:
+            logger.warning(f"Undeclared indexes in {name}: {report['extra']}")
+        for line in report["errors"]:
+            logger.error(f"Index build failed in {name}: {line}")
+        for field, values in report["duplicates"].items():
+            logger.error(f"Case-insensitive duplicates in {name}.{field}: {values}")
+    return reports
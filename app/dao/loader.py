@@ -0,0 +1,55 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Set, Type
+
+from app.dao.base import MongoDAO
+from app.dao.indexes import registered_daos
+
+
+def dao_for_collection(name: str) -> Optional[Type[MongoDAO]]:
+    """DAO коллекции, если он объявлен, — через него работают реплика и кэш чтений."""
+    for dao in registered_daos():
+        if dao.collection.name == name:
+            return dao
+    return None
+
+
+class BatchLoader:
+    """
+    Загрузчик связанных документов в духе DataLoader: живёт в пределах одного
+    запроса, копит нужные _id по коллекциям и загружает каждую коллекцию
+    одним запросом {"_id": {"$in": [...]}} вместо $lookup на каждый документ.
+
+    Коллекции с DAO читаются через find_all — из реплики в памяти или кэша,
+    если они включены; остальные — напрямую из базы.
+    """
+
+    def __init__(self, database, projections: Optional[Dict[str, Dict]] = None):
+        self.database = database
+        self.projections = projections or {}
+        self._pending: Dict[str, Set[Any]] = defaultdict(set)
+        self._loaded: Dict[str, Dict[Any, Dict]] = defaultdict(dict)
+
+    def want(self, collection: str, ids: Iterable[Any]) -> None:
+        loaded = self._loaded[collection]
+        self._pending[collection].update(i for i in ids if i is not None and i not in loaded)
+
+    async def load(self) -> None:
+        pending, self._pending = self._pending, defaultdict(set)
+        collections = [name for name, ids in pending.items() if ids]
+        results = await asyncio.gather(*(
+            self._fetch(name, list(pending[name])) for name in collections
+        ))
+        for name, documents in zip(collections, results):
+            self._loaded[name].update((doc["_id"], doc) for doc in documents)
+
+    async def _fetch(self, collection: str, ids: list) -> list:
+        query = {"_id": {"$in": ids}}
+        projection = self.projections.get(collection)
+        dao = dao_for_collection(collection)
+        if dao is not None:
+            return await dao.find_all(query, projection, limit=0)
+        return await self.database[collection].find(query, projection).to_list(None)
+
+    def get(self, collection: str, object_id: Any) -> Optional[Dict]:
+        return self._loaded[collection].get(object_id)
@@ -0,0 +1,204 @@
+import json
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+
+from app.config import settings
+from app.logger import logger
+
+# Верхние границы корзин гистограммы латентности, мс (последняя корзина — всё, что дольше)
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Команды, которые относятся к данным; служебные (hello, ping, saslStart, ...) не учитываются
+MONITORED_COMMANDS = {
+    "find", "getMore", "aggregate", "count", "distinct",
+    "insert", "update", "delete", "findAndModify",
+}
+
+# Защита от разрастания словаря открытых курсоров, если курсоры бросают недочитанными
+_MAX_OPEN_CURSORS = 10_000
+
+
+def query_shape(value: Any) -> Any:
+    """Форма фильтра: ключи и операторы сохраняются, значения заменяются на "?"."""
+    if isinstance(value, dict):
+        return {key: query_shape(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Any:
+    """Нормализованная форма команды: по ней группируется статистика."""
+    if command_name == "find":
+        return {"filter": query_shape(command.get("filter", {})), "sort": list(command.get("sort") or {})}
+    if command_name == "aggregate":
+        stages = []
+        for stage in command.get("pipeline", []):
+            name = next(iter(stage), None)
+            stages.append({name: query_shape(stage[name])} if name == "$match" else name)
+        return stages
+    if command_name in ("count", "distinct"):
+        return {"query": query_shape(command.get("query", {})), "key": command.get("key")}
+    if command_name == "findAndModify":
+        return {"query": query_shape(command.get("query", {})), "sort": list(command.get("sort") or {})}
+    if command_name == "update":
+        return [query_shape(update.get("q", {})) for update in command.get("updates", [])[:1]]
+    if command_name == "delete":
+        return [query_shape(delete.get("q", {})) for delete in command.get("deletes", [])[:1]]
+    return None
+
+
+class QueryStats:
+    """Накопленная статистика одной формы запроса."""
+
+    __slots__ = ("count", "failures", "total_ms", "max_ms", "documents", "bytes", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.documents = 0
+        self.bytes = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, duration_ms: float, documents: int, size: int) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.documents += documents
+        self.bytes += size
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        bucket_names = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "totalMs": round(self.total_ms, 3),
+            "avgMs": round(self.total_ms / self.count, 3) if self.count else 0,
+            "maxMs": round(self.max_ms, 3),
+            "documents": self.documents,
+            "bytes": self.bytes,
+            "histogram": dict(zip(bucket_names, self.histogram)),
+        }
+
+
+class MongoCommandMonitor(monitoring.CommandListener):
+    """
+    Собирает латентность, число документов и размер ответа по ключу
+    (коллекция, команда, форма запроса) и пишет в лог медленные запросы.
+    Размер ответа (measure_bytes) требует повторного bson.encode каждого
+    ответа, поэтому по умолчанию выключен и bytes остаётся 0.
+
+    Motor выполняет операции pymongo в пуле потоков, поэтому колбэки
+    вызываются из разных потоков — общее состояние защищено блокировкой.
+    getMore учитывается под формой исходного find/aggregate.
+    """
+
+    def __init__(self, slow_query_ms: int, measure_bytes: bool = False):
+        self.slow_query_ms = slow_query_ms
+        self.measure_bytes = measure_bytes
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[Tuple[str, str, str], Optional[int]]] = {}
+        self._cursors: Dict[int, Tuple[str, str, str]] = {}
+        self._stats: Dict[Tuple[str, str, str], QueryStats] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+        command = event.command
+        cursor_id = None
+        if event.command_name == "getMore":
+            cursor_id = command.get("getMore")
+            with self._lock:
+                key = self._cursors.get(cursor_id)
+            if key is None:
+                key = (str(command.get("collection")), "getMore", "null")
+        else:
+            shape = command_shape(event.command_name, command)
+            key = (str(command.get(event.command_name)), event.command_name,
+                   json.dumps(shape, ensure_ascii=False, default=str))
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (key, cursor_id)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        key, requested_cursor_id = pending
+
+        reply = event.reply
+        cursor = reply.get("cursor") or {}
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        documents = len(batch) if batch is not None else int(reply.get("n", 0) or 0)
+        size = len(bson.encode(reply)) if self.measure_bytes else 0
+        duration_ms = event.duration_micros / 1000
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats()
+            stats.record(duration_ms, documents, size)
+
+            # Запоминаем форму открытого курсора для последующих getMore
+            cursor_id = cursor.get("id")
+            if cursor_id:
+                if len(self._cursors) >= _MAX_OPEN_CURSORS:
+                    self._cursors.clear()
+                self._cursors[cursor_id] = key
+            elif requested_cursor_id is not None:
+                self._cursors.pop(requested_cursor_id, None)
+
+        if duration_ms >= self.slow_query_ms:
+            collection, command_name, shape = key
+            logger.warning("Slow Mongo query", extra={
+                "collection": collection,
+                "command": command_name,
+                "shape": shape,
+                "duration_ms": round(duration_ms, 3),
+                "documents": documents,
+            })
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is not None:
+                key = pending[0]
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = QueryStats()
+                stats.failures += 1
+
+    def top(self, limit: int = 20, order_by: str = "totalMs") -> List[Dict[str, Any]]:
+        """Самые медленные формы запросов с момента старта воркера."""
+        with self._lock:
+            rows = [
+                {"collection": collection, "command": command_name, "shape": json.loads(shape), **stats.as_dict()}
+                for (collection, command_name, shape), stats in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+command_monitor: Optional[MongoCommandMonitor] = (
+    MongoCommandMonitor(
+        slow_query_ms=settings.MONGO_SLOW_QUERY_MS,
+        measure_bytes=settings.MONGO_MONITOR_REPLY_BYTES,
+    )
+    if settings.MONGO_COMMAND_MONITORING else None
+)
@@ -0,0 +1,238 @@
+import asyncio
+import copy
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.config import settings
+from app.logger import logger
+
+# Ответ «реплика не может обслужить запрос» — вызывающий идёт в Mongo
+UNSUPPORTED = object()
+
+# Коды ошибок, после которых возобновить поток по токену нельзя — нужна полная пересинхронизация
+_RESYNC_ERROR_CODES = {
+    260,  # InvalidResumeToken
+    280,  # ChangeStreamFatalError
+    286,  # ChangeStreamHistoryLost
+}
+# Change stream недоступен (standalone mongod) — реплика не запускается
+_UNSUPPORTED_ERROR_CODES = {40573}
+
+replicas: Dict[str, "CollectionReplica"] = {}
+
+
+def normalize_name(value: Any) -> Any:
+    return value.strip().casefold() if isinstance(value, str) else value
+
+
+def _is_id_in(field: str, value: Any) -> bool:
+    return field == "_id" and isinstance(value, dict) and list(value) == ["$in"] and isinstance(value["$in"], list)
+
+
+def _matches(doc: Mapping, query: Mapping) -> bool:
+    for field, expected in query.items():
+        value = doc.get(field)
+        if _is_id_in(field, expected):
+            if value not in expected["$in"]:
+                return False
+        elif isinstance(value, list):
+            if expected != value and expected not in value:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _project(doc: Mapping, projection: Optional[Mapping]) -> Dict[str, Any]:
+    if not projection:
+        return copy.deepcopy(dict(doc))
+    result = {"_id": doc["_id"]} if projection.get("_id", 1) else {}
+    for field, include in projection.items():
+        if include and field != "_id" and field in doc:
+            result[field] = copy.deepcopy(doc[field])
+    return result
+
+
+def _is_simple_query(query: Mapping) -> bool:
+    """
+    Только равенства по полям верхнего уровня и {"_id": {"$in": [...]}} (пакетная
+    загрузка связей) — их реплика вычисляет так же, как Mongo.
+    """
+    return all(
+        _is_id_in(field, value)
+        or (not field.startswith("$") and "." not in field and not isinstance(value, dict))
+        for field, value in query.items()
+    )
+
+
+def _is_inclusion_projection(projection: Optional[Mapping]) -> bool:
+    if not projection:
+        return True
+    return all(
+        field == "_id" or (include in (1, True) and "." not in field)
+        for field, include in projection.items()
+    )
+
+
+class CollectionReplica:
+    """
+    Полная копия небольшой коллекции в памяти воркера, поддерживаемая change stream.
+
+    Снимок неизменяем: каждое изменение строит новые словари и подменяет ссылки,
+    поэтому чтения не видят частично применённых изменений. Пока реплика
+    синхронизируется (или сразу после записи через DAO этого процесса) ready
+    возвращает False, и DAO читает из Mongo.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self._by_id: Mapping[Any, Mapping] = MappingProxyType({})
+        self._by_name: Mapping[Any, Tuple[Mapping, ...]] = MappingProxyType({})
+        self._resume_token: Optional[Mapping] = None
+        self._synced = False
+        self._hold_until = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._synced and time.monotonic() >= self._hold_until
+
+    def hold(self, seconds: float) -> None:
+        """
+        Временно отправляет чтения в Mongo: запись этого процесса дойдёт до реплики
+        через change stream с небольшой задержкой, а читать свою запись нужно сразу.
+        """
+        self._hold_until = max(self._hold_until, time.monotonic() + seconds)
+
+    def _swap(self, by_id: Dict[Any, Mapping]) -> None:
+        by_name: Dict[Any, List[Mapping]] = {}
+        for doc in by_id.values():
+            by_name.setdefault(normalize_name(doc.get("name")), []).append(doc)
+        self._by_id = MappingProxyType(by_id)
+        self._by_name = MappingProxyType({name: tuple(docs) for name, docs in by_name.items()})
+
+    def _apply(self, change: Mapping) -> None:
+        operation = change["operationType"]
+        if operation in ("insert", "update", "replace"):
+            document = change.get("fullDocument")
+            by_id = dict(self._by_id)
+            if document is None:
+                # Документ удалён раньше, чем сервер успел его прочитать (updateLookup)
+                by_id.pop(change["documentKey"]["_id"], None)
+            else:
+                by_id[document["_id"]] = MappingProxyType(document)
+            self._swap(by_id)
+        elif operation == "delete":
+            by_id = dict(self._by_id)
+            by_id.pop(change["documentKey"]["_id"], None)
+            self._swap(by_id)
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self._synced = False
+
+    async def _load(self) -> None:
+        documents = await self.collection.find({}).sort("_id", 1).to_list(None)
+        self._swap({doc["_id"]: MappingProxyType(doc) for doc in documents})
+
+    async def run(self, reconnect_delay: float = 1.0) -> None:
+        """
+        Загружает коллекцию и применяет изменения из change stream.
+        Поток открывается до загрузки, поэтому изменения, сделанные во время
+        загрузки, не теряются (повторное применение идемпотентно). После обрыва
+        поток возобновляется с сохранённого resume token без перезагрузки.
+        """
+        while True:
+            try:
+                async with self.collection.watch(
+                        full_document="updateLookup", resume_after=self._resume_token
+                ) as stream:
+                    if not self._synced:
+                        await self._load()
+                        self._synced = True
+                        logger.info(f"Replica of {self.name} loaded: {len(self._by_id)} documents")
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self._apply(change)
+                        self._resume_token = stream.resume_token
+                        if not self._synced:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _UNSUPPORTED_ERROR_CODES:
+                    logger.warning(f"Change streams unavailable, replica of {self.name} disabled: {str(e)}")
+                    return
+                if e.code in _RESYNC_ERROR_CODES:
+                    logger.warning(f"Replica of {self.name} lost its resume point, resyncing: {str(e)}")
+                    self._resume_token = None
+                    self._synced = False
+                else:
+                    logger.error(f"Replica of {self.name} stream failed: {str(e)}", exc_info=True)
+            except PyMongoError as e:
+                logger.warning(f"Replica of {self.name} stream interrupted: {str(e)}")
+            if not self._synced:
+                self._resume_token = None
+            await asyncio.sleep(reconnect_delay)
+
+    def find_one(self, query: Mapping, projection: Optional[Mapping] = None) -> Any:
+        """Документ по равенствам полей, None — если нет; UNSUPPORTED — запрос нужно выполнить в Mongo."""
+        if not self.ready or not _is_simple_query(query) or not _is_inclusion_projection(projection):
+            return UNSUPPORTED
+        for doc in self._candidates(query):
+            if _matches(doc, query):
+                return _project(doc, projection)
+        return None
+
+    def find_all(
+            self,
+            query: Mapping,
+            projection: Optional[Mapping] = None,
+            skip: int = 0,
+            limit: int = 100,
+            sort: Optional[List[tuple]] = None,
+    ) -> Any:
+        if not self.ready or not _is_simple_query(query) or not _is_inclusion_projection(projection):
+            return UNSUPPORTED
+        documents = [doc for doc in self._candidates(query) if _matches(doc, query)]
+        try:
+            # Многоключевая сортировка — стабильные сортировки от младшего ключа к старшему;
+            # отсутствующее поле (null) в Mongo меньше любого значения
+            for field, direction in reversed(sort or []):
+                documents.sort(
+                    key=lambda doc: (doc.get(field) is not None, doc.get(field)),
+                    reverse=direction == -1,
+                )
+        except TypeError:
+            # Разнотипные значения Mongo сравнивает по своим правилам — отдаём запрос ему
+            return UNSUPPORTED
+        end = skip + limit if limit else None
+        return [_project(doc, projection) for doc in documents[skip:end]]
+
+    def _candidates(self, query: Mapping):
+        if "_id" in query:
+            ids = query["_id"]["$in"] if _is_id_in("_id", query["_id"]) else [query["_id"]]
+            docs = (self._by_id.get(i) for i in dict.fromkeys(ids))
+            return tuple(doc for doc in docs if doc is not None)
+        if "name" in query:
+            return self._by_name.get(normalize_name(query["name"]), ())
+        return self._by_id.values()
+
+
+def get_replica(collection_name: str) -> Optional[CollectionReplica]:
+    return replicas.get(collection_name)
+
+
+async def run_replicas(daos) -> None:
+    """Запускает реплики для DAO с replicated = True (из lifespan)."""
+    if not settings.REPLICAS_ENABLED:
+        return
+    for dao in daos:
+        if dao.replicated:
+            replicas[dao.collection.name] = CollectionReplica(dao.collection)
+    try:
+        await asyncio.gather(*(replica.run() for replica in replicas.values()))
+    finally:
+        replicas.clear()
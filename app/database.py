@@ -1,14 +1,51 @@
+import asyncio
+
 from motor.motor_asyncio import AsyncIOMotorClient
 # from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 from app.config import settings
+from app.dao.monitoring import command_monitor
 
 # engine = create_async_engine(settings.DATABASE_URL)
 # async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-client_mongo = AsyncIOMotorClient(settings.MONGO_URL)
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    """
+    Клиент Mongo с настройками пула из Settings.
+    Создание не открывает соединений — они открываются при первом запросе или в warm_up_mongo.
+    """
+    return AsyncIOMotorClient(
+        settings.MONGO_URL,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        compressors=settings.MONGO_COMPRESSORS,
+        event_listeners=[command_monitor] if command_monitor else [],
+    )
+
+
+client_mongo = create_mongo_client()
 database_mongo = client_mongo.jaremybase
 
 
+async def warm_up_mongo() -> None:
+    """
+    Проверяет доступность Mongo и заранее открывает minPoolSize соединений,
+    чтобы первые запросы после рестарта воркера не платили за handshake и auth.
+    """
+    await client_mongo.admin.command("ping")
+    # Параллельные ping'и заставляют пул открыть сразу несколько соединений
+    await asyncio.gather(*(
+        client_mongo.admin.command("ping") for _ in range(settings.MONGO_MIN_POOL_SIZE)
+    ))
+
+
+def close_mongo() -> None:
+    client_mongo.close()
+
+
 class Base(DeclarativeBase):
     pass
@@ -1,15 +1,82 @@
-from typing import Optional, Dict, List, Any
+import asyncio
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Union, Tuple, NamedTuple, Iterable, AsyncIterator
 
 from bson import ObjectId
+from pymongo import IndexModel, UpdateOne
 
 from app.dao.base import MongoDAO
+from app.dao.count_mode import parse_count_mode
+from app.dao.cursor import apply_keyset
+from app.dao.loader import BatchLoader
 from app.database import database_mongo
-from app.deals.shemas import PaginatedResponse
+from app.deals.pricing import COMPUTED_FIELDS, FINANCIAL_INPUTS, compute_financials, manager_percent
+from app.deals.rollup import DealStatsDailyDAO, ROLLUP_FIELDS, ROLLUP_KEY
 from app.logger import logger
 
 
+class DealRelation(NamedTuple):
+    local_field: str  # поле сделки со ссылкой
+    collection: str
+    fields: Tuple[str, ...]  # поля связанного объекта в ответе (_id — всегда)
+
+    @property
+    def projection(self) -> Dict[str, int]:
+        return {field: 1 for field in self.fields}
+
+
 class DealsDAO(MongoDAO):
     collection = database_mongo["deals"]
+    # Списки почти всегда фильтруются по deletedAt = null, поэтому основные индексы частичные
+    indexes = [
+        IndexModel([("createdAt", -1), ("_id", -1)], name="createdAt_active",
+                   partialFilterExpression={"deletedAt": None}),
+        IndexModel([("userId", 1), ("createdAt", -1), ("_id", -1)], name="userId_createdAt_active",
+                   partialFilterExpression={"deletedAt": None}),
+        IndexModel([("userId", 1), ("_id", 1)], name="userId_id_active",
+                   partialFilterExpression={"deletedAt": None}),
+        IndexModel([("customerId", 1), ("createdAt", -1)], name="customerId_createdAt"),
+        IndexModel([("stageId", 1), ("createdAt", -1)], name="stageId_createdAt"),
+        # Аналитика: равенство по измерению + диапазон createdAt
+        IndexModel([("materialId", 1), ("createdAt", -1)], name="materialId_createdAt"),
+        IndexModel([("serviceId", 1), ("createdAt", -1)], name="serviceId_createdAt"),
+        IndexModel([("deletedAt", 1)], name="deletedAt"),
+    ]
+
+    # Реестр связей сделки (include=...): поле в ответе -> откуда и какие поля подгружать
+    relations: Dict[str, DealRelation] = {
+        "service": DealRelation("serviceId", "services", ("name",)),
+        "customer": DealRelation("customerId", "companies", ("name", "inn")),
+        "stage": DealRelation("stageId", "stages", ("name", "order")),
+        "material": DealRelation("materialId", "materials", ("name",)),
+        "shipping_address": DealRelation("shippingAddressId", "adresses",
+                                         ("companyId", "coordinates", "cityId", "adressDetail", "typeAdress")),
+        "delivery_address": DealRelation("deliveryAddressId", "adresses",
+                                         ("companyId", "coordinates", "cityId", "adressDetail", "typeAdress")),
+        # Без hashed_password и прочих служебных полей пользователя
+        "user": DealRelation("userId", "users", ("name", "lastName", "fatherName", "email")),
+    }
+    # Связи, снимок которых {_id, name} хранится в самой сделке: списки и карточка
+    # показывают названия без подгрузки связей
+    snapshot_relations: Tuple[str, ...] = ("service", "customer", "stage", "material", "user")
+
+    # Аналитика (analytics): измерения группировки и меры
+    analytics_dimensions: Dict[str, Any] = {
+        "userId": "$userId",
+        "materialId": "$materialId",
+        "customerId": "$customerId",
+        "serviceId": "$serviceId",
+        "stageId": "$stageId",
+        "day": {"$dateTrunc": {"date": "$createdAt", "unit": "day"}},
+        "month": {"$dateTrunc": {"date": "$createdAt", "unit": "month"}},
+        "week": {"$dateTrunc": {"date": "$createdAt", "unit": "week", "startOfWeek": "monday"}},
+    }
+    analytics_measures: Dict[str, Any] = {
+        "totalAmount": {"$sum": "$totalAmount"},
+        "companyProfit": {"$sum": "$companyProfit"},
+        "quantity": {"$sum": "$quantity"},
+        "count": {"$sum": 1},
+    }
 
     @classmethod
     async def find_paginated1(
@@ -19,42 +86,64 @@ class DealsDAO(MongoDAO):
             skip: int = 0,
             limit: int = 100,
             sort: Optional[List[tuple]] = None,
-            include_relations: bool = False,  # Новый параметр для включения связей
+            include_relations: bool = False,  # все связи из реестра relations
+            cursor: Optional[str] = None,  # nextCursor предыдущей страницы (keyset-пагинация)
+            use_facet: Optional[bool] = None,  # None — $facet только для первой страницы с точным total
+            count_mode: str = "exact",  # exact | capped:N | estimated | none
+            relation_strategy: str = "batch",  # batch — $in по коллекциям, lookup — $lookup в агрегации
+            include: Optional[List[str]] = None,  # только перечисленные связи
             **kwargs,
-    ) -> PaginatedResponse:
-        """Find documents with pagination metadata."""
+    ) -> Dict[str, Any]:
+        """
+        Find documents with pagination metadata.
+
+        При count_mode="exact" без cursor страница и total считаются одной
+        агрегацией через $facet: точный total всё равно читает всю выборку.
+        Остальные режимы и keyset-страницы идут через count + find, чтобы
+        не пропускать через $facet все подходящие документы и искать место
+        курсора по индексу. Связи подгружаются пакетно после выборки страницы
+        (resolve_relations) в обоих случаях; relation_strategy="lookup"
+        оставляет $lookup в агрегации и поэтому всегда идёт через $facet.
+        """
         try:
             query = filter_by or {}
             query.update(kwargs)
 
-            if include_relations:
-                # Используем агрегацию для загрузки связанных объектов
-                return await cls._find_paginated_with_relations(
+            relations = cls.select_relations(include_relations, include)
+            lookup_relations = bool(relations) and relation_strategy == "lookup"
+            if use_facet is None:
+                use_facet = (parse_count_mode(count_mode)[0] == "exact" and not cursor) or lookup_relations
+
+            if use_facet:
+                # Одна агрегация: страница (опционально со связями) и total
+                return await cls._find_paginated_facet(
                     query=query,
+                    projection=projection,
                     skip=skip,
                     limit=limit,
-                    sort=sort
+                    sort=sort,
+                    cursor=cursor,
+                    relations=relations,
+                    lookup_relations=lookup_relations,
+                    count_mode=count_mode
                 )
             else:
-                # Стандартный подход без связей
+                # count_documents + find, связи — пакетной загрузкой
                 return await cls._find_paginated_simple(
                     query=query,
                     projection=projection,
                     skip=skip,
                     limit=limit,
-                    sort=sort
+                    sort=sort,
+                    cursor=cursor,
+                    relations=relations,
+                    count_mode=count_mode
                 )
 
         except Exception as e:
             logger.error(f"Error finding paginated documents: {str(e)}", exc_info=True)
-            return PaginatedResponse(
-                items=[],
-                total=0,
-                page=1,
-                page_size=limit,
-                total_pages=0,
-                has_next=False,
-                has_prev=False
+            return cls._build_paginated_response(
+                items=[], total=0, skip=0, limit=limit, sort=[], cursor=None
             )
 
     @classmethod
@@ -65,177 +154,614 @@ class DealsDAO(MongoDAO):
             skip: int = 0,
             limit: int = 100,
             sort: Optional[List[tuple]] = None,
-    ) -> PaginatedResponse:
-        """Простая пагинация без связанных объектов"""
+            cursor: Optional[str] = None,
+            relations: Optional[List[str]] = None,
+            count_mode: str = "exact",
+    ) -> Dict[str, Any]:
+        """Простая пагинация: count_documents + find, связи — пакетной загрузкой"""
         # Получаем общее количество документов
-        total = await cls.collection.count_documents(query)
-
-        # Получаем данные с пагинацией
-        cursor = cls.collection.find(query, projection)
+        total, total_exact = await cls._count_total(query, count_mode)
 
-        if sort:
-            cursor = cursor.sort(sort)
+        page_query, page_sort = apply_keyset(query, sort, cursor)
 
-        cursor = cursor.skip(skip).limit(limit)
-        items = [doc async for doc in cursor]
+        if projection and relations:
+            projection = {**projection, **{field: 1 for field in cls._relation_local_fields(relations)}}
 
-        # Конвертируем ObjectId в строки для сериализации
-        items = cls._convert_objectids_to_str(items)
+        # Получаем данные с пагинацией (limit + 1 — признак следующей страницы)
+        db_cursor = cls.collection.find(page_query, projection).sort(page_sort)
+        if not cursor:
+            db_cursor = db_cursor.skip(skip)
+        db_cursor = db_cursor.limit(limit + 1 if limit > 0 else 0)
+        items = [doc async for doc in db_cursor]
+        if relations:
+            await cls.resolve_relations(items, relations)
+        cls._normalize_unit_measurement(items)
 
-        # Вычисляем метаданные пагинации
-        page = (skip // limit) + 1 if limit > 0 else 1
-        total_pages = (total + limit - 1) // limit if limit > 0 else 1
-        has_next = page < total_pages
-        has_prev = page > 1
-
-        return PaginatedResponse(
+        return cls._build_paginated_response(
             items=items,
             total=total,
-            page=page,
-            page_size=limit,
-            total_pages=total_pages,
-            has_next=has_next,
-            has_prev=has_prev
+            total_exact=total_exact,
+            skip=skip,
+            limit=limit,
+            sort=page_sort,
+            cursor=cursor,
         )
 
     @classmethod
-    async def _find_paginated_with_relations(
+    async def _find_paginated_facet(
             cls,
             query: Dict,
+            projection: Optional[Dict] = None,
             skip: int = 0,
             limit: int = 100,
             sort: Optional[List[tuple]] = None,
-    ) -> PaginatedResponse:
-        """Пагинация с загрузкой связанных объектов через агрегацию"""
-        # Получаем общее количество документов
-        total = await cls.collection.count_documents(query)
-
-        # Строим пайплайн агрегации
-        pipeline = [{"$match": query}]
+            cursor: Optional[str] = None,
+            relations: Optional[List[str]] = None,
+            lookup_relations: bool = False,
+            count_mode: str = "exact",
+    ) -> Dict[str, Any]:
+        """
+        Пагинация через $facet: фильтр применяется один раз,
+        страница и общее количество возвращаются одной агрегацией.
+        Связи подгружаются пакетно после агрегации, при lookup_relations — $lookup внутри неё.
+        """
+        mode, cap = parse_count_mode(count_mode)
+        predicate, page_sort = apply_keyset({}, sort, cursor)
 
-        # Добавляем сортировку
-        if sort:
-            pipeline.append({"$sort": dict(sort)})
+        # Ветка со страницей: keyset-условие, пагинация, проекция и связи
+        items_pipeline = []
+        if predicate:
+            items_pipeline.append({"$match": predicate})
+        if not cursor and skip:
+            items_pipeline.append({"$skip": skip})
+        if limit > 0:
+            # limit + 1 — признак следующей страницы
+            items_pipeline.append({"$limit": limit + 1})
+        if projection:
+            if relations:
+                # Ключи связей должны пережить $project, иначе $lookup ничего не найдёт
+                projection = {**projection, **{field: 1 for field in cls._relation_local_fields(relations)}}
+            items_pipeline.append({"$project": projection})
+        if lookup_relations:
+            items_pipeline.extend(cls._get_relation_lookups(relations))
 
-        # Добавляем пагинацию
-        pipeline.extend([
-            {"$skip": skip},
-            {"$limit": limit}
-        ])
+        facets = {"items": items_pipeline}
+        if mode == "exact" or (mode == "estimated" and query):
+            facets["total"] = [{"$count": "count"}]
+        elif mode == "capped":
+            facets["total"] = [{"$limit": cap}, {"$count": "count"}]
 
-        # Добавляем lookup'ы для связанных объектов
-        pipeline.extend(cls._get_relation_lookups())
-
-        # Выполняем агрегацию
-        items = await cls.aggregate(pipeline)
+        # $sort до $facet, чтобы сортировка шла по индексу
+        pipeline = [
+            {"$match": query},
+            {"$sort": dict(page_sort)},
+            {"$facet": facets},
+        ]
 
-        # Конвертируем ObjectId в строки
-        items = cls._convert_objectids_to_str(items)
+        result = await cls.aggregate(pipeline)
+        facet = result[0] if result else {}
+        items = facet.get("items", [])
+        if relations and not lookup_relations:
+            await cls.resolve_relations(items, relations)
+        cls._normalize_unit_measurement(items)
 
-        # Вычисляем метаданные пагинации
-        page = (skip // limit) + 1 if limit > 0 else 1
-        total_pages = (total + limit - 1) // limit if limit > 0 else 1
-        has_next = page < total_pages
-        has_prev = page > 1
+        if "total" in facets:
+            total = facet["total"][0]["count"] if facet.get("total") else 0
+            total_exact = mode != "capped" or total < cap
+        else:
+            # estimated без фильтра — метаданные коллекции; none — только нижняя граница
+            total, total_exact = await cls._count_total(query, count_mode)
 
-        return PaginatedResponse(
+        return cls._build_paginated_response(
             items=items,
             total=total,
-            page=page,
-            page_size=limit,
-            total_pages=total_pages,
-            has_next=has_next,
-            has_prev=has_prev
+            total_exact=total_exact,
+            skip=skip,
+            limit=limit,
+            sort=page_sort,
+            cursor=cursor,
+        )
+
+    @classmethod
+    def select_relations(cls, include_relations: bool = False, include: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Имена связей для подгрузки: include — явный список, include_relations — все.
+
+        Raises:
+            ValueError: если в include есть связь, которой нет в реестре
+        """
+        if include:
+            unknown = [name for name in include if name not in cls.relations]
+            if unknown:
+                raise ValueError(f"Неизвестные связи: {', '.join(unknown)}")
+            return list(dict.fromkeys(include))
+        return list(cls.relations) if include_relations else []
+
+    @classmethod
+    def _relation_local_fields(cls, relations: Optional[Iterable[str]] = None) -> List[str]:
+        """Поля сделки, по которым подтягиваются связанные объекты."""
+        names = cls.relations if relations is None else relations
+        return list(dict.fromkeys(cls.relations[name].local_field for name in names))
+
+    @classmethod
+    def _relation_projections(cls, relations: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """Проекции по коллекциям; связи из одной коллекции получают объединение полей."""
+        projections: Dict[str, Dict[str, int]] = {}
+        for name in relations:
+            relation = cls.relations[name]
+            projections.setdefault(relation.collection, {}).update(relation.projection)
+        return projections
+
+    @classmethod
+    async def resolve_relations(
+            cls,
+            items: List[Dict[str, Any]],
+            relations: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Подставляет связанные объекты в сделки на месте: собирает ссылки всей
+        страницы и загружает каждую коллекцию одним $in-запросом (BatchLoader),
+        вместо $lookup на каждую сделку. Загружаются только поля из реестра.
+        Ненайденной связи в сделке нет, как после $lookup; сохранённый снимок
+        {_id, name} при этом остаётся.
+        """
+        names = list(cls.relations if relations is None else relations)
+        loader = BatchLoader(cls.collection.database, projections=cls._relation_projections(names))
+        for name in names:
+            relation = cls.relations[name]
+            loader.want(relation.collection, (item.get(relation.local_field) for item in items))
+        await loader.load()
+
+        for item in items:
+            for name in names:
+                relation = cls.relations[name]
+                related = loader.get(relation.collection, item.get(relation.local_field))
+                if related is not None:
+                    item[name] = related
+                elif name not in cls.snapshot_relations:
+                    item.pop(name, None)
+        return items
+
+    @classmethod
+    async def iterate_with_relations(
+            cls,
+            filter_by: Optional[Dict] = None,
+            sort: Optional[List[tuple]] = None,
+            relations: Optional[Iterable[str]] = None,
+            batch_size: int = 1000,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковое чтение сделок со связями: связи подгружаются пачками по batch_size,
+        поэтому память ограничена одной пачкой при любом размере выборки.
+        """
+        batch = []
+        async for doc in cls.iterate(filter_by, sort=sort, batch_size=batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await cls.resolve_relations(batch, relations)
+                for item in batch:
+                    yield item
+                batch = []
+        if batch:
+            await cls.resolve_relations(batch, relations)
+            for item in batch:
+                yield item
+
+    @classmethod
+    async def reference_snapshots(cls, document: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Снимки {_id, name} для ссылок, присутствующих в документе сделки,
+        — для записи вместе со сделкой. Ссылка на несуществующий объект пропускается.
+        """
+        present = {
+            name: cls.relations[name] for name in cls.snapshot_relations
+            if document.get(cls.relations[name].local_field) is not None
+        }
+        loader = BatchLoader(
+            cls.collection.database,
+            projections={relation.collection: {"name": 1} for relation in present.values()}
         )
+        for relation in present.values():
+            loader.want(relation.collection, [document[relation.local_field]])
+        await loader.load()
+
+        snapshots = {}
+        for name, relation in present.items():
+            related = loader.get(relation.collection, document[relation.local_field])
+            if related is not None:
+                snapshots[name] = {"_id": related["_id"], "name": related.get("name")}
+        return snapshots
 
     @classmethod
-    def _get_relation_lookups(cls) -> List[Dict]:
-        """Возвращает список lookup'ов для связанных объектов"""
+    def unresolved_references(cls, document: Dict[str, Any], snapshots: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Поля ссылок документа, для которых reference_snapshots не нашёл объект."""
         return [
+            cls.relations[name].local_field for name in cls.snapshot_relations
+            if document.get(cls.relations[name].local_field) is not None and name not in snapshots
+        ]
+
+    @classmethod
+    async def refresh_snapshots(cls, relation: str, object_id: Union[str, ObjectId], name: Optional[str]) -> int:
+        """
+        Обновляет снимок переименованного объекта во всех сделках, которые на него
+        ссылаются (фоновая задача роутеров справочников). Возвращает число изменённых сделок.
+        """
+        if isinstance(object_id, str):
+            object_id = ObjectId(object_id)
+        local_field = cls.relations[relation].local_field
+        return await cls.update_many(
+            {local_field: object_id, f"{relation}.name": {"$ne": name}},
+            {relation: {"_id": object_id, "name": name}},
+        )
+
+    @classmethod
+    async def check_snapshots(cls, repair: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Находит сделки, у которых снимок связи отсутствует или не совпадает с текущим
+        названием объекта. Один проход $group по сделкам на связь, затем текущие
+        названия одним $in; при repair=True расхождения исправляются через refresh_snapshots.
+        """
+        report = {}
+        for relation in cls.snapshot_relations:
+            local_field, collection, _ = cls.relations[relation]
+            pairs = await cls.collection.aggregate([
+                {"$match": {local_field: {"$ne": None}}},
+                {"$group": {"_id": {"ref": f"${local_field}", "name": f"${relation}.name"}}},
+            ], allowDiskUse=True).to_list(None)
+
+            loader = BatchLoader(cls.collection.database, projections={collection: {"name": 1}})
+            loader.want(collection, {pair["_id"]["ref"] for pair in pairs})
+            await loader.load()
+
+            drifted = {}
+            for pair in pairs:
+                related = loader.get(collection, pair["_id"]["ref"])
+                if related is not None and pair["_id"].get("name") != related.get("name"):
+                    drifted[related["_id"]] = related.get("name")
+
+            repaired = 0
+            if repair:
+                for object_id, name in drifted.items():
+                    repaired += await cls.refresh_snapshots(relation, object_id, name)
+            report[relation] = {"drifted": len(drifted), "repaired": repaired}
+        return report
+
+    @classmethod
+    async def manager_percents(cls, user_ids: Iterable[Any]) -> Dict[Any, Optional[float]]:
+        """Проценты менеджеров (users.profit) одним $in-запросом."""
+        loader = BatchLoader(cls.collection.database, projections={"users": {"profit": 1}})
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        loader.want("users", user_ids)
+        await loader.load()
+        return {
+            user_id: manager_percent((loader.get("users", user_id) or {}).get("profit"))
+            for user_id in user_ids
+        }
+
+    @classmethod
+    async def financials(cls, deal: Dict[str, Any]) -> Dict[str, Optional[float]]:
+        """Финансовые показатели полной сделки с процентом её менеджера."""
+        percents = await cls.manager_percents([deal.get("userId")])
+        return compute_financials(deal, percents.get(deal.get("userId")))
+
+    @classmethod
+    async def add(cls, document: Dict) -> Optional[Dict[str, Any]]:
+        """Вставка сделки с рассчитанными на сервере финансовыми показателями и учётом в сводке."""
+        document.update(await cls.financials(document))
+        result = await super().add(document)
+        if result:
+            await DealStatsDailyDAO.apply_changes([(None, result)])
+        return result
+
+    @classmethod
+    async def update_by_id(
+            cls,
+            object_id: Union[str, ObjectId],
+            update_data: Dict,
+            upsert: bool = False,
+            return_document: bool = True,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Обновление сделки. Если меняются исходные данные расчёта, показатели
+        пересчитываются по сделке с учётом изменений и записываются тем же $set.
+        Если меняются поля сводки (в т.ч. deletedAt при софт-удалении), сводка
+        получает разницу между документом до и после обновления.
+        """
+        if isinstance(object_id, str):
+            object_id = ObjectId(object_id)
+        if any(field in update_data for field in (*FINANCIAL_INPUTS, *COMPUTED_FIELDS)):
+            for field in COMPUTED_FIELDS:
+                update_data.pop(field, None)
+            current = await cls.collection.find_one({"_id": object_id}, {field: 1 for field in FINANCIAL_INPUTS})
+            if current is not None or upsert:
+                update_data.update(await cls.financials({**(current or {}), **update_data}))
+
+        if not any(field in update_data for field in ROLLUP_FIELDS):
+            return await super().update_by_id(object_id, update_data, upsert=upsert, return_document=return_document)
+
+        # Документ до изменения отдаёт тот же findAndModify; после — он же с применённым $set
+        before = await super().update_by_id(object_id, update_data, upsert=upsert, return_document=False)
+        if before is not None:
+            after = {**before, **update_data}
+        elif upsert:
+            after = await cls.collection.find_one({"_id": object_id})
+        else:
+            return None
+        await DealStatsDailyDAO.apply_changes([(before, after)])
+        return after if return_document else before
+
+    @staticmethod
+    def _written_fields(operation: Dict) -> set:
+        """Поля, которые операция может записать: data и поля $setOnInsert у upsert."""
+        return {*(operation.get("data") or {}), *(operation.get("set_on_insert") or {})}
+
+    @classmethod
+    def _affects_rollup(cls, operation: Dict) -> bool:
+        fields = cls._written_fields(operation)
+        return operation.get("op") in ("insert", "delete") or any(
+            field in fields for field in (*ROLLUP_FIELDS, *FINANCIAL_INPUTS)
+        )
+
+    @classmethod
+    async def bulk_write(
+            cls,
+            operations: List[Dict],
+            batch_size: int = 500,
+            deleted_at_field: str = "deletedAt",
+    ) -> List[Dict[str, Any]]:
+        """
+        bulk_write с пересчётом показателей у сделок, исходные данные которых изменились,
+        и обновлением сводки: состояние затронутых сделок читается одним запросом
+        до записи и одним после неё.
+        """
+        for operation in operations:
+            for field in COMPUTED_FIELDS:
+                (operation.get("data") or {}).pop(field, None)
+
+        projection = {field: 1 for field in ROLLUP_FIELDS}
+        tracked = [operation for operation in operations if cls._affects_rollup(operation)]
+        ids = [
+            ObjectId(operation["id"]) for operation in tracked
+            if operation.get("op") != "insert" and ObjectId.is_valid(str(operation.get("id")))
+        ]
+        # Фильтры upsert — только равенства, как их проверяет MongoDAO.bulk_write
+        filters = [
+            operation["filter"] for operation in tracked
+            if operation.get("op") == "upsert" and operation.get("filter") and not any(
+                key.startswith("$") or isinstance(value, dict) for key, value in operation["filter"].items()
+            )
+        ]
+        conditions = ([{"_id": {"$in": ids}}] if ids else []) + filters
+        before = {}
+        if conditions:
+            before = {doc["_id"]: doc async for doc in cls.collection.find({"$or": conditions}, projection)}
+
+        results = await super().bulk_write(operations, batch_size=batch_size, deleted_at_field=deleted_at_field)
+        changed = [
+            ObjectId(result["id"])
+            for operation, result in zip(operations, results)
+            if result["ok"] and result["id"] and operation.get("op") != "delete"
+            and any(field in cls._written_fields(operation) for field in FINANCIAL_INPUTS)
+        ]
+        if changed:
+            await cls.recompute_financials({"_id": {"$in": changed}}, batch_size=batch_size, rollup=False)
+
+        written = list(dict.fromkeys(
+            ObjectId(result["id"])
+            for operation, result in zip(operations, results)
+            if result["ok"] and result["id"] and cls._affects_rollup(operation)
+        ))
+        if written:
+            after = {doc["_id"]: doc async for doc in cls.collection.find({"_id": {"$in": written}}, projection)}
+            await DealStatsDailyDAO.apply_changes((before.get(i), after.get(i)) for i in written)
+        return results
+
+    @classmethod
+    async def recompute_financials(
+            cls,
+            filter_by: Optional[Dict] = None,
+            batch_size: int = 1000,
+            rollup: bool = True,
+    ) -> Dict[str, int]:
+        """
+        Пересчитывает показатели сделок по фильтру (по умолчанию — всех) пачками:
+        проценты менеджеров пачки — одним запросом, запись — одним bulk_write
+        только для сделок, у которых значения изменились. rollup=False — сводку
+        обновит вызывающий.
+        """
+        projection = {field: 1 for field in (*FINANCIAL_INPUTS, *COMPUTED_FIELDS, *ROLLUP_FIELDS)}
+        report = {"checked": 0, "updated": 0}
+
+        async def flush(batch: List[Dict[str, Any]]) -> None:
+            percents = await cls.manager_percents(deal.get("userId") for deal in batch)
+            requests, changes = [], []
+            for deal in batch:
+                values = compute_financials(deal, percents.get(deal.get("userId")))
+                if any(deal.get(field) != value for field, value in values.items()):
+                    requests.append(UpdateOne({"_id": deal["_id"]}, {"$set": values}))
+                    changes.append((deal, {**deal, **values}))
+            if requests:
+                result = await cls.collection.bulk_write(requests, ordered=False)
+                report["updated"] += result.modified_count
+                if rollup:
+                    await DealStatsDailyDAO.apply_changes(changes)
+            report["checked"] += len(batch)
+
+        batch = []
+        async for deal in cls.collection.find(filter_by or {}, projection).batch_size(batch_size):
+            batch.append(deal)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+
+        if report["updated"]:
+            await cls.invalidate_cache()
+        logger.info(f"Deal financials recomputed: {report}")
+        return report
+
+    @classmethod
+    async def rebuild_daily_stats(cls) -> int:
+        """Пересобирает сводку deal_stats_daily из всех сделок."""
+        return await DealStatsDailyDAO.rebuild(cls.collection)
+
+    @classmethod
+    def _dimension_relations(cls, group_by: List[str]) -> List[Tuple[str, str]]:
+        """(измерение, связь) для ссылочных измерений, у которых в сделке хранится снимок названия."""
+        return [
+            (dimension, name)
+            for dimension in group_by
+            for name in cls.snapshot_relations
+            if cls.relations[name].local_field == dimension
+        ]
+
+    @classmethod
+    def _analytics_pipeline(cls, query: Dict, group_by: List[str], measures: List[str]) -> List[Dict]:
+        """
+        $match -> $group -> $sort. Для ссылочных измерений название берётся
+        из снимка связи в сделке ({relation}.name), без $lookup.
+        """
+        group: Dict[str, Any] = {"_id": {dimension: cls.analytics_dimensions[dimension] for dimension in group_by}}
+        group.update({measure: cls.analytics_measures[measure] for measure in measures})
+        group.update({
+            f"{name}Name": {"$first": f"${name}.name"}
+            for _, name in cls._dimension_relations(group_by)
+        })
+
+        return [
+            {"$match": query},
+            {"$group": group},
+            {"$sort": {f"_id.{dimension}": 1 for dimension in group_by}},
+            # Измерения — полями строки рядом с мерами
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$$ROOT", "$_id"]}}},
+            {"$unset": "_id"},
+        ]
+
+    @staticmethod
+    def _rollup_query(
+            filter_by: Dict,
+            date_from: Optional[datetime],
+            date_to: Optional[datetime],
+    ) -> Optional[Dict]:
+        """
+        Фильтр для сводки deal_stats_daily или None, если запрос ей не отвечает:
+        нужны только неудалённые сделки, фильтры — по полям ключа сводки,
+        границы периода — на начало суток.
+        """
+        filters = dict(filter_by)
+        if "deletedAt" not in filters or filters.pop("deletedAt") is not None:
+            return None
+        if not set(filters) <= set(ROLLUP_KEY[1:]):
+            return None
+        for value in (date_from, date_to):
+            if value is not None and (value.tzinfo is not None or value != datetime(value.year, value.month, value.day)):
+                return None
+        if date_from or date_to:
+            filters["day"] = {
+                **({"$gte": date_from} if date_from else {}),
+                **({"$lt": date_to} if date_to else {}),
+            }
+        return filters
+
+    @classmethod
+    async def _rollup_breakdown(cls, query: Dict, group_by: List[str], measures: List[str]) -> List[Dict[str, Any]]:
+        """Разрез по сводке; названия ссылок подгружаются одним $in на коллекцию."""
+        rows = await DealStatsDailyDAO.breakdown(query, group_by, measures)
+        dimension_relations = cls._dimension_relations(group_by)
+        if rows and dimension_relations:
+            loader = BatchLoader(cls.collection.database, projections={
+                cls.relations[name].collection: {"name": 1} for _, name in dimension_relations
+            })
+            for dimension, name in dimension_relations:
+                loader.want(cls.relations[name].collection, (row.get(dimension) for row in rows))
+            await loader.load()
+            for row in rows:
+                for dimension, name in dimension_relations:
+                    related = loader.get(cls.relations[name].collection, row.get(dimension))
+                    row[f"{name}Name"] = related.get("name") if related else None
+        return rows
+
+    @classmethod
+    async def analytics(
+            cls,
+            filter_by: Dict,
+            breakdowns: List[List[str]],
+            measures: Optional[List[str]] = None,
+            date_from: Optional[datetime] = None,
+            date_to: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Сводные показатели сделок за период [date_from, date_to) в нескольких
+        разрезах. Разрезы выполняются параллельно; фильтр (в т.ч. по менеджеру)
+        общий для всех.
+
+        Разрез, который можно посчитать по сводке deal_stats_daily (измерения
+        и фильтры из её ключа, период по целым дням), читает только её — время
+        ответа не растёт с числом сделок. Остальные — агрегация по сделкам с allowDiskUse.
+
+        Raises:
+            ValueError: неизвестное измерение или мера
+        """
+        measures = list(dict.fromkeys(measures or cls.analytics_measures))
+        unknown = [name for name in measures if name not in cls.analytics_measures]
+        unknown += [name for group_by in breakdowns for name in group_by if name not in cls.analytics_dimensions]
+        if unknown:
+            raise ValueError(f"Неизвестные измерения или меры: {', '.join(unknown)}")
+
+        rollup_query = cls._rollup_query(filter_by, date_from, date_to)
+        query = dict(filter_by)
+        if date_from or date_to:
+            query["createdAt"] = {
+                **({"$gte": date_from} if date_from else {}),
+                **({"$lt": date_to} if date_to else {}),
+            }
+
+        async def breakdown(group_by: List[str]) -> Dict[str, Any]:
+            if rollup_query is not None and all(
+                    dimension in DealStatsDailyDAO.dimensions for dimension in group_by
+            ) and all(measure in DealStatsDailyDAO.measures for measure in measures):
+                rows = await cls._rollup_breakdown(rollup_query, group_by, measures)
+                return {"groupBy": group_by, "source": "rollup", "rows": rows}
+            rows = await cls.collection.aggregate(
+                cls._analytics_pipeline(query, group_by, measures), allowDiskUse=True
+            ).to_list(None)
+            return {"groupBy": group_by, "source": "deals", "rows": rows}
+
+        return list(await asyncio.gather(*(breakdown(group_by) for group_by in breakdowns)))
+
+    @classmethod
+    def _get_relation_lookups(cls, relations: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        $lookup для связанных объектов (relation_strategy="lookup"): localField/foreignField
+        идут по индексу _id, вложенный pipeline оставляет только поля из реестра.
+        """
+        names = list(cls.relations if relations is None else relations)
+        stages = [
             {
                 "$lookup": {
-                    "from": "services",
-                    "localField": "serviceId",
-                    "foreignField": "_id",
-                    "as": "service"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "customers",
-                    "localField": "customerId",
-                    "foreignField": "_id",
-                    "as": "customer"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "stages",
-                    "localField": "stageId",
-                    "foreignField": "_id",
-                    "as": "stage"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "materials",
-                    "localField": "materialId",
-                    "foreignField": "_id",
-                    "as": "material"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "addresses",
-                    "localField": "shippingAddressId",
-                    "foreignField": "_id",
-                    "as": "shipping_address"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "addresses",
-                    "localField": "deliveryAddressId",
-                    "foreignField": "_id",
-                    "as": "delivery_address"
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "userId",
+                    "from": cls.relations[name].collection,
+                    "localField": cls.relations[name].local_field,
                     "foreignField": "_id",
-                    "as": "user"
-                }
-            },
-            {
-                "$addFields": {
-                    "service": {"$arrayElemAt": ["$service", 0]},
-                    "customer": {"$arrayElemAt": ["$customer", 0]},
-                    "stage": {"$arrayElemAt": ["$stage", 0]},
-                    "material": {"$arrayElemAt": ["$material", 0]},
-                    "shipping_address": {"$arrayElemAt": ["$shipping_address", 0]},
-                    "delivery_address": {"$arrayElemAt": ["$delivery_address", 0]},
-                    "user": {"$arrayElemAt": ["$user", 0]},
+                    "pipeline": [{"$project": cls.relations[name].projection}],
+                    "as": name
                 }
             }
+            for name in names
         ]
+        stages.append({
+            "$addFields": {name: {"$arrayElemAt": [f"${name}", 0]} for name in names}
+        })
+        return stages
 
     @classmethod
-    def _convert_objectids_to_str(cls, data: Any) -> Any:
-        """Рекурсивно конвертирует ObjectId в строки"""
-        if isinstance(data, ObjectId):
-            return str(data)
-        elif isinstance(data, dict):
-            result = {}
-            for key, value in data.items():
-                # Специальная обработка для unitMeasurement
-                if key == "unitMeasurement" and (value == "" or value is None):
-                    result[key] = None
-                else:
-                    result[key] = cls._convert_objectids_to_str(value)
-            return result
-        elif isinstance(data, list):
-            return [cls._convert_objectids_to_str(item) for item in data]
-        else:
-            return data
+    def _normalize_unit_measurement(cls, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Замена пустого unitMeasurement на None (в сделке и в подставленных связях),
+        на месте и без копирования документов.
+        """
+        for item in items:
+            for doc in (item, *(value for value in item.values() if isinstance(value, dict))):
+                if doc.get("unitMeasurement") == "":
+                    doc["unitMeasurement"] = None
+        return items
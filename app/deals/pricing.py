@@ -0,0 +1,101 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Mapping, Optional
+
+# Поля, вводимые вручную, от которых зависят финансовые показатели сделки
+FINANCIAL_INPUTS = (
+    "quantity",
+    "amountPurchaseUnit",
+    "amountSalesUnit",
+    "amountDelivery",
+    "addExpenses",
+    "ndsPercent",
+    "userId",
+)
+
+# Показатели, которые считает сервер; присланные клиентом значения игнорируются
+COMPUTED_FIELDS = (
+    "amountPurchaseTotal",
+    "amountSalesTotal",
+    "companyProfit",
+    "managerProfit",
+    "ndsAmount",
+    "totalAmount",
+)
+
+_CENT = Decimal("0.01")
+
+
+def _number(value: Any) -> Optional[Decimal]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return Decimal(str(value))
+    except ArithmeticError:
+        return None
+
+
+def _money(value: Optional[Decimal]) -> Optional[float]:
+    return float(value.quantize(_CENT, rounding=ROUND_HALF_UP)) if value is not None else None
+
+
+def manager_percent(profit: Optional[Mapping]) -> Optional[float]:
+    """Процент менеджера от маржи фирмы из users.profit ({"percent": 10})."""
+    if not profit:
+        return None
+    percent = _number(profit.get("percent"))
+    return float(percent) if percent is not None else None
+
+
+def expenses_total(add_expenses: Any) -> Decimal:
+    """Сумма дополнительных расходов [{name, amount}]; строки без суммы пропускаются."""
+    total = Decimal(0)
+    for expense in add_expenses or []:
+        if isinstance(expense, Mapping):
+            amount = _number(expense.get("amount"))
+            if amount is not None:
+                total += amount
+    return total
+
+
+def compute_financials(deal: Mapping, percent: Optional[float] = None) -> Dict[str, Optional[float]]:
+    """
+    Финансовые показатели сделки:
+
+    - amountPurchaseTotal = quantity * amountPurchaseUnit
+    - amountSalesTotal = quantity * amountSalesUnit
+    - companyProfit = amountSalesTotal - amountPurchaseTotal - amountDelivery - addExpenses
+    - managerProfit = companyProfit * percent / 100
+    - totalAmount = amountSalesTotal + amountDelivery
+    - ndsAmount — НДС, входящий в totalAmount: totalAmount * ndsPercent / (100 + ndsPercent)
+
+    Показатель, для которого не хватает данных, равен None. Суммы округляются до копеек.
+    """
+    quantity = _number(deal.get("quantity"))
+    purchase_unit = _number(deal.get("amountPurchaseUnit"))
+    sales_unit = _number(deal.get("amountSalesUnit"))
+    delivery = _number(deal.get("amountDelivery")) or Decimal(0)
+    nds_percent = _number(deal.get("ndsPercent"))
+    manager = _number(percent)
+
+    purchase_total = quantity * purchase_unit if quantity is not None and purchase_unit is not None else None
+    sales_total = quantity * sales_unit if quantity is not None and sales_unit is not None else None
+
+    company_profit = None
+    if sales_total is not None and purchase_total is not None:
+        company_profit = sales_total - purchase_total - delivery - expenses_total(deal.get("addExpenses"))
+
+    manager_profit = company_profit * manager / 100 if company_profit is not None and manager is not None else None
+    total_amount = sales_total + delivery if sales_total is not None else None
+
+    nds_amount = None
+    if total_amount is not None and nds_percent is not None and nds_percent > -100:
+        nds_amount = total_amount * nds_percent / (100 + nds_percent)
+
+    return {
+        "amountPurchaseTotal": _money(purchase_total),
+        "amountSalesTotal": _money(sales_total),
+        "companyProfit": _money(company_profit),
+        "managerProfit": _money(manager_profit),
+        "ndsAmount": _money(nds_amount),
+        "totalAmount": _money(total_amount),
+    }
@@ -0,0 +1,149 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from pymongo import IndexModel, UpdateOne
+
+from app.dao.base import MongoDAO
+from app.database import database_mongo
+from app.logger import logger
+
+# Ключ строки сводки: день создания сделки и ссылки, по которым строятся дашборды
+ROLLUP_KEY = ("day", "userId", "materialId", "serviceId", "stageId")
+# Суммируемые поля сделки; count — число сделок
+ROLLUP_SUMS = ("totalAmount", "companyProfit", "quantity")
+# Поля сделки, изменение которых меняет сводку
+ROLLUP_FIELDS = ("createdAt", "deletedAt", *ROLLUP_KEY[1:], *ROLLUP_SUMS)
+
+
+def _day(value: Any) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        # Mongo хранит время в UTC, как и $dateTrunc при пересборке
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(value.year, value.month, value.day)
+
+
+def _amount(value: Any) -> float:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def contribution(deal: Optional[Mapping]) -> Optional[Tuple[Tuple, Dict[str, float]]]:
+    """Ключ строки и вклад сделки в сводку; None — сделка не учитывается (удалена или без даты)."""
+    if not deal or deal.get("deletedAt") is not None:
+        return None
+    day = _day(deal.get("createdAt"))
+    if day is None:
+        return None
+    key = (day, *(deal.get(field) for field in ROLLUP_KEY[1:]))
+    values = {field: _amount(deal.get(field)) for field in ROLLUP_SUMS}
+    values["count"] = 1
+    return key, values
+
+
+class DealStatsDailyDAO(MongoDAO):
+    """
+    Сводка сделок по дням (deal_stats_daily): строка на (day, userId, materialId,
+    serviceId, stageId) с суммами. Поддерживается инкрементально — DealsDAO
+    передаёт пары (до, после) изменённых сделок, и строки получают $inc на разницу.
+    Запросы дашбордов читают только сводку: её размер зависит от числа дней
+    и комбинаций ссылок, а не от числа сделок.
+    """
+    collection = database_mongo["deal_stats_daily"]
+    indexes = [
+        IndexModel([(field, 1) for field in ROLLUP_KEY], name="key_unique", unique=True),
+        IndexModel([("userId", 1), ("day", 1)], name="userId_day"),
+    ]
+
+    dimensions: Dict[str, Any] = {
+        "userId": "$userId",
+        "materialId": "$materialId",
+        "serviceId": "$serviceId",
+        "stageId": "$stageId",
+        "day": "$day",
+        "month": {"$dateTrunc": {"date": "$day", "unit": "month"}},
+        "week": {"$dateTrunc": {"date": "$day", "unit": "week", "startOfWeek": "monday"}},
+    }
+    measures: Dict[str, Any] = {
+        **{field: {"$sum": f"${field}"} for field in ROLLUP_SUMS},
+        "count": {"$sum": "$count"},
+    }
+
+    @classmethod
+    async def apply_changes(cls, changes: Iterable[Tuple[Optional[Mapping], Optional[Mapping]]]) -> None:
+        """
+        Применяет изменения сделок: для каждой пары (до, после) вычитает старый
+        вклад и добавляет новый. Дельты по одной строке складываются, строки
+        пишутся одним bulk_write с upsert.
+        """
+        deltas: Dict[Tuple, Dict[str, float]] = {}
+
+        def add(item, sign):
+            if item is None:
+                return
+            key, values = item
+            row = deltas.setdefault(key, dict.fromkeys(values, 0))
+            for field, value in values.items():
+                row[field] += sign * value
+
+        for before, after in changes:
+            add(contribution(before), -1)
+            add(contribution(after), 1)
+
+        requests = [
+            UpdateOne(dict(zip(ROLLUP_KEY, key)), {"$inc": values}, upsert=True)
+            for key, values in deltas.items()
+            if any(values.values())
+        ]
+        if not requests:
+            return
+        try:
+            await cls.collection.bulk_write(requests, ordered=False)
+        except Exception as e:
+            # Сводку восстанавливает rebuild; запись сделки из-за неё не падает
+            logger.error(f"Error updating deal_stats_daily: {str(e)}", exc_info=True)
+
+    @classmethod
+    async def rebuild(cls, deals_collection) -> int:
+        """
+        Пересобирает сводку из сделок одной агрегацией с $out: новая коллекция
+        подменяет старую целиком, индексы сохраняются. Изменения сделок,
+        пришедшие во время пересборки, могут не попасть в результат.
+        """
+        key = {"day": {"$dateTrunc": {"date": "$createdAt", "unit": "day"}}}
+        key.update({field: {"$ifNull": [f"${field}", None]} for field in ROLLUP_KEY[1:]})
+        await deals_collection.aggregate([
+            {"$match": {"deletedAt": None, "createdAt": {"$type": "date"}}},
+            {"$group": {
+                "_id": key,
+                **{field: {"$sum": f"${field}"} for field in ROLLUP_SUMS},
+                "count": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0,
+                **{field: f"$_id.{field}" for field in ROLLUP_KEY},
+                **{field: 1 for field in (*ROLLUP_SUMS, "count")},
+            }},
+            {"$out": cls.collection.name},
+        ], allowDiskUse=True).to_list(None)
+        rows = await cls.collection.count_documents({})
+        logger.info(f"deal_stats_daily rebuilt: {rows} rows")
+        return rows
+
+    @classmethod
+    async def breakdown(cls, query: Dict, group_by: List[str], measures: List[str]) -> List[Dict[str, Any]]:
+        """Строки разреза по сводке — в том же виде, что и аналитика по сделкам."""
+        pipeline = [
+            {"$match": query},
+            {"$group": {
+                "_id": {dimension: cls.dimensions[dimension] for dimension in group_by},
+                **{measure: cls.measures[measure] for measure in measures},
+                "count": cls.measures["count"],
+            }},
+            # Строки, обнулившиеся после удаления сделок, в ответ не попадают
+            {"$match": {"count": {"$gt": 0}}},
+            {"$sort": {f"_id.{dimension}": 1 for dimension in group_by}},
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$$ROOT", "$_id"]}}},
+            {"$unset": ["_id"] if "count" in measures else ["_id", "count"]},
+        ]
+        return await cls.collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
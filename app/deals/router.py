@@ -1,15 +1,21 @@
-import json
+import csv
+import io
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, AsyncIterator, List
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import StreamingResponse
 from starlette import status
 
+from app.bulk import stream_bulk_results
+from app.dao.count_mode import COUNT_MODE_PATTERN
+from app.dao.cursor import check_cursor
 from app.deals.dao import DealsDAO
 from app.deals.shemas import SDeals, SDealsAdd, SDealsWithRelations, PaginatedResponse, PaginationParams
 from app.logger import logger
+from app.projection import fields_param, fields_projection
+from app.responses import FastJSONResponse, dumps
 from app.users.dependencies import get_current_user
 
 router = APIRouter(
@@ -18,189 +24,284 @@ router = APIRouter(
 )
 
 
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        return super().default(obj)
-
-
 # @router.get("/{id}", response_model=SDeals, summary="Получить материал по ID")
 async def get_deal(id: str, user=Depends(get_current_user)) -> SDeals:
     result = await DealsDAO.find_one_or_none(_id=ObjectId(id))
     return result
 
 
+def _deals_filter(data: SDeals, user, include_deleted: bool) -> dict:
+    """Фильтр списка сделок: менеджер видит только свои сделки, удалённые скрыты."""
+    if not hasattr(user, 'admin') or user.admin == False:
+        logger.info('is_admin')
+        data.userId = ObjectId(user.id)
+    filter_data = data.model_dump(exclude_none=True)
+
+    if not include_deleted:
+        filter_data["deletedAt"] = None
+    return filter_data
+
+
+def _parse_include(include: Optional[str]) -> Optional[List[str]]:
+    """include=service,stage -> ["service", "stage"]; имена сверяются с реестром DealsDAO.relations."""
+    if not include:
+        return None
+    try:
+        return DealsDAO.select_relations(include=[name.strip() for name in include.split(",") if name.strip()])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+INCLUDE_DESCRIPTION = f"Связи через запятую: {', '.join(DealsDAO.relations)}"
+
+
+def _deals_sort(sort_by: Optional[str], sort_order: Optional[str]) -> Optional[list]:
+    if not sort_by:
+        return None
+    order = 1 if sort_order == "asc" else -1
+    return [(sort_by, order)]
+
+
+def _check_cursor(sort: Optional[list], cursor: Optional[str]) -> None:
+    """Курсор от другой сортировки — 400, а не пустая страница."""
+    try:
+        check_cursor(sort, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.get("", response_model=PaginatedResponse, summary="Получить список материалов")
 async def get_deals(
         pagination: PaginationParams = Depends(),
         sortBy: Optional[str] = Query(None, description="Поле для сортировки"),
         sortOrder: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Порядок сортировки"),
-        includeRelations: bool = Query(False, description="Включать связанные объекты"),  # Новый параметр
+        includeRelations: bool = Query(False, description="Включать все связанные объекты"),
+        include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
         includeDeleted: bool = Query(False, description="(deletedAt = null)"),
+        countMode: str = Query("exact", regex=COUNT_MODE_PATTERN,
+                               description="Подсчёт total: exact | capped:N | estimated | none"),
+        fields: Optional[List[str]] = Depends(fields_param(SDeals)),
+        fastJson: bool = Query(False, deprecated=True,
+                               description="Не используется: список всегда сериализуется orjson"),
         data: SDeals = Depends(),
         user=Depends(get_current_user)
-) -> PaginatedResponse:
-    if not hasattr(user, 'admin') or user.admin == False:
-        logger.info('is_admin')
-        data.userId = ObjectId(user.id)
-    filter_data = data.model_dump(exclude_none=True)
-
-    if not includeDeleted:
-        filter_data["deletedAt"] = None
+) -> FastJSONResponse:
+    filter_data = _deals_filter(data, user, includeDeleted)
 
     # Подготавливаем параметры сортировки
-    sort = None
-    if sortBy:
-        order = 1 if sortOrder == "asc" else -1
-        sort = [(sortBy, order)]
+    sort = _deals_sort(sortBy, sortOrder)
+    _check_cursor(sort, pagination.cursor)
+
+    # Поле сортировки нужно в выборке для nextCursor
+    projection = fields_projection([*fields, sortBy] if fields and sortBy else fields)
 
     # Используем пагинированный запрос с опциональными связями
     result = await DealsDAO.find_paginated1(
         filter_by=filter_data,
+        projection=projection,
         skip=pagination.skip,
         limit=pagination.limit,
         sort=sort,
-        include_relations=includeRelations  # Передаем параметр
+        include_relations=includeRelations,
+        include=_parse_include(include),
+        cursor=pagination.cursor,
+        count_mode=countMode
     )
 
-    return result
+    # Схема ответа — PaginatedResponse (response_model), но документы пишутся в байты
+    # за один проход, минуя модель и jsonable_encoder
+    return FastJSONResponse(content=result)
+
+
+# Размер пачки курсора при выгрузке: компромисс между числом getMore и памятью воркера
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_CSV_COLUMNS = ["_id", *dict.fromkeys([*SDeals.model_fields, *SDealsAdd.model_fields])]
+
+
+async def _export_ndjson(documents) -> AsyncIterator[bytes]:
+    async for doc in documents:
+        yield dumps(doc) + b"\n"
+
+
+def _csv_value(value):
+    if isinstance(value, (list, dict)):
+        return dumps(value).decode()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+async def _export_csv(documents, columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM — чтобы Excel открыл кириллицу в UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    async for doc in documents:
+        writer.writerow([_csv_value(doc.get(column)) for column in columns])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+@router.get(
+    "/export",
+    summary="Выгрузка сделок (NDJSON / CSV)",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"application/x-ndjson": {}, "text/csv": {}}
+        }
+    }
+)
+async def export_deals(
+        format: str = Query("ndjson", regex="^(ndjson|csv)$", description="Формат выгрузки"),
+        sortBy: Optional[str] = Query(None, description="Поле для сортировки"),
+        sortOrder: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Порядок сортировки"),
+        includeDeleted: bool = Query(False, description="(deletedAt = null)"),
+        fields: Optional[List[str]] = Depends(fields_param(SDeals)),
+        data: SDeals = Depends(),
+        user=Depends(get_current_user)
+):
+    """
+    Потоковая выгрузка сделок с теми же фильтрами и ограничением по менеджеру,
+    что и в списке. Строки пишутся в ответ по мере чтения курсора,
+    поэтому память воркера не зависит от размера выгрузки.
+    """
+    documents = DealsDAO.iterate(
+        filter_by=_deals_filter(data, user, includeDeleted),
+        projection=fields_projection(fields),
+        sort=_deals_sort(sortBy, sortOrder),
+        batch_size=EXPORT_BATCH_SIZE
+    )
+
+    if format == "csv":
+        columns = list(dict.fromkeys(["_id", *fields])) if fields else EXPORT_CSV_COLUMNS
+        return StreamingResponse(
+            _export_csv(documents, columns),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="deals.csv"'}
+        )
+    return StreamingResponse(
+        _export_ndjson(documents),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="deals.ndjson"'}
+    )
 
 
 @router.get("/admin/get", summary="Получить список сделок со связанными объектами")
-async def get_deals_for_admins(data: SDeals = Depends()):
-    # if not hasattr(user, 'admin') or user.admin == False:
-    #     raise HTTPException(status_code=403, detail="Доступ закрыт")
-
-    pipeline = [
-        {"$lookup": {
-            "from": "services",
-            "localField": "serviceId",
-            "foreignField": "_id",
-            "as": "service"
-        }},
-        {"$lookup": {
-            "from": "customers",
-            "localField": "customerId",
-            "foreignField": "_id",
-            "as": "customer"
-        }},
-        {"$lookup": {
-            "from": "stages",
-            "localField": "stageId",
-            "foreignField": "_id",
-            "as": "stage"
-        }},
-        {"$lookup": {
-            "from": "materials",
-            "localField": "materialId",
-            "foreignField": "_id",
-            "as": "material"
-        }},
-        {"$lookup": {
-            "from": "addresses",
-            "localField": "shippingAddressId",
-            "foreignField": "_id",
-            "as": "shipping_address"
-        }},
-        {"$lookup": {
-            "from": "addresses",
-            "localField": "deliveryAddressId",
-            "foreignField": "_id",
-            "as": "delivery_address"
-        }},
-        {"$lookup": {
-            "from": "users",
-            "localField": "userId",
-            "foreignField": "_id",
-            "as": "user"
-        }},
-        {"$addFields": {
-            "service": {"$arrayElemAt": ["$service", 0]},
-            "customer": {"$arrayElemAt": ["$customer", 0]},
-            "stage": {"$arrayElemAt": ["$stage", 0]},
-            "material": {"$arrayElemAt": ["$material", 0]},
-            "shipping_address": {"$arrayElemAt": ["$shipping_address", 0]},
-            "delivery_address": {"$arrayElemAt": ["$delivery_address", 0]},
-            "user": {"$arrayElemAt": ["$user", 0]},
-        }}
+async def get_deals_for_admins(
+        pagination: PaginationParams = Depends(),
+        sortBy: Optional[str] = Query(None, description="Поле для сортировки"),
+        sortOrder: Optional[str] = Query("asc", regex="^(asc|desc)$", description="Порядок сортировки"),
+        include: Optional[str] = Query(None, description=f"{INCLUDE_DESCRIPTION} (по умолчанию все)"),
+        includeDeleted: bool = Query(False, description="(deletedAt = null)"),
+        countMode: str = Query("exact", regex=COUNT_MODE_PATTERN,
+                               description="Подсчёт total: exact | capped:N | estimated | none"),
+        stream: bool = Query(False, description="Все подходящие сделки потоком NDJSON вместо страницы"),
+        data: SDeals = Depends(),
+        user=Depends(get_current_user)
+):
+    """
+    Сделки со связанными объектами: те же фильтры и ограничение по менеджеру, что и в списке.
+
+    По умолчанию — страница (keyset-пагинация через nextCursor): find с $sort и $limit
+    по индексу, без $facet даже при точном total, связи подгружаются только для
+    сделок страницы.
+    stream=true отдаёт всю выборку в NDJSON пачками, не собирая её в памяти воркера.
+    """
+    filter_data = _deals_filter(data, user, includeDeleted)
+    sort = _deals_sort(sortBy, sortOrder)
+    relations = _parse_include(include) or list(DealsDAO.relations)
+
+    if stream:
+        documents = DealsDAO.iterate_with_relations(
+            filter_by=filter_data,
+            sort=sort,
+            relations=relations,
+            batch_size=EXPORT_BATCH_SIZE
+        )
+        return StreamingResponse(_export_ndjson(documents), media_type="application/x-ndjson")
+
+    _check_cursor(sort, pagination.cursor)
+    result = await DealsDAO.find_paginated1(
+        filter_by=filter_data,
+        skip=pagination.skip,
+        limit=pagination.limit,
+        sort=sort,
+        include=relations,
+        cursor=pagination.cursor,
+        count_mode=countMode,
+        use_facet=False
+    )
+    # ObjectId, datetime и Decimal128 пишутся в байты за один проход
+    return FastJSONResponse(content=result)
+
+
+@router.get("/analytics", summary="Сводные показатели сделок")
+async def get_deals_analytics(
+        groupBy: List[str] = Query(
+            ["month"],
+            description="Разрез — измерения через запятую; параметр можно повторить для нескольких разрезов. "
+                        f"Измерения: {', '.join(DealsDAO.analytics_dimensions)}"
+        ),
+        measures: Optional[str] = Query(
+            None, description=f"Меры через запятую (по умолчанию все): {', '.join(DealsDAO.analytics_measures)}"
+        ),
+        dateFrom: Optional[datetime] = Query(None, description="Начало периода по createdAt (включительно)"),
+        dateTo: Optional[datetime] = Query(None, description="Конец периода по createdAt (не включительно)"),
+        includeDeleted: bool = Query(False, description="(deletedAt = null)"),
+        data: SDeals = Depends(),
+        user=Depends(get_current_user)
+):
+    """
+    Выручка, маржа, количество и число сделок в разрезе менеджеров, материалов,
+    заказчиков, услуг, этапов и месяцев/недель, например
+    groupBy=userId,month&groupBy=materialId. Менеджер видит только свои сделки.
+
+    Разрезы по менеджерам, материалам, услугам, этапам и дням/неделям/месяцам
+    за целые дни читаются из дневной сводки (source=rollup), остальные —
+    агрегацией по сделкам (source=deals).
+    """
+    breakdowns = [
+        [name.strip() for name in group_by.split(",") if name.strip()]
+        for group_by in groupBy
     ]
+    breakdowns = [group_by for group_by in breakdowns if group_by]
+    if not breakdowns:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Не указан разрез groupBy")
 
-    result = await DealsDAO.aggregate(pipeline)
-    # Сериализация ObjectId и datetime для JSON (как в get_deal_with_relations)
-    deal_list = [json.loads(json.dumps(doc, cls=CustomJSONEncoder, default=str)) for doc in result]
-    return JSONResponse(content=deal_list)
+    try:
+        result = await DealsDAO.analytics(
+            filter_by=_deals_filter(data, user, includeDeleted),
+            breakdowns=breakdowns,
+            measures=[name.strip() for name in measures.split(",") if name.strip()] if measures else None,
+            date_from=dateFrom,
+            date_to=dateTo,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return FastJSONResponse(content={"breakdowns": result})
 
 
 @router.get("/{id}",
             response_model=SDealsWithRelations,
             summary="Получить сделку с связанными объектами")
-async def get_deal_with_relations(id: str):
-    pipeline = [
-        {"$match": {"_id": ObjectId(id)}},
-        {"$lookup": {
-            "from": "services",
-            "localField": "serviceId",
-            "foreignField": "_id",
-            "as": "service"
-        }},
-        {"$lookup": {
-            "from": "customers",
-            "localField": "customerId",
-            "foreignField": "_id",
-            "as": "customer"
-        }},
-        {"$lookup": {
-            "from": "stages",
-            "localField": "stageId",
-            "foreignField": "_id",
-            "as": "stage"
-        }},
-        {"$lookup": {
-            "from": "materials",
-            "localField": "materialId",
-            "foreignField": "_id",
-            "as": "material"
-        }},
-        {"$lookup": {
-            "from": "addresses",
-            "localField": "shippingAddressId",
-            "foreignField": "_id",
-            "as": "shipping_address"
-        }},
-        {"$lookup": {
-            "from": "addresses",
-            "localField": "deliveryAddressId",
-            "foreignField": "_id",
-            "as": "delivery_address"
-        }},
-        {"$lookup": {
-            "from": "users",
-            "localField": "userId",
-            "foreignField": "_id",
-            "as": "user"
-        }},
-        {"$addFields": {
-            "service": {"$arrayElemAt": ["$service", 0]},
-            "customer": {"$arrayElemAt": ["$customer", 0]},
-            "stage": {"$arrayElemAt": ["$stage", 0]},
-            "material": {"$arrayElemAt": ["$material", 0]},
-            "shipping_address": {"$arrayElemAt": ["$shipping_address", 0]},
-            "delivery_address": {"$arrayElemAt": ["$delivery_address", 0]},
-            "user": {"$arrayElemAt": ["$user", 0]},
-        }}
-    ]
-
-    result = await DealsDAO.aggregate(pipeline)
+async def get_deal_with_relations(
+        id: str,
+        include: Optional[str] = Query(None, description=f"{INCLUDE_DESCRIPTION} (по умолчанию все)")
+):
+    result = await DealsDAO.find_one_or_none(_id=ObjectId(id))
     if not result:
         raise HTTPException(status_code=404, detail="Deal not found")
+    await DealsDAO.resolve_relations([result], _parse_include(include))
 
-    json_str = json.dumps(result[0], cls=CustomJSONEncoder, default=str)
-    deal_data = json.loads(json_str)
-
-    return JSONResponse(content=deal_data)
+    return FastJSONResponse(content=result)
 
 
 @router.post(
@@ -225,6 +326,8 @@ async def add_deal(data: SDealsAdd, user=Depends(get_current_user)):
         data.userId = ObjectId(user.id)
         data.createdAt = datetime.now()
         material_data = data.model_dump(exclude_none=True)
+        # Снимки {_id, name} связей — списки и карточка обходятся без подгрузки связей
+        material_data.update(await DealsDAO.reference_snapshots(material_data))
         result = await DealsDAO.add(document=material_data)
 
         if not result:
@@ -245,6 +348,47 @@ async def add_deal(data: SDealsAdd, user=Depends(get_current_user)):
         )
 
 
+@router.post(
+    "/bulk",
+    summary="Массовая загрузка сделок (NDJSON)",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Результат по каждой строке запроса (NDJSON)",
+            "content": {"application/x-ndjson": {}}
+        }
+    }
+)
+async def bulk_deals(request: Request, user=Depends(get_current_user)):
+    """
+    Массовая вставка, обновление, upsert и софт-удаление сделок.
+
+    Тело — NDJSON, по операции на строку:
+    {"op": "insert" | "update" | "upsert" | "delete", "id": ..., "filter": {...}, "data": {...}}
+
+    Новым сделкам, как и в add_deal, проставляются текущий менеджер и createdAt.
+    upsert, нашедший существующую сделку, их не меняет.
+    """
+    def prepare(operation: dict) -> dict:
+        if operation["op"] == "insert":
+            data = operation.setdefault("data", {})
+            data["userId"] = ObjectId(user.id)
+            data.setdefault("createdAt", datetime.now())
+        elif operation["op"] == "upsert":
+            data = operation.setdefault("data", {})
+            data.pop("userId", None)
+            operation["set_on_insert"] = {
+                "userId": ObjectId(user.id),
+                "createdAt": data.pop("createdAt", None) or datetime.now(),
+            }
+        return operation
+
+    return StreamingResponse(
+        stream_bulk_results(request, DealsDAO, SDealsAdd, prepare=prepare),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.patch(
     "/{id}",
     response_model=SDeals,
@@ -272,15 +416,6 @@ async def update_deal(
     - Не учитывает регистр при проверке уникальности
     """
     try:
-        # Проверяем существование материала
-        existing_material = await DealsDAO.find_one_or_none(_id=ObjectId(id))
-
-        if not existing_material:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Объект не найден"
-            )
-
         update_data = data.model_dump(exclude_none=True)
 
         # Фоновое логирование изменения
@@ -296,16 +431,27 @@ async def update_deal(
             }
         )
 
+        # Снимки для изменённых ссылок; ссылка в никуда оставила бы в сделке снимок прежнего объекта
+        snapshots = await DealsDAO.reference_snapshots(update_data)
+        unresolved = DealsDAO.unresolved_references(update_data, snapshots)
+        if unresolved:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Связанные объекты не найдены: {', '.join(unresolved)}"
+            )
+        update_data.update(snapshots)
+
         # Выполняем обновление
         result = await DealsDAO.update_by_id(
             object_id=id,
             update_data=update_data
         )
 
+        # None — документа с таким ID нет
         if not result:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Не удалось обновить объект"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Объект не найден"
             )
 
         return result
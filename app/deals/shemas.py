@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional, Any, List
 
 from bson import ObjectId
-from pydantic import BaseModel, field_validator, ConfigDict
+from pydantic import BaseModel, Field, field_validator, ConfigDict
 from pydantic.alias_generators import to_camel
 
 from app.base_schemas import PyObjectId, BaseMongoModel
@@ -16,6 +16,8 @@ class PaginatedResponse(BaseModel):
     total_pages: int
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None  # токен следующей страницы (keyset-пагинация)
+    total_exact: bool = True  # False — total оценочный или нижняя граница (countMode)
 
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -26,9 +28,14 @@ class PaginatedResponse(BaseModel):
     )
 
 
+# Страница собирается в памяти воркера целиком — больше отдаёт только потоковая выгрузка
+MAX_PAGE_SIZE = 1000
+
+
 class PaginationParams(BaseMongoModel):
-    page: int = 1
-    page_size: int = 100
+    page: int = Field(1, ge=1)
+    page_size: int = Field(100, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None  # nextCursor из предыдущего ответа, при наличии page игнорируется
 
     @property
     def skip(self) -> int:
@@ -65,6 +72,7 @@ class SDeals(BaseModel):
 
     paymentMethod: str | None = None  # способ оплаты заказчиком (нал, без нал)
     ndsPercent: float | None = None  # процент НДС
+    ndsAmount: float | None = None  # сумма НДС (динамическая)
     totalAmount: float | None = None  # общая сумма для заказчика (цена продажи + цена доставки) (динамическая)
 
     addExpenses: List[dict] | None = None  # дополнительные расходы (формат [{name: str, amount: float}])
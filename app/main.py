@@ -1,3 +1,4 @@
+import asyncio
 import time
 from contextlib import asynccontextmanager
 
@@ -7,6 +8,11 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from typing import Optional, List
 
+from app.admin.router import router as router_admin
+from app.dao.cache import close_cache, listen_invalidations
+from app.dao.indexes import ensure_indexes, registered_daos
+from app.dao.replica import run_replicas
+from app.database import warm_up_mongo, close_mongo
 from app.logger import logger
 from app.users.router import router as router_users
 from app.materials.router import router as router_materials
@@ -21,7 +27,25 @@ from app.adresses.router import router as router_adresses
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # при запуске
+    # соединения с Mongo открываются до того, как воркер начнёт принимать запросы
+    try:
+        await warm_up_mongo()
+    except Exception as e:
+        logger.error(f"Mongo warm-up failed: {str(e)}", exc_info=True)
+    # индексы строятся в фоне, воркер начинает принимать запросы сразу
+    indexes_task = asyncio.create_task(ensure_indexes())
+    # сброс in-process кэша справочников по сообщениям от других воркеров и Celery
+    invalidation_task = asyncio.create_task(listen_invalidations())
+    # справочники целиком в памяти, актуальность поддерживает change stream
+    replicas_task = asyncio.create_task(run_replicas(registered_daos()))
     yield
+    # при остановке
+    if not indexes_task.done():
+        indexes_task.cancel()
+    invalidation_task.cancel()
+    replicas_task.cancel()
+    close_mongo()
+    await close_cache()
 
 
 app = FastAPI(
@@ -49,6 +73,7 @@ app.include_router(router_services)
 app.include_router(router_stages)
 app.include_router(router_vehicles)
 app.include_router(router_adresses)
+app.include_router(router_admin)
 
 services = [
     {"_id": "1", "name": "продажа сырья"},
@@ -1,6 +1,7 @@
-from app.dao.base import MongoDAO
+from app.dao.base import ReferenceDAO, UNIQUE_NAME_INDEX
 from app.database import database_mongo
 
 
-class MaterialsDAO(MongoDAO):
+class MaterialsDAO(ReferenceDAO):
     collection = database_mongo["materials"]
+    indexes = [UNIQUE_NAME_INDEX]
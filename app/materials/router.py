@@ -1,9 +1,14 @@
-from typing import Optional
+from typing import Optional, List
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
+from pymongo.errors import DuplicateKeyError
 
+from app.bulk import stream_bulk_results
+from app.deals.dao import DealsDAO
 from app.logger import logger
+from app.projection import fields_param, fields_projection, sparse_response
 from app.materials.dao import MaterialsDAO
 from app.materials.shemas import SMaterials, SMaterialsAdd
 from app.users.dependencies import get_current_user
@@ -22,9 +27,17 @@ async def get_material(id: str) -> SMaterials:
 
 
 @router.get("", response_model=list[SMaterials], summary="Получить список материалов")
-async def get_materials(data: SMaterials = Depends()) -> list[
-    SMaterials]:
-    result = await MaterialsDAO.find_all(**data.model_dump(exclude_none=True), sort=[('name', 1)])
+async def get_materials(
+        data: SMaterials = Depends(),
+        fields: Optional[List[str]] = Depends(fields_param(SMaterials))
+) -> list[SMaterials]:
+    result = await MaterialsDAO.find_all(
+        **data.model_dump(exclude_none=True),
+        projection=fields_projection(fields), sort=[('name', 1)]
+    )
+    if fields:
+        # Только запрошенные поля — без null-заглушек для остальных
+        return sparse_response(result, SMaterials, fields)
     return result
 
 
@@ -72,6 +85,12 @@ async def add_material(data: SMaterialsAdd):
 
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        # Параллельный запрос успел создать запись с тем же именем
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Материал с таким именем уже существует"
+        )
     except Exception as e:
         logger.error(f"Ошибка при создании материала: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -80,6 +99,30 @@ async def add_material(data: SMaterialsAdd):
         )
 
 
+@router.post(
+    "/bulk",
+    summary="Массовая загрузка материалов (NDJSON)",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Результат по каждой строке запроса (NDJSON)",
+            "content": {"application/x-ndjson": {}}
+        }
+    }
+)
+async def bulk_materials(request: Request):
+    """
+    Массовая вставка, обновление, upsert и софт-удаление материалов.
+
+    Тело — NDJSON, по операции на строку:
+    {"op": "insert" | "update" | "upsert" | "delete", "id": ..., "filter": {...}, "data": {...}}
+    """
+    return StreamingResponse(
+        stream_bulk_results(request, MaterialsDAO, SMaterialsAdd),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.patch(
     "/{id}",
     response_model=SMaterials,
@@ -106,30 +149,9 @@ async def update_material(
     - Не учитывает регистр при проверке уникальности
     """
     try:
-        # Проверяем существование материала
-        existing_material = await MaterialsDAO.find_one_or_none(_id=ObjectId(id))
-
-        if not existing_material:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Материал не найден"
-            )
-
         update_data = data.model_dump(exclude_none=True)
 
-        if "name" in update_data:
-            # Проверка на уникальность
-            if not await MaterialsDAO.is_unique(
-                    field_name="name",
-                    value=data.name,
-                    exclude_id=id,
-                    case_sensitive=False,
-                    trim_spaces=True
-            ):
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Материал с таким именем уже существует"
-                )
+        # Уникальность имени обеспечивает индекс name_ci: конфликт придёт как DuplicateKeyError
 
         # Фоновое логирование изменения
         background_tasks.add_task(
@@ -150,16 +172,26 @@ async def update_material(
             update_data=update_data
         )
 
+        # None — документа с таким ID нет
         if not result:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Не удалось обновить материал"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Материал не найден"
             )
 
+        # Новое название — в снимки этого объекта, сохранённые в сделках
+        if "name" in update_data:
+            background_tasks.add_task(DealsDAO.refresh_snapshots, "material", result["_id"], result.get("name"))
+
         return result
 
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Материал с таким именем уже существует"
+        )
     except Exception as e:
         logger.error(f"Ошибка обновления материала: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -272,7 +304,6 @@ async def check_material_dependencies(material_id: str) -> bool:
     - False если зависимостей нет
     """
     # Пример проверки в других коллекциях
-    from app.deals.dao import DealsDAO
 
     # Проверяем, используется ли материал в продуктах
     deals_using_materials = await DealsDAO.count(
@@ -4,6 +4,8 @@ from typing import Optional
 from bson import ObjectId
 from pydantic import BaseModel, Field, field_validator
 
+from app.base_schemas import StrippedNameModel
+
 
 class SMaterials(BaseModel):
     id: str | None = Field(None, alias="_id")
@@ -21,7 +23,7 @@ class SMaterials(BaseModel):
         json_encoders = {ObjectId: str}
 
 
-class SMaterialsAdd(BaseModel):
+class SMaterialsAdd(StrippedNameModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
 
     class Config:
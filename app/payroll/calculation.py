@@ -0,0 +1,167 @@
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import MongoClient
+
+from app.config import settings
+from app.database import database_mongo
+from app.deals.pricing import manager_percent
+from app.logger import logger
+
+PAYROLL_COLLECTION = "payroll_snapshots"
+
+# Поля сделки, которые нужны расчёту (колонки)
+_DEAL_PROJECTION = {"_id": 0, "userId": 1, "companyProfit": 1, "totalAmount": 1, "managerProfit": 1}
+
+
+def period_bounds(period: str) -> Tuple[datetime, datetime]:
+    """"2026-09" -> [2026-09-01, 2026-10-01)"""
+    start = datetime.strptime(period, "%Y-%m")
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def closed_stage_ids(database) -> List[ObjectId]:
+    """
+    Этапы закрытых сделок: PAYROLL_CLOSED_STAGE_IDS, а если не заданы —
+    неудалённые этапы с наибольшим order (последний этап воронки).
+    """
+    if settings.PAYROLL_CLOSED_STAGE_IDS:
+        return [ObjectId(value.strip()) for value in settings.PAYROLL_CLOSED_STAGE_IDS.split(",") if value.strip()]
+    stages = list(database.stages.find({"deletedAt": None, "order": {"$type": "number"}}, {"order": 1}))
+    if not stages:
+        return []
+    last = max(stage["order"] for stage in stages)
+    return [stage["_id"] for stage in stages if stage["order"] == last]
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def load_columns(database, query: Dict, batch_size: int) -> Tuple[List[Any], Dict[str, np.ndarray]]:
+    """
+    Читает сделки пачками по batch_size и раскладывает их в колонки NumPy.
+    Менеджеры кодируются номерами (codes): managers[code] — userId.
+    Отсутствующие суммы — NaN.
+    """
+    managers: Dict[Any, int] = {}
+    chunks: Dict[str, List[np.ndarray]] = {"codes": [], "companyProfit": [], "totalAmount": [], "managerProfit": []}
+
+    def flush(batch: List[Dict]) -> None:
+        size = len(batch)
+        chunks["codes"].append(np.fromiter(
+            (managers.setdefault(deal.get("userId"), len(managers)) for deal in batch), dtype=np.int32, count=size
+        ))
+        for field in ("companyProfit", "totalAmount", "managerProfit"):
+            chunks[field].append(np.fromiter(
+                (_number(deal.get(field)) for deal in batch), dtype=np.float64, count=size
+            ))
+
+    batch: List[Dict] = []
+    for deal in database.deals.find(query, _DEAL_PROJECTION, batch_size=batch_size):
+        batch.append(deal)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    columns = {
+        field: np.concatenate(parts) if parts else np.empty(0, dtype=np.int32 if field == "codes" else np.float64)
+        for field, parts in chunks.items()
+    }
+    return list(managers), columns
+
+
+def compute_payroll(columns: Dict[str, np.ndarray], percents: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Начисления по менеджерам без циклов по сделкам: комиссия сделки —
+    companyProfit * percent менеджера / 100 (как managerProfit в app.deals.pricing),
+    суммы по менеджерам — np.bincount по кодам.
+    """
+    codes = columns["codes"]
+    size = len(percents)
+    profit = columns["companyProfit"]
+    commission = profit * percents[codes] / 100
+
+    def total(values: np.ndarray) -> np.ndarray:
+        return np.bincount(codes, weights=np.nan_to_num(values), minlength=size)
+
+    return {
+        "deals": np.bincount(codes, minlength=size),
+        "unpricedDeals": np.bincount(codes, weights=np.isnan(profit), minlength=size).astype(np.int64),
+        "companyProfit": total(profit),
+        "totalAmount": total(columns["totalAmount"]),
+        "commission": total(commission),
+        # Сумма managerProfit, сохранённых в сделках, — для сверки с расчётом
+        "storedManagerProfit": total(columns["managerProfit"]),
+    }
+
+
+def run_payroll(period: str, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Расчёт зарплаты менеджеров за месяц period ("YYYY-MM") по закрытым сделкам,
+    созданным в этом месяце. Результат сохраняется снимком в payroll_snapshots
+    и возвращается. Синхронный — выполняется в воркере Celery.
+    """
+    started = time.perf_counter()
+    period_start, period_end = period_bounds(period)
+    with MongoClient(settings.MONGO_URL, compressors=settings.MONGO_COMPRESSORS) as client:
+        database = client[database_mongo.name]
+        stage_ids = closed_stage_ids(database)
+        query = {
+            "deletedAt": None,
+            "stageId": {"$in": stage_ids},
+            "createdAt": {"$gte": period_start, "$lt": period_end},
+        }
+        managers, columns = load_columns(database, query, batch_size or settings.PAYROLL_BATCH_SIZE)
+
+        users = {
+            user["_id"]: user
+            for user in database.users.find(
+                {"_id": {"$in": [user_id for user_id in managers if user_id is not None]}},
+                {"name": 1, "lastName": 1, "fatherName": 1, "profit": 1},
+            )
+        }
+        percents = np.array(
+            [manager_percent((users.get(user_id) or {}).get("profit")) for user_id in managers], dtype=np.float64
+        )
+        result = compute_payroll(columns, np.nan_to_num(percents))
+
+        rows = []
+        for code, user_id in enumerate(managers):
+            user = users.get(user_id) or {}
+            rows.append({
+                "userId": user_id,
+                "name": user.get("name"),
+                "lastName": user.get("lastName"),
+                "fatherName": user.get("fatherName"),
+                "percent": None if np.isnan(percents[code]) else float(percents[code]),
+                **{field: int(values[code]) for field, values in result.items() if field in ("deals", "unpricedDeals")},
+                **{field: round(float(values[code]), 2) for field, values in result.items()
+                   if field not in ("deals", "unpricedDeals")},
+            })
+        rows.sort(key=lambda row: row["commission"], reverse=True)
+
+        snapshot = {
+            "period": period,
+            "periodStart": period_start,
+            "periodEnd": period_end,
+            "closedStageIds": stage_ids,
+            "createdAt": datetime.now(timezone.utc),
+            "deals": int(len(columns["codes"])),
+            "commission": round(float(result["commission"].sum()), 2),
+            "rows": rows,
+            "durationMs": round((time.perf_counter() - started) * 1000, 1),
+        }
+        database[PAYROLL_COLLECTION].insert_one(snapshot)
+
+    logger.info(
+        f"Payroll for {period} calculated: {snapshot['deals']} deals, "
+        f"{len(rows)} managers in {snapshot['durationMs']} ms"
+    )
+    return snapshot
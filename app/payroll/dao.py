@@ -0,0 +1,13 @@
+from pymongo import IndexModel
+
+from app.dao.base import MongoDAO
+from app.database import database_mongo
+from app.payroll.calculation import PAYROLL_COLLECTION
+
+
+class PayrollSnapshotsDAO(MongoDAO):
+    # Снимки расчёта зарплаты пишет задача Celery (app.tasks.tasks), API только читает
+    collection = database_mongo[PAYROLL_COLLECTION]
+    indexes = [
+        IndexModel([("period", 1), ("createdAt", -1)], name="period_createdAt"),
+    ]
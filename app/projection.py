@@ -0,0 +1,65 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+
+from fastapi import HTTPException, Query, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[List[str]]:
+    """
+    Разбирает fields=a,b,c и сверяет имена с полями схемы.
+    Возвращает имена полей в документе Mongo (с учётом alias, например id -> _id).
+    """
+    if not fields:
+        return None
+
+    allowed = {"_id": "_id"}
+    for name, info in schema.model_fields.items():
+        allowed[name] = info.alias or name
+        if info.alias:
+            allowed[info.alias] = info.alias
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестные поля: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys(allowed[field] for field in requested)) or None
+
+
+def fields_projection(fields: Optional[Iterable[str]]) -> Optional[Dict[str, int]]:
+    """Проекция Mongo для выбранных полей (_id Mongo возвращает всегда)."""
+    if not fields:
+        return None
+    return {field: 1 for field in fields}
+
+
+def fields_param(schema: Type[BaseModel]) -> Callable[..., Optional[List[str]]]:
+    """Зависимость FastAPI для query-параметра fields, проверенного по схеме ответа."""
+    allowed = ", ".join(schema.model_fields)
+
+    def dependency(
+            fields: Optional[str] = Query(
+                None, description=f"Вернуть только перечисленные через запятую поля: {allowed}"
+            )
+    ) -> Optional[List[str]]:
+        return parse_fields(fields, schema)
+
+    return dependency
+
+
+def sparse_response(items: List[Any], schema: Type[BaseModel], fields: List[str]) -> JSONResponse:
+    """
+    Сериализует документы через схему, оставляя только выбранные поля и id,
+    чтобы в ответе не появлялись null-заглушки для непрошенных полей.
+    """
+    include = {
+        name for name, info in schema.model_fields.items()
+        if name in fields or info.alias in fields or info.alias == "_id"
+    }
+    return JSONResponse(content=[
+        schema.model_validate(item).model_dump(mode="json", by_alias=True, include=include)
+        for item in items
+    ])
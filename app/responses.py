@@ -0,0 +1,29 @@
+from typing import Any
+
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import JSONResponse
+
+
+def orjson_default(obj: Any) -> Any:
+    """Типы BSON, которые orjson не знает: ObjectId и Decimal128 — строкой (datetime orjson пишет в ISO 8601)."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Сериализует документы Mongo в JSON за один проход, без промежуточных копий."""
+    return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse на orjson: документы из Mongo отдаются как есть,
+    без pydantic-модели и jsonable_encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,6 +1,7 @@
-from app.dao.base import MongoDAO
+from app.dao.base import ReferenceDAO, UNIQUE_NAME_INDEX
 from app.database import database_mongo
 
 
-class ServicesDAO(MongoDAO):
+class ServicesDAO(ReferenceDAO):
     collection = database_mongo["services"]
+    indexes = [UNIQUE_NAME_INDEX]
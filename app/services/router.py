@@ -1,10 +1,13 @@
-from typing import Optional
+from typing import Optional, List
 
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from pymongo.errors import DuplicateKeyError
 from starlette import status
 
+from app.deals.dao import DealsDAO
 from app.logger import logger
+from app.projection import fields_param, fields_projection, sparse_response
 from app.services.dao import ServicesDAO
 from app.services.shemas import SServices, SServicesAdd
 from app.users.dependencies import get_current_user
@@ -23,9 +26,17 @@ async def get_material(id: str) -> SServices:
 
 
 @router.get("", response_model=list[SServices], summary="Получить список материалов")
-async def get_materials(data: SServices = Depends()) -> list[
-    SServices]:
-    result = await ServicesDAO.find_all(**data.model_dump(exclude_none=True))
+async def get_materials(
+        data: SServices = Depends(),
+        fields: Optional[List[str]] = Depends(fields_param(SServices))
+) -> list[SServices]:
+    result = await ServicesDAO.find_all(
+        **data.model_dump(exclude_none=True),
+        projection=fields_projection(fields)
+    )
+    if fields:
+        # Только запрошенные поля — без null-заглушек для остальных
+        return sparse_response(result, SServices, fields)
     return result
 
 
@@ -73,6 +84,12 @@ async def add_adress(data: SServicesAdd):
 
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        # Параллельный запрос успел создать запись с тем же именем
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Материал с таким именем уже существует"
+        )
     except Exception as e:
         logger.error(f"Ошибка при создании материала: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -107,30 +124,9 @@ async def update_material(
     - Не учитывает регистр при проверке уникальности
     """
     try:
-        # Проверяем существование материала
-        existing_material = await ServicesDAO.find_one_or_none(_id=ObjectId(id))
-
-        if not existing_material:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Материал не найден"
-            )
-
         update_data = data.model_dump(exclude_none=True)
 
-        if "name" in update_data:
-            # Проверка на уникальность
-            if not await ServicesDAO.is_unique(
-                    field_name="name",
-                    value=data.name,
-                    exclude_id=id,
-                    case_sensitive=False,
-                    trim_spaces=True
-            ):
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Материал с таким именем уже существует"
-                )
+        # Уникальность имени обеспечивает индекс name_ci: конфликт придёт как DuplicateKeyError
 
         # Фоновое логирование изменения
         background_tasks.add_task(
@@ -151,16 +147,26 @@ async def update_material(
             update_data=update_data
         )
 
+        # None — документа с таким ID нет
         if not result:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Не удалось обновить материал"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Материал не найден"
             )
 
+        # Новое название — в снимки этого объекта, сохранённые в сделках
+        if "name" in update_data:
+            background_tasks.add_task(DealsDAO.refresh_snapshots, "service", result["_id"], result.get("name"))
+
         return result
 
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Материал с таким именем уже существует"
+        )
     except Exception as e:
         logger.error(f"Ошибка обновления материала: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -273,7 +279,6 @@ async def check_material_dependencies(adress_id: str) -> bool:
     - False если зависимостей нет
     """
     # Пример проверки в других коллекциях
-    from app.deals.dao import DealsDAO
 
     # Проверяем, используется ли материал в продуктах
     deals_using_service = await DealsDAO.count(
@@ -3,6 +3,8 @@ from datetime import datetime
 from bson import ObjectId
 from pydantic import BaseModel, Field, field_validator
 
+from app.base_schemas import StrippedNameModel
+
 
 class SServices(BaseModel):
     id: str | None = Field(None, alias="_id")
@@ -20,7 +22,7 @@ class SServices(BaseModel):
         json_encoders = {ObjectId: str}
 
 
-class SServicesAdd(BaseModel):
+class SServicesAdd(StrippedNameModel):
     name: str | None = None
 
     class Config:
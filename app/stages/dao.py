@@ -1,6 +1,12 @@
-from app.dao.base import MongoDAO
+from pymongo import IndexModel
+
+from app.dao.base import ReferenceDAO, UNIQUE_NAME_INDEX
 from app.database import database_mongo
 
 
-class StagesDAO(MongoDAO):
+class StagesDAO(ReferenceDAO):
     collection = database_mongo["stages"]
+    indexes = [
+        UNIQUE_NAME_INDEX,
+        IndexModel([("order", 1)], name="order"),
+    ]
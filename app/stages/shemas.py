@@ -3,6 +3,8 @@ from datetime import datetime
 from bson import ObjectId
 from pydantic import BaseModel, Field, field_validator
 
+from app.base_schemas import StrippedNameModel
+
 
 class SStages(BaseModel):
     id: str | None = Field(None, alias="_id")
@@ -21,7 +23,7 @@ class SStages(BaseModel):
         json_encoders = {ObjectId: str}
 
 
-class SStagesAdd(BaseModel):
+class SStagesAdd(StrippedNameModel):
     name: str | None = None
     order: int | None = None
 
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from app.deals.dao import DealsDAO
+from app.payroll.calculation import run_payroll
+from app.tasks.celery_app import celery
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def run_async(coroutine: Awaitable) -> Any:
+    """
+    Выполняет корутину DAO в воркере Celery. Event loop один на процесс:
+    клиенты Motor и Redis привязываются к loop при первом запросе.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coroutine)
+
+
+@celery.task(name="payroll.calculate")
+def calculate_payroll(period: str) -> str:
+    """Расчёт зарплаты менеджеров за месяц ("YYYY-MM"); возвращает _id снимка."""
+    snapshot = run_payroll(period)
+    return str(snapshot["_id"])
+
+
+@celery.task(name="deals.recompute_financials")
+def recompute_deal_financials() -> Dict[str, int]:
+    """Пересчёт финансовых показателей всех сделок; возвращает число проверенных и изменённых."""
+    return run_async(DealsDAO.recompute_financials())
+
+
+@celery.task(name="deals.rebuild_stats_daily")
+def rebuild_deal_stats_daily() -> int:
+    """Пересборка сводки deal_stats_daily; возвращает число строк."""
+    return run_async(DealsDAO.rebuild_daily_stats())
@@ -1,6 +1,11 @@
+from pymongo import IndexModel
+
 from app.dao.base import MongoDAO
 from app.database import database_mongo
 
 
 class UsersDAO(MongoDAO):
     collection = database_mongo["users"]
+    indexes = [
+        IndexModel([("email", 1)], name="email_unique", unique=True),
+    ]
@@ -1,6 +1,12 @@
+from pymongo import IndexModel
+
 from app.dao.base import MongoDAO
 from app.database import database_mongo
 
 
 class VehiclesDAO(MongoDAO):
     collection = database_mongo["vehicles"]
+    indexes = [
+        IndexModel([("companyId", 1)], name="companyId"),
+        IndexModel([("number", 1)], name="number"),
+    ]
@@ -0,0 +1,58 @@
+import asyncio
+from urllib.parse import urlencode
+
+import orjson
+
+
+async def request(app, method: str, path: str, params=None, on_chunk=None, json=None):
+    """
+    Запрос напрямую через ASGI, json — тело запроса. Части тела ответа передаются
+    в on_chunk по мере отправки; без on_chunk они собираются в ответ целиком.
+    """
+    response = {"status": None, "headers": {}, "body": b""}
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params or {}).encode(),
+        "root_path": "",
+        "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+        "client": ("test", 0),
+        "server": ("test", 80),
+    }
+
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            body = orjson.dumps(json) if json is not None else b""
+            return {"type": "http.request", "body": body, "more_body": False}
+        # StreamingResponse ждёт разрыва соединения параллельно с отправкой тела
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode(): value.decode() for name, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            if on_chunk is None:
+                response["body"] += message.get("body", b"")
+            else:
+                on_chunk(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return response
+
+
+async def get(app, path: str, params=None, on_chunk=None):
+    return await request(app, "GET", path, params, on_chunk)
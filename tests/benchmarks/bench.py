@@ -0,0 +1,209 @@
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+
+from app.deals.dao import DealsDAO
+
+# Справочники сделки: коллекция -> количество документов
+REFERENCES = {
+    "services": 20,
+    "stages": 10,
+    "materials": 50,
+    "companies": 2000,
+    "adresses": 4000,
+    "users": 30,
+}
+SEED_BATCH_SIZE = 10_000
+
+
+def measure(function: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None,
+            repeat: int = 5) -> Dict[str, float]:
+    """
+    Медианы времени и CPU процесса на один вызов function(setup()), мс.
+    setup выполняется вне замера; первый вызов — прогрев, в результат не входит.
+    """
+    function(setup())
+    wall, cpu = [], []
+    for _ in range(repeat):
+        argument = setup()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        function(argument)
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+    return {"ms": statistics.median(wall) * 1000, "cpu_ms": statistics.median(cpu) * 1000}
+
+
+def format_table(title: str, rows: List[Dict[str, Any]]) -> str:
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    cells = [[_format(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    lines = [title, "  ".join(column.rjust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells]
+    return "\n".join(lines)
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "" if value is None else str(value)
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    """Прежний кодировщик deals/router.py — точка отсчёта для бенчмарков."""
+
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+def convert_objectids_to_str(data: Any) -> Any:
+    """
+    Прежний DealsDAO._convert_objectids_to_str — точка отсчёта для бенчмарков:
+    рекурсивная копия документа с ObjectId строкой и пустым unitMeasurement в None.
+    """
+    if isinstance(data, ObjectId):
+        return str(data)
+    elif isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if key == "unitMeasurement" and (value == "" or value is None):
+                result[key] = None
+            else:
+                result[key] = convert_objectids_to_str(value)
+        return result
+    elif isinstance(data, list):
+        return [convert_objectids_to_str(item) for item in data]
+    else:
+        return data
+
+
+def make_references(rng: random.Random) -> Dict[str, List[Dict[str, Any]]]:
+    """Документы справочников с полями из реестра связей DealsDAO."""
+    references = {}
+    for collection, count in REFERENCES.items():
+        documents = []
+        for number in range(count):
+            document = {"_id": ObjectId(), "name": f"{collection}-{number}"}
+            if collection == "stages":
+                document["order"] = number
+            elif collection == "companies":
+                document["inn"] = str(rng.randrange(10 ** 9, 10 ** 10))
+            elif collection == "adresses":
+                document.update(companyId=ObjectId(), cityId=ObjectId(), typeAdress="склад",
+                                adressDetail=f"ул. Складская, {number}",
+                                coordinates=[rng.uniform(55, 56), rng.uniform(37, 38)])
+            elif collection == "users":
+                document.update(lastName="Иванов", fatherName="Петрович", email=f"user{number}@example.com")
+            documents.append(document)
+        references[collection] = documents
+    return references
+
+
+def make_deal(rng: random.Random, references: Dict[str, List[Dict[str, Any]]],
+              created_at: datetime, expenses: int = 3) -> Dict[str, Any]:
+    """Сделка в форме коллекции deals: ссылки, снимки {_id, name}, финансы и вложенные массивы."""
+    service, stage, material, customer, user = (
+        rng.choice(references[name]) for name in ("services", "stages", "materials", "companies", "users")
+    )
+    quantity = rng.randint(1, 500)
+    purchase, sales, delivery = rng.randint(500, 900), rng.randint(900, 1500), rng.randint(0, 20000)
+    return {
+        "createdAt": created_at,
+        "userId": user["_id"],
+        "serviceId": service["_id"],
+        "customerId": customer["_id"],
+        "stageId": stage["_id"],
+        "materialId": material["_id"],
+        "shippingAddressId": rng.choice(references["adresses"])["_id"],
+        "deliveryAddressId": rng.choice(references["adresses"])["_id"],
+        "service": {"_id": service["_id"], "name": service["name"]},
+        "stage": {"_id": stage["_id"], "name": stage["name"]},
+        "material": {"_id": material["_id"], "name": material["name"]},
+        "customer": {"_id": customer["_id"], "name": customer["name"]},
+        "user": {"_id": user["_id"], "name": user["name"]},
+        "unitMeasurement": rng.choice(["т", "м3", ""]),
+        "quantity": quantity,
+        "amountPurchaseUnit": purchase,
+        "amountPurchaseTotal": purchase * quantity,
+        "amountSalesUnit": sales,
+        "amountSalesTotal": sales * quantity,
+        "amountDelivery": delivery,
+        "companyProfit": (sales - purchase) * quantity - delivery,
+        "paymentMethod": rng.choice(["нал", "безнал"]),
+        "ndsPercent": 20,
+        "totalAmount": sales * quantity + delivery,
+        "addExpenses": [
+            {"_id": ObjectId(), "name": f"Расход {number}", "amount": rng.randint(100, 5000),
+             "createdAt": created_at, "author": {"_id": user["_id"], "name": user["name"]}}
+            for number in range(expenses)
+        ],
+        "deliveredQuantity": [
+            {"_id": ObjectId(), "quantity": rng.randint(1, 50),
+             "date": created_at + timedelta(days=number), "driverId": ObjectId()}
+            for number in range(expenses)
+        ],
+        "notes": "Доставка до 18:00",
+        "updatedAt": created_at,
+        "deletedAt": None,
+    }
+
+
+def make_deals(count: int, seed: int = 0, expenses: int = 3,
+               references: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+    """Сделки в памяти, без Mongo; createdAt с точностью до миллисекунд, как после чтения из базы."""
+    rng = random.Random(seed)
+    references = references or make_references(rng)
+    start = datetime(2025, 1, 1)
+    return [
+        make_deal(rng, references, start + timedelta(milliseconds=rng.randrange(365 * 86_400_000)), expenses)
+        for _ in range(count)
+    ]
+
+
+async def seed_references(database) -> Dict[str, List[Dict[str, Any]]]:
+    """Справочники в базе бенчмарков: создаются один раз и общие для всех коллекций сделок."""
+    references = {}
+    for collection in REFERENCES:
+        references[collection] = await database[collection].find().to_list(None)
+    if all(len(references[collection]) == count for collection, count in REFERENCES.items()):
+        return references
+
+    references = make_references(random.Random(0))
+    for collection, documents in references.items():
+        await database[collection].drop()
+        await database[collection].insert_many(documents)
+    return references
+
+
+async def seed_deals(database, name: str, count: int, seed: int = 0) -> Any:
+    """
+    Коллекция из count сделок с индексами DealsDAO.
+    Уже заполненная коллекция переиспользуется — 1M сделок создаются один раз.
+    """
+    references = await seed_references(database)
+    collection = database[name]
+    if await collection.estimated_document_count() == count:
+        return collection
+
+    await collection.drop()
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    for offset in range(0, count, SEED_BATCH_SIZE):
+        batch = [
+            make_deal(rng, references, start + timedelta(milliseconds=rng.randrange(365 * 86_400_000)))
+            for _ in range(min(SEED_BATCH_SIZE, count - offset))
+        ]
+        # Каждая десятая сделка удалена: списки фильтруют deletedAt = null по частичным индексам
+        for deal in batch[::10]:
+            deal["deletedAt"] = deal["createdAt"]
+        await collection.insert_many(batch, ordered=False)
+    await collection.create_indexes(DealsDAO.indexes)
+    return collection
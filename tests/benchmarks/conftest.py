@@ -0,0 +1,65 @@
+"""
+Бенчмарки запускаются только явно, обычный прогон тестов их пропускает:
+
+    RUN_BENCHMARKS=1 python -m pytest tests/benchmarks
+
+Бенчмарки запросов к Mongo дополнительно требуют BENCH_MONGO_URL
+(например, mongodb://localhost:27017). Данные создаются в базе BENCH_MONGO_DB
+(по умолчанию deals_bench) один раз и переиспользуются следующими прогонами.
+"""
+import asyncio
+import os
+
+import pytest
+
+from app.config import settings
+from app.dao.indexes import registered_daos
+from bench import format_table
+
+
+def pytest_collection_modifyitems(config, items):
+    # Отметка, а не пропуск в фикстуре: иначе фикстуры модуля успели бы заполнить базу
+    if os.getenv("RUN_BENCHMARKS"):
+        return
+    skip = pytest.mark.skip(reason="бенчмарки запускаются с RUN_BENCHMARKS=1")
+    for item in items:
+        if item.path.is_relative_to(config.rootpath / "tests" / "benchmarks"):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Один event loop на весь прогон: клиент Motor привязан к loop, в котором создан."""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def bench_db(run):
+    """
+    База для бенчмарков. Коллекции всех DAO переключаются на неё,
+    кэш чтений выключен — сравниваются запросы к Mongo, а не попадания в Redis.
+    """
+    url = os.getenv("BENCH_MONGO_URL")
+    if not url:
+        pytest.skip("нужен BENCH_MONGO_URL")
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(url)
+    database = client[os.getenv("BENCH_MONGO_DB", "deals_bench")]
+    with pytest.MonkeyPatch.context() as patch:
+        for dao in registered_daos():
+            patch.setattr(dao, "collection", database[dao.collection.name])
+        patch.setattr(settings, "CACHE_ENABLED", False)
+        yield database
+    client.close()
+
+
+@pytest.fixture
+def report(capsys):
+    """Печатает таблицу результатов и при перехваченном выводе pytest."""
+    def print_table(title, rows):
+        with capsys.disabled():
+            print("\n" + format_table(title, rows))
+    return print_table
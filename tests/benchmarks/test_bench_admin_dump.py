@@ -0,0 +1,73 @@
+"""
+Выгрузка 5,000 сделок со связями (GET /deals/admin/get): прежний путь
+json.dumps(CustomJSONEncoder) -> json.loads -> JSONResponse против
+одного прохода FastJSONResponse. Замер — только кодирование результата агрегации.
+"""
+import copy
+import json
+import random
+import re
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+from app.deals.dao import DealsDAO
+from app.responses import FastJSONResponse
+from bench import CustomJSONEncoder, make_deals, make_references, measure
+
+DEALS = 5_000
+DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+
+def make_dump():
+    """Сделки в виде выдачи агрегации: на месте ссылок — документы связей с полями из реестра."""
+    references = make_references(random.Random(0))
+    by_id = {
+        document["_id"]: document
+        for documents in references.values() for document in documents
+    }
+    deals = make_deals(DEALS, references=references)
+    for deal in deals:
+        deal["_id"] = ObjectId()
+        for name, relation in DealsDAO.relations.items():
+            related = by_id.get(deal.get(relation.local_field))
+            if related is not None:
+                deal[name] = {"_id": related["_id"], **{field: related.get(field) for field in relation.fields}}
+    return deals
+
+
+def same_json(data):
+    """
+    Прежний путь писал datetime через default=str — с пробелом вместо T
+    (default=str подменяет CustomJSONEncoder.default), поэтому даты сравниваются как значения.
+    """
+    if isinstance(data, dict):
+        return {key: same_json(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [same_json(item) for item in data]
+    if isinstance(data, str) and DATETIME.fullmatch(data[:19]):
+        return datetime.fromisoformat(data)
+    return data
+
+
+def before(deals):
+    deal_list = [json.loads(json.dumps(doc, cls=CustomJSONEncoder, default=str)) for doc in deals]
+    return JSONResponse(content=deal_list).body
+
+
+def after(deals):
+    return FastJSONResponse(content=deals).body
+
+
+def test_admin_dump_before_after(report):
+    deals = make_dump()
+    assert same_json(orjson.loads(before(deals))) == same_json(orjson.loads(after(deals)))
+
+    rows = [
+        {"путь": name, **measure(encode, lambda: copy.deepcopy(deals))}
+        for name, encode in (("json.dumps + json.loads + JSONResponse", before), ("FastJSONResponse", after))
+    ]
+    report(f"Выгрузка {DEALS:,} сделок со связями", rows)
+    assert rows[1]["cpu_ms"] < rows[0]["cpu_ms"]
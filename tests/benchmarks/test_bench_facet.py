@@ -0,0 +1,47 @@
+"""
+$facet (страница и total одной агрегацией) против count_documents + find
+на синтетической коллекции из 1M сделок, countMode=exact.
+"""
+import pytest
+
+from app.deals.dao import DealsDAO
+from bench import measure, seed_deals
+
+DEALS = 1_000_000
+PAGE_SIZE = 100
+SORT = [("createdAt", -1)]
+
+
+@pytest.fixture(scope="module")
+def deals(bench_db, run):
+    collection = run(seed_deals(bench_db, "deals_1m", DEALS))
+    manager = run(collection.find_one({}, {"userId": 1}))["userId"]
+    return collection, manager
+
+
+def test_facet_vs_count_and_find(deals, run, report, monkeypatch):
+    collection, manager = deals
+    monkeypatch.setattr(DealsDAO, "collection", collection)
+    scenarios = [
+        ("все активные, стр. 1", {"deletedAt": None}, 1),
+        ("менеджер, стр. 1", {"deletedAt": None, "userId": manager}, 1),
+        ("менеджер, стр. 50", {"deletedAt": None, "userId": manager}, 50),
+    ]
+
+    rows = []
+    for title, query, page in scenarios:
+        def read(use_facet, query=query, page=page):
+            return run(DealsDAO.find_paginated1(
+                filter_by=dict(query), skip=(page - 1) * PAGE_SIZE, limit=PAGE_SIZE,
+                sort=SORT, use_facet=use_facet, count_mode="exact",
+            ))
+
+        facet, simple = read(True), read(False)
+        assert facet["items"] and facet["total"] == simple["total"]
+        assert [item["_id"] for item in facet["items"]] == [item["_id"] for item in simple["items"]]
+
+        for path, use_facet in (("count + find", False), ("$facet", True)):
+            rows.append({"сценарий": title, "путь": path, "total": simple["total"],
+                         **measure(lambda _, use_facet=use_facet: read(use_facet))})
+
+    report(f"$facet vs count + find, {DEALS:,} сделок, страница {PAGE_SIZE}", rows)
@@ -0,0 +1,38 @@
+"""
+Микробенчмарк строковых ObjectId во вложенных addExpenses/deliveredQuantity:
+прежняя рекурсивная копия страницы (_convert_objectids_to_str) перед кодированием
+против кодирования как есть, где ObjectId обрабатывает default у orjson.
+"""
+import copy
+
+import pytest
+from bson import ObjectId
+
+from app.deals.dao import DealsDAO
+from app.responses import dumps
+from bench import convert_objectids_to_str, make_deals, measure
+
+DEALS = 200
+
+
+def before(items):
+    return dumps(convert_objectids_to_str(items))
+
+
+def after(items):
+    return dumps(DealsDAO._normalize_unit_measurement(items))
+
+
+@pytest.mark.parametrize("expenses", [3, 25, 100])
+def test_nested_ids_before_after(report, expenses):
+    deals = make_deals(DEALS, expenses=expenses)
+    for deal in deals:
+        deal["_id"] = ObjectId()
+    assert before(copy.deepcopy(deals)) == after(copy.deepcopy(deals))
+
+    rows = [
+        {"путь": name, **measure(encode, lambda: copy.deepcopy(deals), repeat=10)}
+        for name, encode in (("копия + orjson", before), ("orjson default", after))
+    ]
+    report(f"{DEALS} сделок, по {expenses} записей в addExpenses и deliveredQuantity", rows)
+    assert rows[1]["cpu_ms"] < rows[0]["cpu_ms"]
@@ -0,0 +1,71 @@
+"""
+Страница списка сделок из 1,000 строк: прежний путь (рекурсивная копия
+документов, модель PaginatedResponse как response_model, jsonable-сериализация
+FastAPI) против FastJSONResponse, который пишет dict страницы в байты orjson.
+Замер — весь ASGI-запрос; чтение из Mongo в обоих путях одинаковое и не входит.
+"""
+import copy
+
+import orjson
+from bson import ObjectId
+from fastapi import FastAPI
+
+from app.deals.dao import DealsDAO
+from app.deals.shemas import PaginatedResponse
+from app.responses import FastJSONResponse
+from asgi import get
+from bench import convert_objectids_to_str, make_deals, measure
+
+PAGE_SIZE = 1_000
+SORT = [("createdAt", -1), ("_id", -1)]
+
+
+def build_app(holder):
+    app = FastAPI()
+
+    def page():
+        # Как из find_paginated1: limit + 1 документ, последний — признак следующей страницы
+        items = DealsDAO._normalize_unit_measurement(holder["items"])
+        return DealsDAO._build_paginated_response(
+            items=items, total=100_000, skip=0, limit=PAGE_SIZE, sort=SORT, cursor=None
+        )
+
+    @app.get("/before", response_model=PaginatedResponse)
+    async def before():
+        result = page()
+        return PaginatedResponse(**{**result, "items": convert_objectids_to_str(result["items"])})
+
+    @app.get("/after", response_model=PaginatedResponse)
+    async def after():
+        return FastJSONResponse(content=page())
+
+    return app
+
+
+def test_page_encoding_before_after(run, report):
+    deals = make_deals(PAGE_SIZE + 1)
+    for deal in deals:
+        deal["_id"] = ObjectId()
+    holder = {}
+    app = build_app(holder)
+
+    def setup():
+        holder["items"] = copy.deepcopy(deals)
+
+    def request(path):
+        response = run(get(app, path))
+        assert response["status"] == 200
+        return response["body"]
+
+    setup()
+    before = request("/before")
+    setup()
+    after = request("/after")
+    assert orjson.loads(before) == orjson.loads(after)
+
+    rows = [
+        {"путь": path, "KiB": len(body) / 1024, **measure(lambda _, path=path: request(path), setup, repeat=20)}
+        for path, body in (("/before", before), ("/after", after))
+    ]
+    report(f"Страница {PAGE_SIZE:,} сделок: сериализация ответа", rows)
+    assert rows[1]["cpu_ms"] < rows[0]["cpu_ms"]
@@ -0,0 +1,39 @@
+"""
+Связи сделок: $lookup на каждую сделку (relation_strategy="lookup") против
+пакетной загрузки $in по коллекциям (relation_strategy="batch") на 100, 1k и 10k сделок.
+"""
+import pytest
+
+from app.deals.dao import DealsDAO
+from bench import measure, seed_deals
+
+DEALS = 10_000
+SORT = [("createdAt", -1)]
+
+
+@pytest.fixture(scope="module")
+def deals(bench_db, run):
+    return run(seed_deals(bench_db, "deals_10k", DEALS))
+
+
+def related(items):
+    return [{name: item.get(name) for name in DealsDAO.relations} for item in items]
+
+
+@pytest.mark.parametrize("count", [100, 1_000, 10_000])
+def test_lookup_vs_batch(deals, run, report, monkeypatch, count):
+    monkeypatch.setattr(DealsDAO, "collection", deals)
+
+    def read(strategy):
+        return run(DealsDAO.find_paginated1(
+            filter_by={}, limit=count, sort=SORT, include_relations=True, relation_strategy=strategy,
+        ))
+
+    lookup, batch = read("lookup"), read("batch")
+    assert len(batch["items"]) == count
+    assert related(lookup["items"]) == related(batch["items"])
+
+    report(f"$lookup vs $in, {count:,} сделок, {len(DealsDAO.relations)} связей", [
+        {"путь": strategy, **measure(lambda _, strategy=strategy: read(strategy))}
+        for strategy in ("lookup", "batch")
+    ])
@@ -0,0 +1,50 @@
+import os
+import threading
+
+import pytest
+
+# Обязательные настройки app.config; тесты не ходят во внешние сервисы
+_ENV = {
+    "MODE": "TEST",
+    "LOG_LEVEL": "INFO",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "POSTGRES_DB": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "S3_ENDPOINT": "http://localhost",
+    "S3_BUCKET": "test",
+    "S3_ACCESS_KEY": "test",
+    "S3_SECRET_KEY": "test",
+    "S3_KMS_KEY_ID": "test",
+    "MONGO_INITDB_ROOT_USERNAME": "test",
+    "MONGO_INITDB_ROOT_PASSWORD": "test",
+    "MONGO_INITDB_DATABASE": "test",
+    "API_FNS_URL": "http://localhost",
+    "API_FNS_KEY": "test",
+}
+for name, value in _ENV.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """
+    fakeredis по TCP в отдельном потоке: к нему подключаются и тест,
+    и дочерние процессы (через REDIS_HOST/REDIS_PORT в окружении).
+    """
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    monkeypatch.setenv("REDIS_HOST", host)
+    monkeypatch.setenv("REDIS_PORT", str(port))
+    yield host, port
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,44 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+
+from app.admin.router import router
+from app.tasks import tasks
+from app.users.dependencies import get_current_admin_user
+from asgi import request
+
+
+@pytest.fixture
+def app():
+    application = FastAPI()
+    application.include_router(router)
+    application.dependency_overrides[get_current_admin_user] = lambda: SimpleNamespace(admin=True)
+    return application
+
+
+@pytest.mark.parametrize("path, task", [
+    ("/admin/deals/financials", "recompute_deal_financials"),
+    ("/admin/deals/stats-daily", "rebuild_deal_stats_daily"),
+])
+def test_endpoint_enqueues_task_instead_of_running_it(app, monkeypatch, path, task):
+    queued = []
+    monkeypatch.setattr(getattr(tasks, task), "delay", lambda: queued.append(task) or SimpleNamespace(id="task-1"))
+    monkeypatch.setattr(tasks.DealsDAO, "recompute_financials", pytest.fail)
+    monkeypatch.setattr(tasks.DealsDAO, "rebuild_daily_stats", pytest.fail)
+
+    response = asyncio.run(request(app, "POST", path))
+
+    assert response["status"] == 202
+    assert response["body"] == b'{"taskId":"task-1"}'
+    assert queued == [task]
+
+
+def test_run_async_keeps_one_loop_per_process():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    first = tasks.run_async(current_loop())
+    assert tasks.run_async(current_loop()) is first
+    assert not first.is_closed()
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.dao.base import MongoDAO
+
+
+def make_dao(documents=()):
+    collection = AsyncMongoMockClient()["test"]["deals"]
+    requests = []
+
+    async def bulk_write(batch, ordered=True):
+        # Запись не выполняется: проверяется только то, что DAO отправляет в Mongo
+        requests.extend(batch)
+        return SimpleNamespace(upserted_ids={})
+
+    class DealsDAO(MongoDAO):
+        pass
+
+    DealsDAO.collection = collection
+    if documents:
+        asyncio.run(collection.insert_many(list(documents)))
+    collection.bulk_write = bulk_write
+    return DealsDAO, requests
+
+
+def test_upsert_writes_set_on_insert_fields_only_on_insert():
+    dao, requests = make_dao()
+    asyncio.run(dao.bulk_write([{
+        "op": "upsert",
+        "filter": {"number": "A-1"},
+        "data": {"quantity": 3, "createdAt": "client"},
+        "set_on_insert": {"userId": "uploader", "createdAt": "now"},
+    }]))
+
+    assert requests[0]._doc == {"$set": {"quantity": 3, "createdAt": "client"}, "$setOnInsert": {"userId": "uploader"}}
+    assert requests[0]._upsert is True
+
+
+def test_upsert_returns_id_of_matched_document():
+    existing = ObjectId()
+    dao, _ = make_dao([
+        {"_id": existing, "number": "A-1", "tags": ["x"]},
+        {"_id": ObjectId(), "number": "B-2"},
+    ])
+    results = asyncio.run(dao.bulk_write([
+        {"op": "upsert", "filter": {"number": "A-1"}, "data": {"quantity": 3}},
+        {"op": "upsert", "filter": {"tags": "x", "number": "A-1"}, "data": {"quantity": 4}},
+        {"op": "upsert", "filter": {"number": "C-3"}, "data": {"quantity": 5}},
+    ]))
+
+    assert [result["id"] for result in results] == [str(existing), str(existing), None]
+    assert all(result["ok"] for result in results)
+
+
+def test_upsert_without_data_or_set_on_insert_is_rejected():
+    dao, requests = make_dao()
+    results = asyncio.run(dao.bulk_write([{"op": "upsert", "filter": {"number": "A-1"}}]))
+
+    assert results[0]["ok"] is False and results[0]["code"] == 422
+    assert requests == []
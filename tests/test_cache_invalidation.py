@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import time
+
+from app.dao.cache import LocalLRU
+
+COLLECTION = "deals"
+DIGEST = "digest"
+
+
+async def _serve(commands, results, value) -> None:
+    """Воркер: L1 + Redis из app.dao.cache, «база» — общее число value."""
+    from app.dao import cache
+
+    listener = asyncio.create_task(cache.listen_invalidations(reconnect_delay=0.05))
+    while not cache.local_cache.active:
+        await asyncio.sleep(0.01)
+    results.put("ready")
+
+    async def load():
+        return {"amount": value.value}
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            command, argument = await loop.run_in_executor(None, commands.get)
+            if command == "read":
+                result = (await cache.cached(COLLECTION, 300, DIGEST, load))["amount"]
+            elif command == "write":
+                value.value = argument
+                await cache.invalidate(COLLECTION)
+                result = None
+            elif command == "stats":
+                result = dict(cache.cache_stats[COLLECTION])
+            else:
+                break
+            results.put(result)
+    finally:
+        listener.cancel()
+        await cache.close_cache()
+
+
+def _worker(commands, results, value) -> None:
+    asyncio.run(_serve(commands, results, value))
+
+
+class Worker:
+    def __init__(self, context, value):
+        self.commands = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=_worker, args=(self.commands, self.results, value), daemon=True)
+        self.process.start()
+
+    def wait_ready(self) -> None:
+        assert self.results.get(timeout=30) == "ready"
+
+    def call(self, command, argument=None):
+        self.commands.put((command, argument))
+        return self.results.get(timeout=10)
+
+    def stop(self) -> None:
+        self.commands.put(("stop", None))
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+def test_update_in_one_worker_is_not_served_stale_by_another(redis_server):
+    context = multiprocessing.get_context("spawn")
+    value = context.Value("i", 1)
+    first, second = Worker(context, value), Worker(context, value)
+    try:
+        first.wait_ready()
+        second.wait_ready()
+
+        # Оба воркера держат значение в L1
+        assert second.call("read") == 1
+        assert second.call("read") == 1
+        assert first.call("read") == 1
+        assert second.call("stats")["l1Hits"] == 1
+        assert first.call("stats")["hits"] == 1
+
+        first.call("write", 2)
+        # Писавший воркер сбрасывает свой L1 сразу
+        assert first.call("read") == 2
+
+        # Второй узнаёт о записи из канала инвалидации: старое значение может
+        # прочитаться только до доставки сообщения, не до истечения TTL L1
+        deadline = time.monotonic() + 2
+        while (amount := second.call("read")) != 2:
+            assert amount == 1
+            assert time.monotonic() < deadline, "stale value served after invalidation"
+            time.sleep(0.01)
+
+        # После инвалидации L1 снова заполняется, но уже новым поколением
+        l1_hits = second.call("stats")["l1Hits"]
+        assert [second.call("read") for _ in range(3)] == [2, 2, 2]
+        assert second.call("stats")["l1Hits"] >= l1_hits + 2
+    finally:
+        first.stop()
+        second.stop()
+
+
+def test_inactive_l1_is_bypassed():
+    lru = LocalLRU(max_entries=10, ttl=60)
+    lru.put(COLLECTION, DIGEST, b"raw", 60, lru.generation(COLLECTION))
+    assert lru.get(COLLECTION, DIGEST) is None
+
+    lru.active = True
+    lru.put(COLLECTION, DIGEST, b"raw", 60, lru.generation(COLLECTION))
+    assert lru.get(COLLECTION, DIGEST) == b"raw"
+
+    # Подписка потеряна — L1 не отдаёт даже живые записи
+    lru.active = False
+    assert lru.get(COLLECTION, DIGEST) is None
+
+
+def test_read_started_before_invalidation_does_not_fill_l1():
+    lru = LocalLRU(max_entries=10, ttl=60)
+    lru.active = True
+    lru.put(COLLECTION, DIGEST, b"old", 60, lru.generation(COLLECTION))
+
+    generation = lru.generation(COLLECTION)
+    lru.evict(COLLECTION)
+    assert lru.get(COLLECTION, DIGEST) is None
+
+    # Значение, прочитанное из Redis до инвалидации, не возвращается в L1
+    lru.put(COLLECTION, DIGEST, b"old", 60, generation)
+    assert lru.get(COLLECTION, DIGEST) is None
+
+    lru.put(COLLECTION, DIGEST, b"new", 60, lru.generation(COLLECTION))
+    assert lru.get(COLLECTION, DIGEST) == b"new"
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LocalLRU(max_entries=2, ttl=60)
+    lru.active = True
+    for digest in ("a", "b"):
+        lru.put(COLLECTION, digest, digest.encode(), 60, 0)
+    assert lru.get(COLLECTION, "a") == b"a"
+    lru.put(COLLECTION, "c", b"c", 60, 0)
+    assert lru.get(COLLECTION, "b") is None
+    assert lru.get(COLLECTION, "a") == b"a"
+    assert lru.get(COLLECTION, "c") == b"c"
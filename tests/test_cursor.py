@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from mongomock_motor import AsyncMongoMockClient
+
+from app.dao.cursor import check_cursor, cursor_from_document, decode_cursor, encode_cursor
+from app.deals.dao import DealsDAO
+from app.deals.router import router
+from app.users.dependencies import get_current_user
+from asgi import get
+
+ADMIN = SimpleNamespace(id=str(ObjectId()), admin=True)
+
+
+def test_cursor_round_trip_keeps_field_and_direction():
+    object_id = ObjectId()
+    token = cursor_from_document([("quantity", -1), ("_id", -1)], {"_id": object_id, "quantity": 5})
+    assert decode_cursor(token) == {"s": "quantity", "o": -1, "v": 5, "id": object_id}
+
+
+@pytest.mark.parametrize("token", ["garbage!!", "e30", encode_cursor("quantity", 1, 1, ObjectId())[:-4]])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(ValueError):
+        check_cursor([("quantity", 1)], token)
+
+
+def test_cursor_from_other_sort_is_rejected():
+    token = encode_cursor("quantity", -1, 5, ObjectId())
+    check_cursor([("quantity", -1)], token)
+    with pytest.raises(ValueError):
+        check_cursor([("quantity", 1)], token)
+    with pytest.raises(ValueError):
+        check_cursor([("totalAmount", -1)], token)
+    with pytest.raises(ValueError):
+        check_cursor(None, token)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    collection = AsyncMongoMockClient()["test"]["deals"]
+    quantities = [3, None, 1, 2, None, 3, 5]
+    documents = [{"quantity": quantity, "deletedAt": None} for quantity in quantities]
+    documents.append({"deletedAt": None})  # поле отсутствует — в сортировке как null
+    asyncio.run(collection.insert_many(documents))
+    monkeypatch.setattr(DealsDAO, "collection", collection)
+
+    application = FastAPI()
+    application.include_router(router)
+    application.dependency_overrides[get_current_user] = lambda: ADMIN
+    return application
+
+
+def fetch(app, **params):
+    response = asyncio.run(get(app, "/deals", {"page_size": 3, **params}))
+    return response["status"], orjson.loads(response["body"])
+
+
+@pytest.mark.parametrize("order, expected", [
+    ("asc", [None, None, None, 1, 2, 3, 3, 5]),
+    ("desc", [5, 3, 3, 2, 1, None, None, None]),
+])
+def test_keyset_pages_cover_every_deal(app, order, expected):
+    quantities, ids, cursor, pages = [], [], None, 0
+    while True:
+        params = {"sortBy": "quantity", "sortOrder": order}
+        if cursor:
+            params["cursor"] = cursor
+        status, page = fetch(app, **params)
+        assert status == 200
+        pages += 1
+        quantities += [item.get("quantity") for item in page["items"]]
+        ids += [item["_id"] for item in page["items"]]
+        cursor = page["nextCursor"]
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert quantities == expected
+    assert len(set(ids)) == len(expected)
+
+
+def test_malformed_cursor_is_400(app):
+    status, body = fetch(app, cursor="garbage!!")
+    assert status == 400
+
+
+def test_cursor_replayed_with_other_direction_is_400(app):
+    _, page = fetch(app, sortBy="quantity", sortOrder="desc")
+    status, _ = fetch(app, sortBy="quantity", sortOrder="asc", cursor=page["nextCursor"])
+    assert status == 400
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from mongomock_motor import AsyncMongoMockClient
+
+from app.config import settings
+from app.deals.dao import DealsDAO
+from app.deals.rollup import DealStatsDailyDAO
+from app.deals.router import router
+from app.users.dependencies import get_current_user
+from asgi import request
+
+ADMIN = SimpleNamespace(id=str(ObjectId()), admin=True)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(DealsDAO, "collection", database["deals"])
+    monkeypatch.setattr(DealStatsDailyDAO, "collection", database["deal_stats_daily"])
+    monkeypatch.setattr(settings, "CACHE_ENABLED", False)
+    return database
+
+
+@pytest.fixture
+def app(database):
+    application = FastAPI()
+    application.include_router(router)
+    application.dependency_overrides[get_current_user] = lambda: ADMIN
+    return application
+
+
+@pytest.fixture
+def deal(database):
+    service_id = ObjectId()
+    asyncio.run(database["services"].insert_one({"_id": service_id, "name": "Доставка"}))
+    deal_id = asyncio.run(database["deals"].insert_one({
+        "serviceId": service_id,
+        "service": {"_id": service_id, "name": "Доставка"},
+        "notes": "",
+        "deletedAt": None,
+    })).inserted_id
+    return deal_id, service_id
+
+
+def patch(app, deal_id, body):
+    return asyncio.run(request(app, "PATCH", f"/deals/{deal_id}", json=body))
+
+
+def test_patch_to_missing_reference_is_rejected(app, database, deal):
+    deal_id, service_id = deal
+    response = patch(app, deal_id, {"serviceId": str(ObjectId()), "notes": "новая"})
+
+    assert response["status"] == 400
+    assert "serviceId" in orjson.loads(response["body"])["detail"]
+    stored = asyncio.run(database["deals"].find_one({"_id": deal_id}))
+    assert stored["serviceId"] == service_id and stored["notes"] == ""
+
+
+def test_patch_to_existing_reference_replaces_snapshot(app, database, deal):
+    deal_id, _ = deal
+    other_id = ObjectId()
+    asyncio.run(database["services"].insert_one({"_id": other_id, "name": "Погрузка"}))
+
+    response = patch(app, deal_id, {"serviceId": str(other_id)})
+
+    assert response["status"] == 200
+    stored = asyncio.run(database["deals"].find_one({"_id": deal_id}))
+    assert stored["service"] == {"_id": other_id, "name": "Погрузка"}
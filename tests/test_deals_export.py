@@ -0,0 +1,140 @@
+import asyncio
+import csv
+import io
+import multiprocessing
+import resource
+from datetime import datetime
+from types import SimpleNamespace
+
+import orjson
+from bson import ObjectId
+from fastapi import FastAPI
+
+from app.deals.dao import DealsDAO
+from app.deals.router import router
+from app.users.dependencies import get_current_user
+from asgi import get
+
+ADMIN = SimpleNamespace(id=str(ObjectId()), admin=True)
+
+
+class LazyCursor:
+    """
+    Курсор, который строит документы по одному, как Motor по мере getMore:
+    всё, что удерживает выгрузка сверх одного документа, копится в ней самой.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sort_spec = None
+
+    def sort(self, spec):
+        self.sort_spec = spec
+        return self
+
+    def __aiter__(self):
+        return self._documents()
+
+    async def _documents(self):
+        for number in range(self.total):
+            yield {
+                "_id": ObjectId(),
+                "userId": ObjectId(),
+                "quantity": number,
+                "totalAmount": number * 1.5,
+                "comment": "сделка " * 40,
+                "addExpenses": [{"name": "доставка", "amount": 100}] * 5,
+                "createdAt": datetime(2024, 1, 1),
+                "deletedAt": None,
+            }
+
+
+class LazyCollection:
+    name = "deals"
+
+    def __init__(self, total: int):
+        self.total = total
+        self.calls = []
+
+    def find(self, query, projection=None, batch_size=None):
+        cursor = LazyCursor(self.total)
+        self.calls.append((query, projection, batch_size, cursor))
+        return cursor
+
+
+def make_app(monkeypatch, total: int):
+    collection = LazyCollection(total)
+    monkeypatch.setattr(DealsDAO, "collection", collection)
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = lambda: ADMIN
+    return app, collection
+
+
+def _stream_export(total: int, results) -> None:
+    """Дочерний процесс: выгружает total сделок и сообщает объём ответа и пик RSS."""
+    import pytest
+
+    received = {"bytes": 0, "lines": 0}
+
+    def on_chunk(chunk):
+        received["bytes"] += len(chunk)
+        received["lines"] += chunk.count(b"\n")
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        app, _ = make_app(monkeypatch, total)
+        response = asyncio.run(get(app, "/deals/export", on_chunk=on_chunk))
+    assert response["status"] == 200
+    # ru_maxrss в Linux — килобайты
+    results.put((received["lines"], received["bytes"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+
+
+def _measure(context, total: int):
+    results = context.Queue()
+    process = context.Process(target=_stream_export, args=(total, results))
+    process.start()
+    measurement = results.get(timeout=120)
+    process.join(timeout=10)
+    assert process.exitcode == 0
+    return measurement
+
+
+def test_export_memory_does_not_grow_with_result_size():
+    context = multiprocessing.get_context("spawn")
+    small_lines, small_bytes, small_rss = _measure(context, 2_000)
+    large_lines, large_bytes, large_rss = _measure(context, 60_000)
+
+    assert (small_lines, large_lines) == (2_000, 60_000)
+    # Ответ вырос на десятки мегабайт, пик памяти процесса — почти нет
+    assert large_bytes - small_bytes > 40 * 2 ** 20
+    assert large_rss - small_rss < (large_bytes - small_bytes) / 4
+
+
+def test_export_ndjson_streams_every_document(monkeypatch):
+    app, collection = make_app(monkeypatch, 3)
+    response = asyncio.run(get(app, "/deals/export", {"sortBy": "quantity", "sortOrder": "desc"}))
+
+    assert response["status"] == 200
+    assert response["headers"]["content-type"] == "application/x-ndjson"
+    rows = [orjson.loads(line) for line in response["body"].splitlines()]
+    assert [row["quantity"] for row in rows] == [0, 1, 2]
+    assert all(isinstance(row["_id"], str) for row in rows)
+
+    query, _, batch_size, cursor = collection.calls[0]
+    assert query == {"deletedAt": None}
+    assert batch_size > 0
+    assert cursor.sort_spec[0] == ("quantity", -1)
+
+
+def test_export_csv_has_bom_header_and_one_row_per_document(monkeypatch):
+    app, _ = make_app(monkeypatch, 3)
+    response = asyncio.run(get(app, "/deals/export", {"format": "csv"}))
+
+    assert response["status"] == 200
+    text = response["body"].decode("utf-8")
+    assert text.startswith("﻿")
+    rows = list(csv.reader(io.StringIO(text[1:])))
+    header, body = rows[0], rows[1:]
+    assert header[0] == "_id"
+    assert len(body) == 3
+    assert body[2][header.index("quantity")] == "2"
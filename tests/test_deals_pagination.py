@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+
+from app.deals.dao import DealsDAO
+from app.deals.router import router
+from app.deals.shemas import MAX_PAGE_SIZE
+from app.users.dependencies import get_current_user
+from asgi import get
+
+ADMIN = SimpleNamespace(id=str(ObjectId()), admin=True)
+
+
+@pytest.fixture
+def paths(monkeypatch):
+    """Какой путь выбрал find_paginated1: $facet или count + find."""
+    calls = []
+
+    async def record(path, **kwargs):
+        calls.append((path, kwargs))
+        return {}
+
+    monkeypatch.setattr(DealsDAO, "_find_paginated_simple", lambda **kwargs: record("simple", **kwargs))
+    monkeypatch.setattr(DealsDAO, "_find_paginated_facet", lambda **kwargs: record("facet", **kwargs))
+    return calls
+
+
+@pytest.fixture
+def app():
+    application = FastAPI()
+    application.include_router(router)
+    application.dependency_overrides[get_current_user] = lambda: ADMIN
+    return application
+
+
+@pytest.mark.parametrize("count_mode, cursor, strategy, expected", [
+    ("exact", None, "batch", "facet"),
+    ("exact", "token", "batch", "simple"),
+    ("capped:1000", None, "batch", "simple"),
+    ("estimated", None, "batch", "simple"),
+    ("none", None, "batch", "simple"),
+    ("none", "token", "lookup", "facet"),
+])
+def test_facet_only_for_exact_first_page(paths, count_mode, cursor, strategy, expected):
+    asyncio.run(DealsDAO.find_paginated1(
+        include_relations=True, count_mode=count_mode, cursor=cursor, relation_strategy=strategy
+    ))
+    assert [path for path, _ in paths] == [expected]
+
+
+def test_admin_page_resolves_relations_without_facet(app, paths):
+    response = asyncio.run(get(app, "/deals/admin/get"))
+
+    assert response["status"] == 200
+    [(path, kwargs)] = paths
+    assert path == "simple"
+    assert set(kwargs["relations"]) == set(DealsDAO.relations)
+
+
+@pytest.mark.parametrize("url", ["/deals", "/deals/admin/get"])
+@pytest.mark.parametrize("params", [{"page_size": MAX_PAGE_SIZE + 1}, {"page_size": 0}, {"page": 0}])
+def test_page_bounds_are_validated(app, paths, url, params):
+    response = asyncio.run(get(app, url, params))
+
+    assert response["status"] == 422
+    assert paths == []
@@ -0,0 +1,11 @@
+import pytest
+
+from app.materials.shemas import SMaterialsAdd
+from app.services.shemas import SServicesAdd
+from app.stages.shemas import SStagesAdd
+
+
+@pytest.mark.parametrize("schema", [SMaterialsAdd, SServicesAdd, SStagesAdd])
+def test_name_is_stored_without_surrounding_spaces(schema):
+    assert schema(name="  Щебень 5-20 ").name == "Щебень 5-20"
+    assert schema().name is None
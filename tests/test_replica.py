@@ -0,0 +1,211 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.dao import replica
+from app.dao.base import MongoDAO
+from app.dao.replica import UNSUPPORTED, CollectionReplica, _matches
+
+MATERIALS = [
+    {"_id": 1, "name": "Бетон", "order": 3, "tags": ["a", "b"]},
+    {"_id": 2, "name": "Песок", "order": 1, "tags": ["b"]},
+    {"_id": 3, "name": "Щебень", "order": None, "tags": []},
+    {"_id": 4, "name": "Гравий", "tags": ["c"]},
+    {"_id": 5, "name": "Щебень", "order": 1, "tags": ["a"]},
+]
+
+
+def make_replica(documents=MATERIALS) -> CollectionReplica:
+    collection_replica = CollectionReplica(SimpleNamespace(name="materials"))
+    collection_replica._swap({doc["_id"]: dict(doc) for doc in documents})
+    collection_replica._synced = True
+    return collection_replica
+
+
+def ids(documents):
+    return [doc["_id"] for doc in documents]
+
+
+# --- _apply ---
+
+def test_apply_insert_update_replace_delete():
+    collection_replica = make_replica([])
+    collection_replica._apply({"operationType": "insert", "fullDocument": {"_id": 1, "name": "Бетон"}})
+    collection_replica._apply({"operationType": "insert", "fullDocument": {"_id": 2, "name": "Песок"}})
+    collection_replica._apply({"operationType": "update", "fullDocument": {"_id": 1, "name": "Бетон М300"}})
+    collection_replica._apply({"operationType": "replace", "fullDocument": {"_id": 2, "name": "Щебень"}})
+    assert collection_replica.find_one({"_id": 1}) == {"_id": 1, "name": "Бетон М300"}
+    # Индекс по имени перестраивается вместе с документами
+    assert collection_replica.find_one({"name": "Песок"}) is None
+    assert collection_replica.find_one({"name": "Щебень"}) == {"_id": 2, "name": "Щебень"}
+
+    collection_replica._apply({"operationType": "delete", "documentKey": {"_id": 1}})
+    assert collection_replica.find_one({"_id": 1}) is None
+    # Повторное удаление (переигрывание потока) не падает
+    collection_replica._apply({"operationType": "delete", "documentKey": {"_id": 1}})
+
+
+def test_apply_update_without_full_document_drops_it():
+    collection_replica = make_replica()
+    collection_replica._apply({"operationType": "update", "fullDocument": None, "documentKey": {"_id": 2}})
+    assert collection_replica.find_one({"_id": 2}) is None
+    assert collection_replica.find_one({"name": "Песок"}) is None
+
+
+@pytest.mark.parametrize("operation", ["drop", "rename", "dropDatabase", "invalidate"])
+def test_apply_collection_level_event_stops_serving(operation):
+    collection_replica = make_replica()
+    collection_replica._apply({"operationType": operation})
+    assert not collection_replica.ready
+    assert collection_replica.find_one({"_id": 1}) is UNSUPPORTED
+
+
+def test_snapshot_taken_before_apply_is_unchanged():
+    collection_replica = make_replica()
+    snapshot = collection_replica._by_id
+    collection_replica._apply({"operationType": "delete", "documentKey": {"_id": 1}})
+    assert 1 in snapshot
+    assert 1 not in collection_replica._by_id
+
+
+# --- _matches / _candidates ---
+
+@pytest.mark.parametrize("query, expected", [
+    ({}, True),
+    ({"name": "Бетон"}, True),
+    ({"name": "бетон"}, False),
+    ({"tags": "a"}, True),
+    ({"tags": ["a", "b"]}, True),
+    ({"tags": "c"}, False),
+    ({"_id": {"$in": [1, 7]}}, True),
+    ({"_id": {"$in": [7]}}, False),
+    ({"missing": None}, True),
+    ({"order": None}, False),
+])
+def test_matches_like_mongo_equality(query, expected):
+    assert _matches(MATERIALS[0], query) is expected
+
+
+def test_candidates_by_id_keep_order_and_skip_duplicates():
+    collection_replica = make_replica()
+    assert ids(collection_replica._candidates({"_id": {"$in": [5, 1, 5, 42]}})) == [5, 1]
+    assert ids(collection_replica._candidates({"_id": 2})) == [2]
+
+
+def test_candidates_by_name_are_filtered_exactly():
+    collection_replica = make_replica()
+    # Индекс по имени нормализован, поэтому кандидатов может быть больше, чем совпадений
+    assert ids(collection_replica._candidates({"name": " щебень "})) == [3, 5]
+    assert collection_replica.find_one({"name": " щебень "}) is None
+    assert ids(collection_replica.find_all({"name": "Щебень", "order": 1})) == [5]
+
+
+@pytest.mark.parametrize("query, projection", [
+    ({"order": {"$gt": 1}}, None),
+    ({"$or": [{"_id": 1}]}, None),
+    ({"tags.0": "a"}, None),
+    ({"_id": 1}, {"name": 0}),
+    ({"_id": 1}, {"tags.0": 1}),
+])
+def test_queries_replica_cannot_answer_go_to_mongo(query, projection):
+    collection_replica = make_replica()
+    assert collection_replica.find_one(query, projection) is UNSUPPORTED
+    assert collection_replica.find_all(query, projection) is UNSUPPORTED
+
+
+def test_projection_and_copies():
+    collection_replica = make_replica()
+    assert collection_replica.find_one({"_id": 1}, {"name": 1}) == {"_id": 1, "name": "Бетон"}
+    assert collection_replica.find_one({"_id": 1}, {"name": 1, "_id": 0}) == {"name": "Бетон"}
+    document = collection_replica.find_one({"_id": 1})
+    document["tags"].append("z")
+    assert collection_replica.find_one({"_id": 1})["tags"] == ["a", "b"]
+
+
+# --- find_all: сортировка как в Mongo ---
+
+def test_find_all_sort_puts_missing_and_null_first_ascending():
+    collection_replica = make_replica()
+    assert ids(collection_replica.find_all({}, sort=[("order", 1)])) == [3, 4, 2, 5, 1]
+
+
+def test_find_all_sort_puts_missing_and_null_last_descending():
+    collection_replica = make_replica()
+    assert ids(collection_replica.find_all({}, sort=[("order", -1)])) == [1, 2, 5, 3, 4]
+
+
+def test_find_all_multi_key_sort():
+    collection_replica = make_replica()
+    assert ids(collection_replica.find_all({}, sort=[("order", 1), ("_id", -1)])) == [4, 3, 5, 2, 1]
+    assert ids(collection_replica.find_all({}, sort=[("name", 1), ("_id", -1)])) == [1, 4, 2, 5, 3]
+
+
+def test_find_all_skip_and_limit():
+    collection_replica = make_replica()
+    assert ids(collection_replica.find_all({}, skip=1, limit=2, sort=[("_id", 1)])) == [2, 3]
+    assert ids(collection_replica.find_all({}, skip=3, limit=0, sort=[("_id", 1)])) == [4, 5]
+
+
+def test_find_all_mixed_types_go_to_mongo():
+    collection_replica = make_replica([*MATERIALS, {"_id": 6, "name": "Глина", "order": "2"}])
+    assert collection_replica.find_all({}, sort=[("order", 1)]) is UNSUPPORTED
+
+
+# --- hold / ready ---
+
+def test_hold_sends_reads_to_mongo_until_it_expires():
+    collection_replica = make_replica()
+    assert collection_replica.ready
+    collection_replica.hold(0.05)
+    assert not collection_replica.ready
+    assert collection_replica.find_one({"_id": 1}) is UNSUPPORTED
+    assert collection_replica.find_all({}) is UNSUPPORTED
+    # Более короткий hold не сокращает уже назначенный
+    collection_replica.hold(0)
+    assert not collection_replica.ready
+    asyncio.run(asyncio.sleep(0.06))
+    assert collection_replica.ready
+    assert collection_replica.find_one({"_id": 1})["name"] == "Бетон"
+
+
+def test_not_loaded_replica_is_not_ready():
+    collection_replica = CollectionReplica(SimpleNamespace(name="materials"))
+    assert not collection_replica.ready
+    assert collection_replica.find_one({"_id": 1}) is UNSUPPORTED
+
+
+@pytest.fixture
+def replicated_dao(monkeypatch):
+    collection = AsyncMongoMockClient()["test"]["materials"]
+
+    class MaterialsDAO(MongoDAO):
+        replicated = True
+
+    MaterialsDAO.collection = collection
+    collection_replica = CollectionReplica(collection)
+    monkeypatch.setitem(replica.replicas, collection.name, collection_replica)
+    return MaterialsDAO, collection_replica
+
+
+def test_dao_reads_own_write_from_mongo_while_replica_holds(replicated_dao):
+    dao, collection_replica = replicated_dao
+
+    async def scenario():
+        object_id = ObjectId()
+        await dao.collection.insert_one({"_id": object_id, "name": "Бетон"})
+        collection_replica._swap({object_id: {"_id": object_id, "name": "Бетон"}})
+        collection_replica._synced = True
+
+        # Изменение ещё не дошло до реплики через change stream
+        await dao.collection.update_one({"_id": object_id}, {"$set": {"name": "Бетон М300"}})
+        assert (await dao.find_one_or_none({"_id": object_id}))["name"] == "Бетон"
+
+        # Запись через DAO включает hold — чтения идут в Mongo
+        await dao.invalidate_cache()
+        assert (await dao.find_one_or_none({"_id": object_id}))["name"] == "Бетон М300"
+        assert [doc["name"] for doc in await dao.find_all({})] == ["Бетон М300"]
+
+    asyncio.run(scenario())
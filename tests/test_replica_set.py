@@ -0,0 +1,221 @@
+"""
+CollectionReplica.run() против настоящего change stream.
+
+Нужен single-node replica set: REPLSET_MONGO_URL или mongod в PATH — тогда
+временный `mongod --replSet` поднимается на время модуля. Иначе такие тесты пропускаются.
+"""
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.dao.replica import UNSUPPORTED, CollectionReplica
+
+RECONNECT_DELAY = 0.3
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait(check, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if check():
+                return
+        except PyMongoError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("mongod не поднялся")
+        time.sleep(0.2)
+
+
+@pytest.fixture(scope="module")
+def replset_url(tmp_path_factory):
+    url = os.getenv("REPLSET_MONGO_URL")
+    if url:
+        yield url
+        return
+    mongod = shutil.which("mongod")
+    if not mongod:
+        pytest.skip("нужен replica set: REPLSET_MONGO_URL или mongod в PATH")
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [mongod, "--replSet", "rs0", "--port", str(port), "--bind_ip", "127.0.0.1",
+         "--dbpath", str(tmp_path_factory.mktemp("mongod"))],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"mongodb://127.0.0.1:{port}/?directConnection=true"
+    try:
+        with MongoClient(url, serverSelectionTimeoutMS=1000) as client:
+            _wait(lambda: client.admin.command("ping"))
+            client.admin.command("replSetInitiate", {
+                "_id": "rs0", "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}],
+            })
+            _wait(lambda: client.admin.command("hello").get("isWritablePrimary"))
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+class WatchedCollection:
+    """
+    Коллекция для реплики: считает загрузки (find), запоминает аргументы watch
+    и открытые потоки, а по очереди failures отвечает на открытие потока ошибкой.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.loads = 0
+        self.watch_calls = []
+        self.streams = []
+        self.failures = []
+
+    def find(self, *args, **kwargs):
+        self.loads += 1
+        return self.collection.find(*args, **kwargs)
+
+    def watch(self, **kwargs):
+        self.watch_calls.append(kwargs)
+        if self.failures:
+            return FailingStream(self.failures.pop(0))
+        stream = self.collection.watch(**kwargs)
+        self.streams.append(stream)
+        return stream
+
+
+class FailingStream:
+    def __init__(self, error):
+        self.error = error
+
+    async def __aenter__(self):
+        raise self.error
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def eventually(check, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "реплика не дошла до ожидаемого состояния"
+        await asyncio.sleep(0.05)
+
+
+def has(collection_replica, object_id) -> bool:
+    return collection_replica.find_one({"_id": object_id}) not in (None, UNSUPPORTED)
+
+
+def scenario(replset_url, body):
+    """Запускает body(collection, watched, collection_replica) при работающем run()."""
+    async def main():
+        client = AsyncIOMotorClient(replset_url)
+        collection = client["replica_test"][f"materials_{uuid.uuid4().hex}"]
+        await collection.insert_many([{"_id": 1, "name": "Бетон"}, {"_id": 2, "name": "Песок"}])
+        watched = WatchedCollection(collection)
+        collection_replica = CollectionReplica(watched)
+        task = asyncio.create_task(collection_replica.run(reconnect_delay=RECONNECT_DELAY))
+        try:
+            await body(collection, watched, collection_replica)
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            await collection.drop()
+            client.close()
+
+    asyncio.run(main())
+
+
+def test_write_during_initial_load_is_not_lost(replset_url, monkeypatch):
+    load = CollectionReplica._load
+
+    async def load_then_write(self):
+        await load(self)
+        # Снимок уже прочитан; запись дойдёт только через поток, открытый до загрузки
+        await self.collection.collection.insert_one({"_id": 3, "name": "Щебень"})
+
+    monkeypatch.setattr(CollectionReplica, "_load", load_then_write)
+
+    async def body(collection, watched, collection_replica):
+        await eventually(lambda: has(collection_replica, 3))
+        assert collection_replica.find_one({"name": "щебень"}) == {"_id": 3, "name": "Щебень"}
+        assert watched.loads == 1
+
+    scenario(replset_url, body)
+
+
+def test_changes_are_applied(replset_url):
+    async def body(collection, watched, collection_replica):
+        await eventually(lambda: collection_replica.ready)
+        await collection.insert_one({"_id": 3, "name": "Щебень"})
+        await collection.update_one({"_id": 1}, {"$set": {"name": "Бетон М300"}})
+        await collection.delete_one({"_id": 2})
+        await eventually(lambda: collection_replica.ready and not has(collection_replica, 2))
+
+        assert collection_replica.find_all({}, sort=[("_id", 1)]) == [
+            {"_id": 1, "name": "Бетон М300"},
+            {"_id": 3, "name": "Щебень"},
+        ]
+
+    scenario(replset_url, body)
+
+
+def test_reconnect_resumes_from_token_without_reload(replset_url):
+    async def body(collection, watched, collection_replica):
+        await eventually(lambda: collection_replica.ready and collection_replica._resume_token is not None)
+        await watched.streams[-1].close()
+        # Пропущенное за время обрыва приходит из потока, возобновлённого по токену
+        await collection.insert_one({"_id": 3, "name": "Щебень"})
+        await eventually(lambda: has(collection_replica, 3))
+
+        assert len(watched.watch_calls) >= 2
+        assert watched.watch_calls[-1]["resume_after"] is not None
+        assert watched.loads == 1
+
+    scenario(replset_url, body)
+
+
+@pytest.mark.parametrize("code", [260, 280, 286])
+def test_lost_resume_point_resyncs(replset_url, code):
+    async def body(collection, watched, collection_replica):
+        await eventually(lambda: collection_replica.ready and collection_replica._resume_token is not None)
+        watched.failures.append(OperationFailure("resume point lost", code=code))
+        await watched.streams[-1].close()
+        await collection.delete_one({"_id": 2})
+        await eventually(lambda: watched.loads == 2 and collection_replica.ready and not has(collection_replica, 2))
+
+        # После ошибки поток открыт заново без токена и коллекция перечитана
+        assert watched.watch_calls[-1]["resume_after"] is None
+        assert collection_replica.find_all({}, sort=[("_id", 1)]) == [{"_id": 1, "name": "Бетон"}]
+
+    scenario(replset_url, body)
+
+
+def test_change_streams_unavailable_disables_replica():
+    # Standalone mongod отвечает 40573 при открытии потока; до сервера дело не доходит
+    watched = WatchedCollection(SimpleNamespace(name="materials"))
+    watched.failures.append(OperationFailure("$changeStream is only supported on replica sets", code=40573))
+    collection_replica = CollectionReplica(watched)
+
+    # run() завершается сам, а не переподключается бесконечно
+    asyncio.run(asyncio.wait_for(collection_replica.run(reconnect_delay=RECONNECT_DELAY), timeout=5))
+    assert not collection_replica.ready
+    assert watched.loads == 0